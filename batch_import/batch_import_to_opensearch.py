@@ -1,29 +1,50 @@
 import json
-import requests
 import sys
+import hashlib
+import argparse
 import os
-import base64
 import signal
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from botocore.config import Config as BotocoreConfig
 from datetime import datetime
 
 from config import Config
-from embedding_generator import EmbeddingGenerator
+from embedding_generator import EmbeddingGenerator, ImageEmbeddingCache
 from opensearch_client import OpenSearchClient
+from import_pipeline import StagedPipeline, CommitTracker
+from record_readers import open_reader
+from image_fetcher import ImageFetcher
+from rate_limiter import AdaptiveRateLimiter
+from embedding_store import EmbeddingPartWriter
 
 class BatchImporter:
-    def __init__(self):
+    # Fields not covered by the fingerprint; a changed value is written as a partial update without new embeddings
+    METADATA_FIELDS = {'price': 0, 'average_rating': 0, 'rating_number': 0, 'store': ''}
+
+    def __init__(self, shard_id=None, shards=None, incremental=True, embed_only_dir=None):
+        # (shard_id, shards) when importing one byte range of the input, see shard_range
+        self.shard = (shard_id, shards) if shards else None
+        # Embed-only: write documents and embeddings to files under this directory instead of OpenSearch
+        self.embed_only_dir = embed_only_dir
+        # Fingerprints are read from the index, so they can't be checked without one
+        self.incremental = incremental and not embed_only_dir
         self.keep_running = True
         signal.signal(signal.SIGINT, self.handle_interrupt)
         signal.signal(signal.SIGTERM, self.handle_interrupt)
         
         try:
-            Config.validate_config()
+            Config.validate_config(require_opensearch=not embed_only_dir)
             aws_session = Config.get_aws_session()
             
             try:
-                bedrock_client = aws_session.client('bedrock-runtime')
+                # Throttling is handled by the adaptive limiter, not hidden by botocore retries
+                bedrock_client = aws_session.client('bedrock-runtime', config=BotocoreConfig(
+                    retries={'max_attempts': 1, 'mode': 'standard'},
+                    max_pool_connections=max(10, Config.EMBED_WORKERS * (Config.IMAGE_CONCURRENCY_PER_PRODUCT + 1))
+                ))
                 test_text = "test"
                 test_body = json.dumps({"inputText": test_text})
                 bedrock_client.invoke_model(
@@ -36,251 +57,398 @@ class BatchImporter:
                 print(f"Error testing Bedrock connection: {str(e)}")
                 sys.exit(1)
             
-            self.embedding_generator = EmbeddingGenerator(bedrock_client)
-            self.opensearch_client = OpenSearchClient(aws_session)
-            self.opensearch_client.ensure_index_exists()
+            # One token bucket for every embed worker, tuned by throttling responses and latency
+            self.rate_limiter = AdaptiveRateLimiter(
+                initial_rate=Config.BEDROCK_INITIAL_RPS,
+                min_rate=Config.BEDROCK_MIN_RPS,
+                max_rate=Config.BEDROCK_MAX_RPS,
+                max_retries=Config.BEDROCK_MAX_RETRIES
+            )
+            self.embedding_generator = EmbeddingGenerator(bedrock_client, self.rate_limiter)
+            # Image vectors by URL, so images shared across products are embedded once
+            self.image_vectors = ImageEmbeddingCache(Config.IMAGE_VECTOR_CACHE_SIZE)
+            if embed_only_dir:
+                self.opensearch_client = None
+            else:
+                self.opensearch_client = OpenSearchClient(aws_session)
+                self.opensearch_client.ensure_index_exists()
             
-            # File paths for tracking progress and errors
-            self.progress_file = "import_progress.txt"
-            self.error_log_file = f"import_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            # File paths for tracking progress and errors, one set per shard
+            suffix = f".shard-{shard_id}-of-{shards}" if self.shard else ""
+            self.suffix = suffix
+            # Embed-only progress lives next to the files it describes
+            self.progress_file = os.path.join(embed_only_dir, f"embed_progress{suffix}.txt") if embed_only_dir else f"import_progress{suffix}.txt"
+            self.error_log_file = f"import_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}.txt"
+            self.summary_file = f"import_summary{suffix}.json" if self.shard else None
             self.retry_delay = 5  # seconds between retries
             self.max_retries = 3  # maximum number of retries for failures
+            self.error_log_lock = threading.Lock()
+            # Keep-alive connection pool shared by the download workers
+            self.image_fetcher = ImageFetcher(
+                pool_size=max(Config.HTTP_POOL_SIZE, Config.DOWNLOAD_WORKERS),
+                per_host_limit=Config.PER_HOST_CONNECTIONS,
+                cache_dir=Config.IMAGE_CACHE_DIR or None,
+                max_edge=Config.IMAGE_MAX_EDGE,
+                quality=Config.IMAGE_QUALITY,
+                max_retries=self.max_retries,
+                retry_delay=self.retry_delay
+            )
+            # The images of one product are downloaded and embedded concurrently, IMAGE_CONCURRENCY_PER_PRODUCT at a time
+            self.download_pool = ThreadPoolExecutor(Config.DOWNLOAD_WORKERS * Config.IMAGE_CONCURRENCY_PER_PRODUCT, "image-download")
+            self.embed_pool = ThreadPoolExecutor(Config.EMBED_WORKERS * Config.IMAGE_CONCURRENCY_PER_PRODUCT, "image-embed")
         except Exception as e:
             print(f"Error initializing BatchImporter: {str(e)}")
             sys.exit(1)
     
     def handle_interrupt(self, signum, frame):
         """Handle interrupt signals gracefully"""
-        print("\nReceived interrupt signal. Completing current record before shutting down...")
+        print("\nReceived interrupt signal. Completing records in flight before shutting down...")
         self.keep_running = False
         
-    def download_image(self, url, max_retries=3):
-        """Download image with retry mechanism"""
-        for attempt in range(max_retries):
-            try:
-                response = requests.get(url, timeout=30)
-                if response.status_code == 200:
-                    image_data = base64.b64encode(response.content).decode('utf-8')
-                    return image_data
-                if response.status_code == 404:  # Don't retry if image not found
-                    return None
-            except requests.RequestException:
-                if attempt < max_retries - 1:
-                    time.sleep(self.retry_delay)
-                continue
-        return None
+    def download_image(self, url):
+        """Download (or read from the cache) and downscale an image; base64 string or None"""
+        return self.image_fetcher.fetch(url)
 
     def get_last_processed_line(self):
-        """Get the last successfully processed line number"""
+        """Get the last successfully processed line number and the byte offset just past it"""
         try:
             if os.path.exists(self.progress_file):
                 with open(self.progress_file, 'r') as f:
                     content = f.read().strip()
-                    print(f"Debug: Progress file content = '{content}'")  # Debug print
-                    if content:  # Only try to convert if content is not empty
-                        return int(content)
-            return 0
+                    if content.startswith('{'):
+                        progress = json.loads(content)
+                        return progress['line'], progress['offset']
+                    if content:  # Progress files of older versions only hold the line number
+                        return int(content), None
+            return 0, 0
         except Exception as e:
             print(f"Warning: Error reading progress file: {str(e)}")
-            return 0
+            return 0, 0
 
-    def save_progress(self, line_number):
-        """Save the current progress"""
+    def save_progress(self, line_number, offset):
+        """Save the current progress atomically: write a temp file, fsync, then rename over the old one"""
         try:
-            with open(self.progress_file, 'w') as f:
-                f.write(str(line_number))
+            tmp_file = f"{self.progress_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(json.dumps({'line': line_number, 'offset': offset}))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.progress_file)
         except Exception as e:
             print(f"Warning: Error saving progress: {str(e)}")
-            
+
     def log_error(self, line_number, error_msg):
         """Log errors with timestamp"""
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.error_log_file, 'a') as f:
-            f.write(f"[{timestamp}] Line {line_number}: {error_msg}\n")
+        with self.error_log_lock:
+            with open(self.error_log_file, 'a') as f:
+                f.write(f"[{timestamp}] Line {line_number}: {error_msg}\n")
 
-    def process_record(self, record, line_number):
-        """Process a single record with retry mechanism"""
-        for attempt in range(self.max_retries):
-            try:
-                description_text = " ".join(filter(None, [
-                    record.get('title', ''),
-                    " ".join(record.get('features', [])),
-                    " ".join(record.get('description', [])),
-                    record.get('main_category', ''),
-                    " ".join(record.get('categories', []))
-                ]))
-                
-                if not description_text.strip():
-                    self.log_error(line_number, "Empty description text")
-                    return False
-                
-                try:
-                    description_embedding = self.embedding_generator.generate_embedding(description_text, 'text')
-                    if not description_embedding or not isinstance(description_embedding, list):
-                        raise Exception("Invalid description embedding format")
-                except Exception as e:
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                        continue
-                    self.log_error(line_number, f"Error generating description embedding: {str(e)}")
-                    return False
+    def prepare_record(self, item):
+        """Parse stage: build the description text and pick the image URLs"""
+        record = item['record']
+        item['description_text'] = " ".join(filter(None, [
+            record.get('title', ''),
+            " ".join(record.get('features', [])),
+            " ".join(record.get('description', [])),
+            record.get('main_category', ''),
+            " ".join(record.get('categories', []))
+        ]))
+        if not item['description_text'].strip():
+            item['error'] = "Empty description text"
+            return
+        # Every distinct hi-res image, in listing order, up to MAX_IMAGES_PER_PRODUCT; the first one is the main image
+        item['image_urls'] = []
+        for image in record.get('images') or []:
+            url = image.get('hi_res') if isinstance(image, dict) else None
+            if url and url not in item['image_urls']:
+                item['image_urls'].append(url)
+        del item['image_urls'][Config.MAX_IMAGES_PER_PRODUCT:]
 
-                image_embedding = None
-                image_url = None
-                if record.get('images') and len(record['images']) > 0:
-                    first_image = record['images'][0]
-                    if 'hi_res' in first_image:
-                        image_url = first_image['hi_res']
-                        image_data = self.download_image(image_url)
-                        if image_data:
-                            try:
-                                image_embedding = self.embedding_generator.generate_embedding(image_data, 'image')
-                                if not image_embedding or not isinstance(image_embedding, list):
-                                    raise Exception("Invalid image embedding format")
-                            except Exception as e:
-                                # Don't retry for image embedding failures
-                                self.log_error(line_number, f"Error generating image embedding: {str(e)}")
-                                image_embedding = None
+    @staticmethod
+    def fingerprint(description_text, image_urls):
+        """Hash of everything the embeddings are computed from"""
+        return hashlib.sha256("\n".join([description_text] + list(image_urls or [''])).encode('utf-8')).hexdigest()
 
-                document = {
-                    'id': record.get('parent_asin', ''),
-                    'title': record.get('title', ''),
-                    'main_category': record.get('main_category', ''),
-                    'categories': record.get('categories', []),
-                    'features': record.get('features', []),
-                    'description': description_text,
-                    'price': record.get('price', 0),
-                    'average_rating': record.get('average_rating', 0),
-                    'rating_number': record.get('rating_number', 0),
-                    'store': record.get('store', ''),
-                    'description_embedding': description_embedding
-                }
-                
-                if image_url and image_embedding:
-                    document['image_url'] = image_url
-                    document['image_embedding'] = image_embedding
+    @staticmethod
+    def map_images(pool, fn, urls):
+        """fn(url) for the images of one product, at most IMAGE_CONCURRENCY_PER_PRODUCT at a time; results in order"""
+        results = []
+        for i in range(0, len(urls), Config.IMAGE_CONCURRENCY_PER_PRODUCT):
+            results += pool.map(fn, urls[i:i + Config.IMAGE_CONCURRENCY_PER_PRODUCT])
+        return results
 
-                self.opensearch_client.index_document(document)
-                return True
-                
+    def check_fingerprints(self, items):
+        """
+        Batched check stage: look up the stored fingerprints of these records in one mget.
+        Unchanged records skip the remaining stages; records whose metadata alone changed
+        get a partial update; new or changed records go on to be embedded.
+        """
+        ids = {item['record'].get('parent_asin') for item in items} - {None, ''}
+        try:
+            existing = self.opensearch_client.get_documents(ids, ['fingerprint', 'images.url'] + list(self.METADATA_FIELDS))
+        except Exception as e:
+            # Without stored fingerprints every record is embedded, as in a full import
+            print(f"Warning: Error reading fingerprints: {str(e)}")
+            return
+        for item in items:
+            stored = existing.get(item['record'].get('parent_asin'))
+            if not stored or stored.get('fingerprint') != self.fingerprint(item['description_text'], item['image_urls']):
+                continue
+            if item['image_urls'] and not stored.get('images'):
+                # Indexed before documents had per-image vectors
+                continue
+            changed = {
+                field: item['record'].get(field, default) for field, default in self.METADATA_FIELDS.items()
+                if stored.get(field) != item['record'].get(field, default)
+            }
+            if changed:
+                changed['id'] = item['record']['parent_asin']
+                item['update'] = changed
+            else:
+                item['unchanged'] = True
+            item['done'] = True
+
+    def download_record_image(self, item):
+        """Download stage: every image of the product whose vector isn't cached yet"""
+        urls = [url for url in item['image_urls'] if url not in self.image_vectors]
+        item['image_data'] = dict(zip(urls, self.map_images(self.download_pool, self.download_image, urls)))
+
+    def embed_image(self, item, url):
+        """Vector of one image, shared with every other product listing the same URL; None if it failed"""
+        def compute():
+            # Downloaded by the previous stage, unless the URL was cached then and has since been evicted
+            image_data = item['image_data'].get(url) or self.download_image(url)
+            if not image_data:
+                return None
+            try:
+                image_embedding = self.embedding_generator.generate_embedding(image_data, 'image')
+                if not image_embedding or not isinstance(image_embedding, list):
+                    raise Exception("Invalid image embedding format")
+                return image_embedding
             except Exception as e:
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                    continue
-                self.log_error(line_number, f"Error processing record: {str(e)}")
-                return False
+                # Don't retry for image embedding failures
+                self.log_error(item['line_number'], f"Error generating image embedding: {str(e)}")
+                return None
+        return self.image_vectors.get_or_compute(url, compute)
+
+    def embed_record(self, item):
+        """Embedding stage: text embedding, then the image embeddings, then the document"""
+        record = item['record']
+        # Throttling and transient Bedrock errors are retried by the shared rate limiter
+        try:
+            description_embedding = self.embedding_generator.generate_embedding(item['description_text'], 'text')
+            if not description_embedding or not isinstance(description_embedding, list):
+                raise Exception("Invalid description embedding format")
+        except Exception as e:
+            raise Exception(f"Error generating description embedding: {str(e)}")
+
+        vectors = self.map_images(self.embed_pool, lambda url: self.embed_image(item, url), item['image_urls'])
+        images = [{'url': url, 'embedding': vector} for url, vector in zip(item['image_urls'], vectors) if vector]
+        # The images are not needed past this stage
+        item['image_data'] = None
+
+        document = {
+            'id': record.get('parent_asin', ''),
+            'title': record.get('title', ''),
+            'main_category': record.get('main_category', ''),
+            'categories': record.get('categories', []),
+            'features': record.get('features', []),
+            'description': item['description_text'],
+            'price': record.get('price', 0),
+            'average_rating': record.get('average_rating', 0),
+            'rating_number': record.get('rating_number', 0),
+            'store': record.get('store', ''),
+            'description_embedding': description_embedding
+        }
         
-        return False
+        if images:
+            # The main image stays in image_url/image_embedding; every image is in the nested images field
+            document['image_url'] = images[0]['url']
+            document['image_embedding'] = images[0]['embedding']
+            document['images'] = images
+        # Computed from what was embedded: a record whose images failed is embedded again next time
+        document['fingerprint'] = self.fingerprint(item['description_text'], [image['url'] for image in images])
+        item['document'] = document
 
-    def process_file(self, file_path, limit=0):
+    def process_file(self, file_path, limit=0, bulk_load_settings=False):
         """Process the input file with progress tracking and error handling"""
-        last_processed = self.get_last_processed_line()
-        current_line = 0
-        success_count = 0
-        error_count = 0
+        if bulk_load_settings and not self.embed_only_dir:
+            # Refresh off and no replicas while importing, restored (and optionally force-merged) afterwards
+            with self.opensearch_client.bulk_load(Config.FORCE_MERGE):
+                self._process_file(file_path, limit)
+        else:
+            self._process_file(file_path, limit)
+
+    def _commit(self, key):
+        """Mark a line as done (indexed or failed) and save the checkpoint every CHECKPOINT_EVERY_RECORDS lines"""
+        line_number, end_offset = key
+        previous_offset = self.tracker.offset
+        self.tracker.commit(line_number, end_offset)
+        self.pbar.update(self.tracker.offset - previous_offset)
+        self.uncheckpointed += 1
+        if self.uncheckpointed % 100 == 0:
+            self.pbar.set_postfix(self.rate_limiter.stats(), refresh=False)
+        if self.uncheckpointed >= Config.CHECKPOINT_EVERY_RECORDS:
+            self.save_progress(self.tracker.watermark, self.tracker.offset)
+            self.uncheckpointed = 0
+
+    def on_indexed(self, key, error):
+        """BulkWriter callback, once per document; key is (line_number, end_offset)"""
+        if error is not None:
+            self.log_error(key[0], error)
+        with self.commit_lock:
+            if error is None:
+                self.success_count += 1
+            else:
+                self.error_count += 1
+            self._commit(key)
+
+    def index_item(self, item):
+        """Sink of the pipeline: hand documents to the bulk writer, commit failed and unchanged records directly"""
+        key = (item['line_number'], item['end_offset'])
+        if item.get('error') is not None:
+            self.on_indexed(key, item['error'])
+        elif item.get('unchanged'):
+            with self.commit_lock:
+                self.unchanged_count += 1
+                self._commit(key)
+        elif item.get('update'):
+            with self.commit_lock:
+                self.updated_count += 1
+            self.writer.add(key, item['update'], op='update')
+        else:
+            self.writer.add(key, item['document'])
+
+    def _process_file(self, file_path, limit=0):
+        last_processed, offset = self.get_last_processed_line()
+        processed_count = 0
         start_time = time.time()
-        last_save_time = start_time
+        self.success_count = 0
+        self.error_count = 0
+        self.unchanged_count = 0
+        self.updated_count = 0
+        self.uncheckpointed = 0
 
-        print(f"Resuming from line {last_processed}")
-        if limit > 0:
-            print(f"Processing {limit} records")
-        
         try:
-            with open(file_path, 'r') as f:
-                total_lines = sum(1 for _ in f)
+            # Positions are byte offsets of plain JSONL (a resume seeks straight to them), decompressed
+            # byte offsets of gzip/zstd JSONL, or row numbers of Parquet
+            with open_reader(file_path) as reader:
+                start, end = reader.shard_range(self.shard[1], self.shard[0]) if self.shard else (0, reader.total)
+                if offset is None:
+                    offset = reader.offset_of_line(last_processed, start)
+                offset = max(offset, start)
+                if self.shard:
+                    print(f"Shard {self.shard[0]} of {self.shard[1]}: {reader.unit} {start}-{end}")
+                print(f"Resuming from line {last_processed} (position {offset})")
                 if limit > 0:
-                    total_lines = min(total_lines, limit)
-                f.seek(0)
+                    print(f"Processing {limit} records")
+                current_line = last_processed
+                # Records finish out of order; progress is the last line before which everything is indexed or logged
+                self.tracker = CommitTracker(last_processed, offset)
+                # Commits come from the sink and from the bulk writer's age-based flushes
+                self.commit_lock = threading.Lock()
+                if self.embed_only_dir:
+                    # Documents and float32 embeddings go to a Parquet/npy part every EMBED_PART_RECORDS records
+                    os.makedirs(self.embed_only_dir, exist_ok=True)
+                    self.writer = EmbeddingPartWriter(self.embed_only_dir, self.on_indexed, Config.EMBED_PART_RECORDS, self.suffix)
+                else:
+                    # Documents are bulk indexed when BULK_MAX_DOCS * BULK_WORKERS are buffered or after BULK_FLUSH_SECONDS
+                    self.writer = self.opensearch_client.bulk_writer(self.on_indexed)
                 
-                with tqdm(total=total_lines, initial=last_processed) as pbar:
-                    for line in f:
-                        if not self.keep_running:
-                            print("\nGracefully shutting down...")
-                            break
-                            
-                        current_line += 1
-                        
-                        if current_line <= last_processed:
-                            continue
-                        
-                        try:
-                            record = json.loads(line.strip())
-                            if self.process_record(record, current_line):
-                                success_count += 1
-                            else:
-                                error_count += 1
-                        except json.JSONDecodeError as e:
-                            self.log_error(current_line, f"Error parsing JSON: {str(e)}")
-                            error_count += 1
-                        except Exception as e:
-                            self.log_error(current_line, f"Unexpected error: {str(e)}")
-                            error_count += 1
-                        
-                        # Save progress every 5 minutes
-                        current_time = time.time()
-                        if current_time - last_save_time >= 300:
-                            self.save_progress(current_line)
-                            last_save_time = current_time
-                            
-                        pbar.update(1)
+                # Progress is measured in committed bytes (or rows), no need to count lines first
+                with tqdm(total=None if end is None else end - start, initial=offset - start,
+                          unit=reader.unit, unit_scale=True, unit_divisor=1024 if reader.unit == 'B' else 1000) as pbar:
+                    self.pbar = pbar
+                    # parse -> (check) -> download -> embed -> index, each stage with its own workers and a bounded queue
+                    stages = [("prepare", self.prepare_record, 1)]
+                    if self.incremental:
+                        stages.append(("check", self.check_fingerprints, 2, Config.FINGERPRINT_BATCH_SIZE))
+                    stages += [
+                        ("download", self.download_record_image, Config.DOWNLOAD_WORKERS),
+                        ("embed", self.embed_record, Config.EMBED_WORKERS)
+                    ]
+                    pipeline = StagedPipeline(stages, self.index_item, Config.PIPELINE_QUEUE_SIZE)
+                    pipeline.start()
+                    try:
+                        # Records come parsed (orjson when installed) and projected to the fields process_record uses;
+                        # the reader stops at the end of the shard
+                        for offset, record, error in reader.records(offset, end):
+                            if not self.keep_running:
+                                print("\nGracefully shutting down, draining records in flight...")
+                                break
+                                
+                            current_line += 1
+                            processed_count += 1
+                            pipeline.submit({'line_number': current_line, 'end_offset': offset, 'record': record, 'error': error})
 
-                        if limit > 0 and (success_count + error_count) >= limit:
-                            break
+                            if limit > 0 and processed_count >= limit:
+                                break
+                    finally:
+                        pipeline.close()
                         
                     # Save final progress
-                    self.save_progress(current_line)
+                    self.writer.close()
+                    self.save_progress(self.tracker.watermark, self.tracker.offset)
                     
             duration = time.time() - start_time
             print(f"\nProcessing completed in {duration:.2f} seconds:")
-            print(f"Total processed: {current_line}")
-            print(f"Successful: {success_count}")
-            print(f"Failed: {error_count}")
+            print(f"Total processed: {self.tracker.watermark}")
+            print(f"Successful: {self.success_count}")
+            print(f"Failed: {self.error_count}")
+            if self.incremental:
+                print(f"Unchanged (skipped): {self.unchanged_count}")
+                print(f"Metadata updated (no new embeddings): {self.updated_count}")
+            print(f"Bedrock: {self.rate_limiter.stats()}")
+            print(f"Image vectors reused: {self.image_vectors.hits}, embedded: {self.image_vectors.misses}")
+            if self.embed_only_dir:
+                print(f"Embeddings written to {self.embed_only_dir}; load them with load_embeddings.py")
+            if self.summary_file:
+                # Read by launch_import.py for the aggregated report
+                with open(self.summary_file, 'w') as f:
+                    json.dump({
+                        'shard_id': self.shard[0], 'shards': self.shard[1],
+                        'start': start, 'end': end, 'line': self.tracker.watermark, 'offset': self.tracker.offset,
+                        'complete': end is not None and self.tracker.offset >= end, 'successful': self.success_count,
+                        'failed': self.error_count, 'unchanged': self.unchanged_count,
+                        'updated': self.updated_count, 'duration': duration, 'error_log': self.error_log_file
+                    }, f)
             print(f"Error log: {self.error_log_file}")
         except Exception as e:
             print(f"Fatal error processing file: {str(e)}")
             sys.exit(1)
 
 def main():
-    # Print all arguments for debugging
-    print("Debug: sys.argv =", sys.argv)
-    
-    if len(sys.argv) < 2:
-        print("Usage: python batch_import_to_opensearch.py <json_file_path> [limit]")
-        print("  limit: 0 for importing all records (default), or a positive number for limited import")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Import product records (JSON lines) into OpenSearch")
+    parser.add_argument("file_path", help="JSONL (optionally .gz/.zst) or Parquet file to import")
+    parser.add_argument("limit", nargs="?", type=int, default=0,
+                        help="0 for importing all records (default), or a positive number for limited import")
+    parser.add_argument("--shards", type=int, default=None, help="split the input into this many byte ranges")
+    parser.add_argument("--shard-id", type=int, default=None, help="the byte range (0..shards-1) this process imports")
+    parser.add_argument("--full", action="store_true",
+                        help="embed every record again, even if its stored fingerprint matches")
+    parser.add_argument("--embed-only", metavar="DIR", default=None,
+                        help="write documents and embeddings to Parquet/npy files in DIR instead of OpenSearch")
+    parser.add_argument("--no-bulk-load-settings", action="store_true",
+                        help="leave the index settings alone even with BULK_LOAD_SETTINGS=true (launch_import.py applies them once)")
+    args = parser.parse_args()
 
-    file_path = sys.argv[1]
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
+    if not os.path.exists(args.file_path):
+        print(f"File not found: {args.file_path}")
+        sys.exit(1)
+    if args.limit < 0:
+        print("Error: Limit must be 0 or a positive number")
+        sys.exit(1)
+    if (args.shards is None) != (args.shard_id is None):
+        print("Error: --shards and --shard-id must be given together")
+        sys.exit(1)
+    if args.shards is not None and not (args.shards > 0 and 0 <= args.shard_id < args.shards):
+        print("Error: --shard-id must be between 0 and --shards - 1")
         sys.exit(1)
-
-    # Initialize limit with default value
-    limit = 0
-
-    # Only try to parse limit if we have more than 2 arguments
-    if len(sys.argv) > 2:
-        try:
-            # Get the raw limit argument
-            limit_str = sys.argv[2]
-            print(f"Debug: Raw limit argument = '{limit_str}'")
-            
-            # If the argument is not empty and contains digits
-            if limit_str and limit_str.strip().isdigit():
-                limit = int(limit_str)
-                if limit < 0:
-                    print("Error: Limit must be 0 or a positive number")
-                    sys.exit(1)
-            else:
-                print(f"Error: Invalid limit argument '{limit_str}'. Must be a positive number.")
-                sys.exit(1)
-                
-        except ValueError as e:
-            print(f"Error parsing limit: {str(e)}")
-            sys.exit(1)
 
     try:
-        importer = BatchImporter()
-        importer.process_file(file_path, limit)
+        importer = BatchImporter(args.shard_id, args.shards, Config.INCREMENTAL_IMPORT and not args.full, args.embed_only)
+        importer.process_file(args.file_path, args.limit, Config.BULK_LOAD_SETTINGS and not args.no_bulk_load_settings)
     except KeyboardInterrupt:
         print("\nProcess interrupted by user")
         sys.exit(0)
@@ -0,0 +1,158 @@
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, List, Optional
+from opensearchpy.exceptions import TransportError
+
+logger = logging.getLogger()
+
+class BulkIndexer:
+    """
+    Concurrent ``_bulk`` engine for one index.
+
+    Documents are serialized once and packed into chunks bounded by both
+    ``max_docs`` and ``max_bytes``; up to ``max_workers`` chunks are in flight.
+    Only the items OpenSearch rejects with 429 (or a whole chunk rejected
+    with 429) are resent, with jittered exponential back-off; every other
+    per-item error is reported, not retried. The chunk size tunes itself:
+    it halves when a chunk is throttled and grows back slowly while chunks
+    go through cleanly.
+
+    ``index`` returns a bulk-style response with one item per input document,
+    in input order, so callers can inspect per-item status as before. With
+    ``op='update'`` each document is sent as a partial update of the stored
+    one instead of replacing it.
+    """
+    # Restored after bulk_load_settings when the caller has no configured values
+    DEFAULT_INDEX_SETTINGS = {'refresh_interval': '1s', 'number_of_replicas': 1}
+
+    def __init__(self, client, index_name: str, max_docs: int = 500, max_bytes: int = 10 * 1024 * 1024,
+                 max_workers: int = 4, max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30,
+                 min_docs: int = 50):
+        self.client = client
+        self.index_name = index_name
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_docs = min(min_docs, max_docs)
+        self._chunk_docs = max_docs
+        self._lock = threading.Lock()
+
+    def _action(self, document: Dict, id_field: Optional[str], op: str = 'index') -> bytes:
+        meta = {'_index': self.index_name}
+        if id_field and document.get(id_field):
+            meta['_id'] = document[id_field]
+        source = {'doc': document} if op == 'update' else document
+        return (json.dumps({op: meta}) + "\n" + json.dumps(source) + "\n").encode('utf-8')
+
+    def _chunks(self, documents: Iterable[Dict], id_field: Optional[str], op: str = 'index'):
+        chunk = []
+        chunk_bytes = 0
+        for position, document in enumerate(documents):
+            line = self._action(document, id_field, op)
+            if chunk and (len(chunk) >= self._chunk_docs or chunk_bytes + len(line) > self.max_bytes):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append((position, line))
+            chunk_bytes += len(line)
+        if chunk:
+            yield chunk
+
+    def _backoff(self, attempt: int):
+        time.sleep(min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.5))
+
+    def _throttled(self):
+        with self._lock:
+            self._chunk_docs = max(self.min_docs, self._chunk_docs // 2)
+
+    def _succeeded(self):
+        with self._lock:
+            self._chunk_docs = min(self.max_docs, self._chunk_docs + max(1, self.max_docs // 10))
+
+    def _send(self, chunk: List) -> Dict[int, Dict]:
+        """Send one chunk, resending throttled items; returns position -> bulk item."""
+        results = {}
+        pending = chunk
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.bulk(body=b"".join(line for _, line in pending))
+            except TransportError as e:
+                if e.status_code != 429 or attempt == self.max_retries:
+                    raise
+                self._throttled()
+                self._backoff(attempt)
+                continue
+            retry = []
+            for (position, line), item in zip(pending, response['items']):
+                result = next(iter(item.values()))
+                if result.get('status') == 429 and attempt < self.max_retries:
+                    retry.append((position, line))
+                else:
+                    results[position] = item
+            if not retry:
+                if attempt == 0:
+                    self._succeeded()
+                return results
+            logger.info(f"Retrying {len(retry)} of {len(pending)} throttled bulk items")
+            self._throttled()
+            self._backoff(attempt)
+            pending = retry
+        return results
+
+    def index(self, documents: Iterable[Dict], id_field: Optional[str] = 'id', op: str = 'index') -> Dict:
+        items = {}
+        failed_chunks = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = {}
+            for chunk in self._chunks(documents, id_field, op):
+                if len(in_flight) >= self.max_workers:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(future, in_flight.pop(future), items, failed_chunks, op)
+                in_flight[executor.submit(self._send, chunk)] = chunk
+            for future in list(in_flight):
+                self._collect(future, in_flight.pop(future), items, failed_chunks, op)
+        ordered = [items[position] for position in sorted(items)]
+        errors = [item for item in ordered if next(iter(item.values())).get('status', 500) >= 300]
+        if errors:
+            logger.error(f"{len(errors)} of {len(ordered)} bulk items failed")
+        return {"errors": bool(errors), "items": ordered, "failed": len(errors)}
+
+    @staticmethod
+    def _collect(future, chunk, items: Dict, failed_chunks: List, op: str = 'index'):
+        try:
+            items.update(future.result())
+        except Exception as e:
+            # The whole chunk failed (connection error, 413, 5xx...): report every item in it
+            logger.error(f"Bulk chunk of {len(chunk)} documents failed: {str(e)}")
+            failed_chunks.append(str(e))
+            for position, _ in chunk:
+                items[position] = {op: {'status': getattr(e, 'status_code', 500) or 500, 'error': str(e)}}
+
+    @contextmanager
+    def bulk_load_settings(self, force_merge: bool = False, restore: Optional[Dict] = None):
+        """
+        Disable refresh and replicas for a large load, then restore the
+        configured ``restore`` settings (not the values read before the load,
+        which are -1/0 if another load is still running), refresh, and
+        optionally force-merge to one segment. Overlapping loads of the same
+        index should be wrapped once by whoever starts them.
+        """
+        restore = dict(restore or self.DEFAULT_INDEX_SETTINGS)
+        self.client.indices.put_settings(index=self.index_name, body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+        logger.info(f"Bulk load settings applied to {self.index_name}; will restore {restore}")
+        try:
+            yield
+        finally:
+            self.client.indices.put_settings(index=self.index_name, body={'index': restore})
+            self.client.indices.refresh(index=self.index_name)
+            if force_merge:
+                self.client.indices.forcemerge(index=self.index_name, max_num_segments=1, request_timeout=3600)
+            logger.info(f"Restored settings of {self.index_name}")
@@ -11,6 +11,47 @@ class Config:
     TEXT_VECTOR_DIMENSION = 1536  # Text embedding dimension
     IMAGE_VECTOR_DIMENSION = 1024  # Image embedding dimension
     
+    # 批量写入配置: chunk按文档数和字节数切分, 并发发送, 只重试被限流(429)的文档
+    BULK_MAX_DOCS = int(os.getenv('BULK_MAX_DOCS', '500'))
+    BULK_MAX_BYTES = int(os.getenv('BULK_MAX_BYTES', str(10 * 1024 * 1024)))
+    BULK_WORKERS = int(os.getenv('BULK_WORKERS', '4'))
+    BULK_MAX_RETRIES = int(os.getenv('BULK_MAX_RETRIES', '5'))
+    # 每批文档最多缓冲的秒数, 超过即写入
+    BULK_FLUSH_SECONDS = float(os.getenv('BULK_FLUSH_SECONDS', '5'))
+    # 导入流水线: 解析 -> 下载 -> 生成向量 -> 写入, 每个阶段的并发数和队列长度
+    DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '16'))
+    EMBED_WORKERS = int(os.getenv('EMBED_WORKERS', '8'))
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '1000'))
+    # 图片下载: 连接池大小, 每个host的并发上限, 本地缓存目录(为空不缓存), 生成向量前缩小到的最长边(0不缩小)
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '32'))
+    PER_HOST_CONNECTIONS = int(os.getenv('PER_HOST_CONNECTIONS', '16'))
+    IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', '')
+    IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '512'))
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '85'))
+    # 每个商品最多生成向量的图片数, 每个商品同时下载/生成向量的图片数, 按URL缓存的图片向量数(相同图片只调用一次Bedrock)
+    MAX_IMAGES_PER_PRODUCT = int(os.getenv('MAX_IMAGES_PER_PRODUCT', '8'))
+    IMAGE_CONCURRENCY_PER_PRODUCT = int(os.getenv('IMAGE_CONCURRENCY_PER_PRODUCT', '4'))
+    IMAGE_VECTOR_CACHE_SIZE = int(os.getenv('IMAGE_VECTOR_CACHE_SIZE', '50000'))
+    # 每提交这么多条记录保存一次进度(行号和字节偏移)
+    CHECKPOINT_EVERY_RECORDS = int(os.getenv('CHECKPOINT_EVERY_RECORDS', '1000'))
+    # 增量导入: 先按批(mget)读取已有文档的内容指纹, 内容未变的记录不再生成向量; --full时全部重新导入
+    INCREMENTAL_IMPORT = os.getenv('INCREMENTAL_IMPORT', 'true').lower() == 'true'
+    FINGERPRINT_BATCH_SIZE = int(os.getenv('FINGERPRINT_BATCH_SIZE', '500'))
+    # embed-only模式每个输出分片(parquet + npy)包含的文档数
+    EMBED_PART_RECORDS = int(os.getenv('EMBED_PART_RECORDS', '20000'))
+    # 导入期间关闭refresh并把副本数设为0, 结束后恢复为INDEX_REFRESH_INTERVAL/INDEX_NUMBER_OF_REPLICAS; FORCE_MERGE=true时再合并为一个segment
+    # 多个导入同时写同一个索引时只能由一方设置(launch_import.py统一设置), 默认关闭
+    BULK_LOAD_SETTINGS = os.getenv('BULK_LOAD_SETTINGS', 'false').lower() == 'true'
+    INDEX_REFRESH_INTERVAL = os.getenv('INDEX_REFRESH_INTERVAL', '1s')
+    INDEX_NUMBER_OF_REPLICAS = int(os.getenv('INDEX_NUMBER_OF_REPLICAS', '1'))
+    FORCE_MERGE = os.getenv('FORCE_MERGE', 'false').lower() == 'true'
+    
+    # Bedrock自适应限速: 初始/最小/最大每秒请求数, 限流和临时错误的最大重试次数
+    BEDROCK_INITIAL_RPS = float(os.getenv('BEDROCK_INITIAL_RPS', '5'))
+    BEDROCK_MIN_RPS = float(os.getenv('BEDROCK_MIN_RPS', '0.5'))
+    BEDROCK_MAX_RPS = float(os.getenv('BEDROCK_MAX_RPS', '50'))
+    BEDROCK_MAX_RETRIES = int(os.getenv('BEDROCK_MAX_RETRIES', '6'))
+    
     # AWS配置
     AWS_REGION = os.getenv('AWS_REGION', 'us-west-2')
     
@@ -20,9 +61,9 @@ class Config:
         return boto3.Session(region_name=Config.AWS_REGION)
     
     @staticmethod
-    def validate_config():
-        """验证配置是否完整"""
-        if not Config.OPENSEARCH_ENDPOINT:
+    def validate_config(require_opensearch=True):
+        """验证配置是否完整; embed-only模式不需要OpenSearch"""
+        if require_opensearch and not Config.OPENSEARCH_ENDPOINT:
             raise ValueError("OPENSEARCH_ENDPOINT environment variable is not set")
         
         # 验证AWS凭证
@@ -1,10 +1,16 @@
 import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
 from fastapi import HTTPException
 from config import Config
 
 class EmbeddingGenerator:
-    def __init__(self, bedrock_runtime_client):
+    def __init__(self, bedrock_runtime_client, rate_limiter=None):
         self.bedrock_runtime = bedrock_runtime_client
+        # AdaptiveRateLimiter shared by all threads; None calls Bedrock directly
+        self.rate_limiter = rate_limiter
 
     def generate_embedding(self, data, mode):
         if mode == 'text':
@@ -26,7 +32,9 @@ class EmbeddingGenerator:
             raise HTTPException(status_code=400, detail="Invalid mode. Use 'text' or 'image'.")
 
         try:
-            response = self.bedrock_runtime.invoke_model(
+            invoke = self.rate_limiter.call if self.rate_limiter else (lambda fn, **kwargs: fn(**kwargs))
+            response = invoke(
+                self.bedrock_runtime.invoke_model,
                 body=body,
                 modelId=model_id,
                 accept="application/json",
@@ -37,3 +45,51 @@ class EmbeddingGenerator:
             return embedding
         except Exception as e:
             raise Exception(f"Error generating embedding: {str(e)}")
+
+
+class ImageEmbeddingCache:
+    """
+    按图片URL缓存图片向量(LRU, 最多max_entries个, 以float32保存), 不同商品(例如同一商品的不同变体)
+    共享的图片只调用一次Bedrock. 同一URL正在生成向量时, 其他线程等待其结果而不是重复调用.
+    缓存只在当前进程内有效: launch_import.py每个分片一个进程, 同一URL出现在多个分片时每个分片各生成一次;
+    不从索引中已有的图片向量去重(批量导入期间refresh关闭, 其他分片刚写入的向量读不到).
+    """
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._vectors = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, url):
+        with self._lock:
+            return url in self._vectors
+
+    def get_or_compute(self, url, compute):
+        """返回url的向量(list); 缓存中没有时调用compute()生成, 失败或返回None时不缓存"""
+        while True:
+            with self._lock:
+                if url in self._vectors:
+                    self._vectors.move_to_end(url)
+                    self.hits += 1
+                    return self._vectors[url].tolist()
+                waiting = self._in_flight.get(url)
+                if waiting is None:
+                    done = self._in_flight[url] = threading.Event()
+                    self.misses += 1
+                    break
+            # 等待正在进行的调用, 再重新检查缓存; 那次调用失败时由本线程重试
+            waiting.wait()
+        try:
+            vector = compute()
+            if vector is not None and self.max_entries > 0:
+                with self._lock:
+                    self._vectors[url] = np.asarray(vector, dtype=np.float32)
+                    while len(self._vectors) > self.max_entries:
+                        self._vectors.popitem(last=False)
+            return vector
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+            done.set()
@@ -0,0 +1,287 @@
+import os
+import glob
+import json
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from config import Config
+
+# 向量字段及其维度, 与索引mapping一致
+VECTOR_FIELDS = {
+    'description_embedding': Config.TEXT_VECTOR_DIMENSION,
+    'image_embedding': Config.IMAGE_VECTOR_DIMENSION
+}
+
+# 商品的所有图片向量: 每个分片一个矩阵, 按行的顺序依次排列, parquet的image_urls列给出每行的图片
+IMAGES_FIELD = 'images'
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("Embedding files need pyarrow installed")
+    return pyarrow
+
+def _float(value):
+    """price等字段在原始数据中可能是字符串或缺失, Parquet列需要统一类型"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _schema():
+    pa = _require_pyarrow()
+    return pa.schema([
+        ('id', pa.string()),
+        ('title', pa.string()),
+        ('main_category', pa.string()),
+        ('categories', pa.list_(pa.string())),
+        ('features', pa.list_(pa.string())),
+        ('description', pa.string()),
+        ('price', pa.float64()),
+        ('average_rating', pa.float64()),
+        ('rating_number', pa.int64()),
+        ('store', pa.string()),
+        ('image_url', pa.string()),
+        ('fingerprint', pa.string()),
+        ('image_urls', pa.list_(pa.string())),
+        ('has_image_embedding', pa.bool_())
+    ])
+
+def vector_path(part_path, field):
+    return f"{part_path[:-len('.parquet')]}.{field}.npy"
+
+def list_parts(directory):
+    """目录下已写完的分片; parquet文件最后写入, 存在即说明对应的npy文件已完整"""
+    return sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+
+def _save_npy(path, array):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class EmbeddingPartWriter:
+    """
+    embed-only模式的输出: 与BulkWriter相同的add/flush/close接口, 文档不写入OpenSearch,
+    而是每part_records条写成一个分片: part-*.parquet保存文档的其他字段,
+    part-*.<向量字段>.npy保存float32向量矩阵(每行对应parquet中的一行, 没有图片向量的行为0,
+    has_image_embedding为False).
+
+    分片写入磁盘后才对其中每个文档调用on_result(key, error), 所以进度文件不会超过已写入的记录.
+    中断后续传可能重复写入少量文档, 加载时按id覆盖, 不影响结果.
+    """
+    def __init__(self, directory, on_result, part_records=20000, suffix=""):
+        _require_pyarrow()
+        self.directory = directory
+        self.on_result = on_result
+        self.max_docs = part_records
+        self.prefix = f"part-{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}"
+        self._parts = 0
+        self._entries = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, key, document, op='index'):
+        if op != 'index':
+            self.on_result(key, "Partial updates are not supported in embed-only mode")
+            return
+        # 立即转成float32, 缓冲的向量只占原来列表的约1/8内存
+        vectors = {
+            field: np.asarray(document[field], dtype=np.float32) if document.get(field) is not None else None
+            for field in VECTOR_FIELDS
+        }
+        images = document.get(IMAGES_FIELD, [])
+        vectors[IMAGES_FIELD] = [np.asarray(image['embedding'], dtype=np.float32) for image in images]
+        row = {field: value for field, value in document.items() if field not in VECTOR_FIELDS and field != IMAGES_FIELD}
+        row['image_urls'] = [image['url'] for image in images]
+        with self._lock:
+            self._entries.append((key, row, vectors))
+            if len(self._entries) >= self.max_docs:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._entries:
+            return
+        entries, self._entries = self._entries, []
+        part_path = os.path.join(self.directory, f"{self.prefix}-{self._parts:05d}.parquet")
+        self._parts += 1
+        try:
+            self._write(part_path, [row for _, row, _ in entries], [vectors for _, _, vectors in entries])
+            error = None
+        except Exception as e:
+            error = f"Error writing embedding file: {str(e)}"
+        for key, _, _ in entries:
+            self.on_result(key, error)
+
+    @staticmethod
+    def _write(part_path, rows, vectors):
+        pa = _require_pyarrow()
+        for field, dimension in VECTOR_FIELDS.items():
+            matrix = np.zeros((len(rows), dimension), dtype=np.float32)
+            for i, row_vectors in enumerate(vectors):
+                vector = row_vectors[field]
+                if vector is not None:
+                    if vector.shape != (dimension,):
+                        raise ValueError(f"{field} dimension mismatch. Expected {dimension}, got {vector.shape[0]}")
+                    matrix[i] = vector
+            _save_npy(vector_path(part_path, field), matrix)
+        images = [vector for row_vectors in vectors for vector in row_vectors[IMAGES_FIELD]]
+        if any(vector.shape != (Config.IMAGE_VECTOR_DIMENSION,) for vector in images):
+            raise ValueError(f"images.embedding dimension mismatch. Expected {Config.IMAGE_VECTOR_DIMENSION}")
+        _save_npy(vector_path(part_path, IMAGES_FIELD), np.stack(images) if images else
+                  np.zeros((0, Config.IMAGE_VECTOR_DIMENSION), dtype=np.float32))
+        table = pa.Table.from_pylist([{
+            **row,
+            'price': _float(row.get('price')),
+            'average_rating': _float(row.get('average_rating')),
+            'rating_number': int(_float(row.get('rating_number')) or 0),
+            'has_image_embedding': row_vectors['image_embedding'] is not None
+        } for row, row_vectors in zip(rows, vectors)], schema=_schema())
+        tmp_path = f"{part_path}.tmp"
+        pa.parquet.write_table(table, tmp_path)
+        os.replace(tmp_path, part_path)
+
+    def close(self):
+        self.flush()
+
+def _image_matrix(part_path):
+    """分片的所有图片向量; 只有主图向量的旧分片没有这个文件"""
+    path = vector_path(part_path, IMAGES_FIELD)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    return np.zeros((0, Config.IMAGE_VECTOR_DIMENSION), dtype=np.float32)
+
+def _read_documents(part_path):
+    """分片的文档字段, 按当前的列顺序; 旧分片没有image_urls列"""
+    pa = _require_pyarrow()
+    table = pa.parquet.read_table(part_path)
+    if 'image_urls' not in table.column_names:
+        table = table.append_column('image_urls', pa.nulls(table.num_rows, pa.list_(pa.string())))
+    return table.select(_schema().names)
+
+def read_part(part_path):
+    """按行产出可直接写入OpenSearch的文档, 与在线导入生成的文档字段一致"""
+    rows = _read_documents(part_path).to_pylist()
+    matrices = {field: np.load(vector_path(part_path, field), mmap_mode='r') for field in VECTOR_FIELDS}
+    images = _image_matrix(part_path)
+    position = 0
+    for i, row in enumerate(rows):
+        has_image = row.pop('has_image_embedding')
+        image_urls = row.pop('image_urls', None) or []
+        document = {field: value for field, value in row.items() if value is not None}
+        document['description_embedding'] = matrices['description_embedding'][i].tolist()
+        if has_image:
+            document['image_embedding'] = matrices['image_embedding'][i].tolist()
+        if image_urls:
+            document[IMAGES_FIELD] = [
+                {'url': url, 'embedding': images[position + j].tolist()} for j, url in enumerate(image_urls)
+            ]
+            position += len(image_urls)
+        yield document
+
+class LocalVectorStore:
+    """
+    本地的向量库: documents.parquet保存文档字段, 每个向量字段一个float32矩阵(.npy),
+    search()对矩阵做精确的L2最近邻搜索, 与索引的space_type一致. 矩阵以mmap方式打开.
+    images.npy保存所有图片向量, image_owner.npy是每个图片向量所属文档的行号;
+    按images搜索时文档的距离取其最相似的一张图片.
+    """
+    def __init__(self, directory):
+        pa = _require_pyarrow()
+        self.directory = directory
+        self.documents = pa.parquet.read_table(os.path.join(directory, "documents.parquet"))
+        self.ids = self.documents.column('id').to_pylist()
+        self.has_image = np.asarray(self.documents.column('has_image_embedding').to_pylist(), dtype=bool)
+        self.vectors = {
+            field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode='r')
+            for field in list(VECTOR_FIELDS) + [IMAGES_FIELD]
+        }
+        self.image_owner = np.load(os.path.join(directory, "image_owner.npy"))
+
+    @staticmethod
+    def build(parts, directory):
+        """
+        把embed-only的分片合并为一个本地向量库; 同一id出现多次时保留最后写入的一行.
+        返回文档数. 矩阵逐个分片写入, 内存占用与单个分片相当
+        """
+        pa = _require_pyarrow()
+        os.makedirs(directory, exist_ok=True)
+        # 先只读id和图片URL列, 确定每个id保留哪一行, 以及每行的图片在分片图片矩阵中的位置
+        latest = {}
+        image_counts = []
+        for part_index, part_path in enumerate(parts):
+            table = _read_documents(part_path).select(['id', 'image_urls'])
+            for row, doc_id in enumerate(table.column('id').to_pylist()):
+                latest[doc_id] = (part_index, row)
+            image_counts.append(np.asarray([len(urls or []) for urls in table.column('image_urls').to_pylist()], dtype=np.int64))
+        keep = {}
+        for part_index, row in latest.values():
+            keep.setdefault(part_index, []).append(row)
+        total = len(latest)
+        total_images = sum(int(image_counts[part_index][rows].sum()) for part_index, rows in keep.items())
+        shapes = {field: (total, dimension) for field, dimension in VECTOR_FIELDS.items()}
+        shapes[IMAGES_FIELD] = (total_images, Config.IMAGE_VECTOR_DIMENSION)
+        matrices = {
+            field: np.lib.format.open_memmap(os.path.join(directory, f"{field}.npy.tmp"), mode='w+',
+                                             dtype=np.float32, shape=shape)
+            for field, shape in shapes.items()
+        }
+        image_owner = np.zeros(total_images, dtype=np.int64)
+        tables = []
+        position = 0
+        image_position = 0
+        for part_index, part_path in enumerate(parts):
+            rows = np.asarray(sorted(keep.get(part_index, [])), dtype=np.int64)
+            if not len(rows):
+                continue
+            tables.append(_read_documents(part_path).take(pa.array(rows)))
+            for field in VECTOR_FIELDS:
+                matrices[field][position:position + len(rows)] = np.load(vector_path(part_path, field), mmap_mode='r')[rows]
+            # 分片中第i行的图片从starts[i]开始
+            counts = image_counts[part_index]
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            source_images = _image_matrix(part_path)
+            for offset, row in enumerate(rows):
+                count = int(counts[row])
+                if count:
+                    matrices[IMAGES_FIELD][image_position:image_position + count] = source_images[starts[row]:starts[row] + count]
+                    image_owner[image_position:image_position + count] = position + offset
+                    image_position += count
+            position += len(rows)
+        for field in shapes:
+            matrices.pop(field).flush()
+            os.replace(os.path.join(directory, f"{field}.npy.tmp"), os.path.join(directory, f"{field}.npy"))
+        np.save(os.path.join(directory, "image_owner.npy"), image_owner)
+        table = pa.concat_tables(tables) if tables else _schema().empty_table()
+        pa.parquet.write_table(table, os.path.join(directory, "documents.parquet"))
+        with open(os.path.join(directory, "store.json"), 'w') as f:
+            json.dump({'documents': total, 'parts': len(parts), 'fields': VECTOR_FIELDS}, f)
+        return total
+
+    def search(self, vector, field='description_embedding', k=10):
+        """返回距离最近的k个文档的(id, 距离); field为images时按每个文档最相似的图片排序"""
+        matrix = self.vectors[field]
+        distances = ((matrix - np.asarray(vector, dtype=np.float32)) ** 2).sum(axis=1)
+        if field == IMAGES_FIELD:
+            best = np.full(len(self.ids), np.inf, dtype=distances.dtype)
+            np.minimum.at(best, self.image_owner, distances)
+            distances = best
+        elif field == 'image_embedding':
+            # 没有图片向量的行为0向量, 不参与图片搜索
+            distances = np.where(self.has_image, distances, np.inf)
+        k = min(k, len(distances))
+        if k == 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(self.ids[i], float(distances[i])) for i in top if np.isfinite(distances[i])]
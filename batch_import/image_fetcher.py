@@ -0,0 +1,137 @@
+import os
+import time
+import base64
+import random
+import hashlib
+import threading
+from io import BytesIO
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageOps
+
+def _to_rgb(image):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+def downscale_image(image_data, max_edge, quality):
+    """
+    把图片最长边缩小到max_edge以内并重新编码为JPEG; 已经足够小的图片原样返回
+    """
+    with Image.open(BytesIO(image_data)) as source:
+        if max(source.size) <= max_edge:
+            return image_data
+        # JPEG可以直接按缩小的比例解码
+        source.draft("RGB", (max_edge, max_edge))
+        image = _to_rgb(ImageOps.exif_transpose(source))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+class ImageCache:
+    """
+    按内容寻址的本地图片缓存: blobs/<sha256>保存图片, urls/<sha256(url)>记录URL对应的内容哈希,
+    不同URL的相同图片只存一份. 写入先写临时文件再改名, 多线程/多进程并发写入也不会读到半个文件.
+    """
+    def __init__(self, cache_dir, variant=""):
+        self.cache_dir = cache_dir
+        # 缩放参数不同, 缓存的图片也不同
+        self.variant = variant
+        os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "urls"), exist_ok=True)
+
+    def _url_path(self, url):
+        return os.path.join(self.cache_dir, "urls", hashlib.sha256(f"{self.variant}|{url}".encode('utf-8')).hexdigest())
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.cache_dir, "blobs", content_hash)
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, url):
+        try:
+            with open(self._url_path(url), 'r') as f:
+                content_hash = f.read().strip()
+            with open(self._blob_path(content_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, data):
+        content_hash = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(self._blob_path(content_hash)):
+            self._write(self._blob_path(content_hash), data)
+        self._write(self._url_path(url), content_hash.encode('utf-8'))
+
+class ImageFetcher:
+    """
+    下载商品图片: 共享的keep-alive连接池, 每个host的并发数上限, 可选的本地缓存,
+    以及在base64编码前把图片缩小到max_edge, 减小发送给Bedrock的请求体.
+    """
+    def __init__(self, pool_size=32, per_host_limit=16, cache_dir=None, max_edge=512, quality=85,
+                 timeout=30, max_retries=3, retry_delay=1):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.per_host_limit = per_host_limit
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self.cache = ImageCache(cache_dir, f"{max_edge}/{quality}") if cache_dir else None
+        self.max_edge = max_edge
+        self.quality = quality
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def _download(self, url):
+        for attempt in range(self.max_retries):
+            try:
+                with self._slot(url):
+                    response = self.session.get(url, timeout=self.timeout)
+                if response.status_code == 200:
+                    return response.content
+                if response.status_code == 404:  # Don't retry if image not found
+                    return None
+            except requests.RequestException:
+                pass
+            if attempt < self.max_retries - 1:
+                time.sleep(self.retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+        return None
+
+    def fetch(self, url):
+        """返回缩小后图片的base64字符串; 下载失败返回None"""
+        image_data = self.cache.get(url) if self.cache else None
+        if image_data is None:
+            image_data = self._download(url)
+            if image_data is None:
+                return None
+            if self.max_edge:
+                try:
+                    image_data = downscale_image(image_data, self.max_edge, self.quality)
+                except Exception:
+                    # PIL无法解码的图片原样发送, 由Bedrock决定是否接受
+                    pass
+            if self.cache:
+                self.cache.put(url, image_data)
+        return base64.b64encode(image_data).decode('utf-8')
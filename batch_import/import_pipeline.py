@@ -0,0 +1,152 @@
+import queue
+import threading
+
+_STOP = object()
+
+def shard_range(f, size, shards, shard_id):
+    """
+    Byte range [start, end) of shard ``shard_id`` out of ``shards`` in a line
+    based file opened in binary mode. The file is cut into equal byte ranges
+    and each cut moves forward to the next line start, so every line belongs
+    to exactly one shard and shards need no coordination.
+    """
+    def boundary(position):
+        if position <= 0:
+            return 0
+        if position >= size:
+            return size
+        f.seek(position - 1)
+        f.readline()
+        return f.tell()
+    return boundary(size * shard_id // shards), boundary(size * (shard_id + 1) // shards)
+
+class CommitTracker:
+    """
+    Records finish out of order; the checkpoint is the highest line number
+    below which every line has been committed (indexed or logged as failed),
+    together with the byte offset just past that line.
+    """
+    def __init__(self, last_committed=0, offset=0):
+        self.watermark = last_committed
+        self.offset = offset
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def commit(self, line_number, end_offset=None):
+        with self._lock:
+            self._done[line_number] = end_offset
+            while self.watermark + 1 in self._done:
+                end = self._done.pop(self.watermark + 1)
+                self.watermark += 1
+                if end is not None:
+                    self.offset = end
+            return self.watermark
+
+class StagedPipeline:
+    """
+    Runs items through a chain of stages, each with its own worker threads,
+    connected by bounded queues, and hands them to a single sink thread.
+
+    ``stages`` is a list of ``(name, fn, workers)``; ``fn(item)`` updates the
+    item dict in place. A stage given as ``(name, fn, workers, batch_size)``
+    gets lists of up to ``batch_size`` items instead, gathered from what is
+    already queued, for stages that make one request per batch.
+
+    An item whose ``error`` is set (by the producer or a stage that raised),
+    or that a stage marked ``done``, skips the remaining stages but still
+    reaches the sink, so every submitted item is accounted for exactly once.
+
+    ``close()`` stops accepting items and drains: every item already
+    submitted goes through all stages and the sink before it returns.
+    """
+    BATCH_WAIT_SECONDS = 0.05
+
+    def __init__(self, stages, sink, queue_size=1000):
+        self.stages = [tuple(stage) + (None,) * (4 - len(stage)) for stage in stages]
+        self.sink = sink
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self._remaining = [workers for _, _, workers, _ in self.stages]
+        self._lock = threading.Lock()
+        self._threads = []
+        self.sink_error = None
+
+    def start(self):
+        for index, (name, fn, workers, batch_size) in enumerate(self.stages):
+            for worker in range(workers):
+                thread = threading.Thread(target=self._work, args=(index, fn, batch_size), name=f"{name}-{worker}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._sink_thread = threading.Thread(target=self._drain_sink, name="sink", daemon=True)
+        self._sink_thread.start()
+
+    def submit(self, item):
+        """Blocks while the first stage is full."""
+        self.queues[0].put(item)
+
+    @staticmethod
+    def _pending(item):
+        return item.get('error') is None and not item.get('done')
+
+    def _take(self, source, batch_size):
+        """Next item, or up to batch_size queued items; the second value tells whether the stage must stop"""
+        item = source.get()
+        if item is _STOP:
+            return [], True
+        items = [item]
+        while batch_size and len(items) < batch_size:
+            try:
+                item = source.get(timeout=self.BATCH_WAIT_SECONDS)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _work(self, index, fn, batch_size):
+        source, target = self.queues[index], self.queues[index + 1]
+        name = self.stages[index][0]
+        stop = False
+        while not stop:
+            items, stop = self._take(source, batch_size)
+            pending = [item for item in items if self._pending(item)]
+            if pending:
+                try:
+                    if batch_size:
+                        fn(pending)
+                    else:
+                        fn(pending[0])
+                except Exception as e:
+                    for item in pending:
+                        item['error'] = f"{name} failed: {str(e)}"
+            for item in items:
+                target.put(item)
+        with self._lock:
+            self._remaining[index] -= 1
+            last = self._remaining[index] == 0
+        if last:
+            # The last worker of this stage stops the next one
+            next_workers = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+            for _ in range(next_workers):
+                target.put(_STOP)
+
+    def _drain_sink(self):
+        source = self.queues[-1]
+        while True:
+            item = source.get()
+            if item is _STOP:
+                break
+            try:
+                self.sink(item)
+            except Exception as e:
+                # Keep consuming so upstream stages never block on a full queue
+                self.sink_error = e
+
+    def close(self):
+        for _ in range(self.stages[0][2] if self.stages else 1):
+            self.queues[0].put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._sink_thread.join()
+        if self.sink_error is not None:
+            raise self.sink_error
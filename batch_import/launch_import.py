@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
+
+from config import Config
+from record_readers import open_reader
+
+IMPORTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_import_to_opensearch.py")
+
+def shard_suffix(shard_id, shards):
+    return f".shard-{shard_id}-of-{shards}"
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            content = f.read().strip()
+        return json.loads(content) if content.startswith('{') else None
+    except (OSError, ValueError):
+        return None
+
+def committed(shard_id, shards, start, embed_only_dir=None):
+    """Bytes (or Parquet rows) of the shard already committed, from its progress file"""
+    name = f"{'embed' if embed_only_dir else 'import'}_progress{shard_suffix(shard_id, shards)}.txt"
+    progress = read_json(os.path.join(embed_only_dir, name) if embed_only_dir else name)
+    return max(0, progress['offset'] - start) if progress else 0
+
+def error_categories(error_log):
+    """Error messages grouped by their text up to the first ':'"""
+    counts = Counter()
+    if not error_log or not os.path.exists(error_log):
+        return counts
+    with open(error_log, 'r') as f:
+        for line in f:
+            match = re.match(r"\[[^\]]*\] Line \d+: (.*)", line)
+            if match:
+                counts[match.group(1).split(':')[0].strip()] += 1
+    return counts
+
+def run_shards(args, shards, ranges, size, unit):
+    """Start one importer per shard, report progress until all exited, then summarize"""
+    os.makedirs("logs", exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    processes = []
+    for shard_id in range(shards):
+        log_file = open(os.path.join("logs", f"import_{timestamp}{shard_suffix(shard_id, shards)}.log"), 'w')
+        command = [sys.executable, IMPORTER, args.file_path, "--shards", str(shards), "--shard-id", str(shard_id),
+                   "--no-bulk-load-settings"]
+        if args.embed_only:
+            command += ["--embed-only", args.embed_only]
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        processes.append((process, log_file))
+    print(f"Started {shards} import processes, logs in logs/import_{timestamp}.shard-*.log")
+
+    def handle_interrupt(signum, frame):
+        # Each shard drains its records in flight and saves its checkpoint before exiting
+        print("\nReceived interrupt signal. Waiting for shards to drain...")
+        for process, _ in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+    signal.signal(signal.SIGINT, handle_interrupt)
+    signal.signal(signal.SIGTERM, handle_interrupt)
+
+    start_time = time.time()
+    while True:
+        running = sum(1 for process, _ in processes if process.poll() is None)
+        done = sum(committed(shard_id, shards, start, args.embed_only) for shard_id, (start, _) in enumerate(ranges))
+        elapsed = time.time() - start_time
+        if unit == 'B':
+            amount = f"{done / 1024 / 1024:.1f}/{size / 1024 / 1024:.1f} MiB, {done / 1024 / 1024 / max(elapsed, 1e-6):.2f} MiB/s"
+        else:
+            amount = f"{done}/{size} records, {done / max(elapsed, 1e-6):.1f} records/s"
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {done / max(size, 1) * 100:.1f}% ({amount}), "
+              f"{running}/{shards} shards running")
+        if not running:
+            break
+        time.sleep(args.interval)
+
+    for _, log_file in processes:
+        log_file.close()
+
+    print("\nShard report:")
+    successful = failed = unchanged = 0
+    errors = Counter()
+    incomplete = []
+    for shard_id, (process, _) in enumerate(processes):
+        summary = read_json(f"import_summary{shard_suffix(shard_id, shards)}.json") or {}
+        successful += summary.get('successful', 0)
+        failed += summary.get('failed', 0)
+        unchanged += summary.get('unchanged', 0)
+        errors.update(error_categories(summary.get('error_log')))
+        if process.returncode != 0 or not summary.get('complete'):
+            incomplete.append(shard_id)
+        print(f"  shard {shard_id}: exit {process.returncode}, {unit} {ranges[shard_id][0]}-{ranges[shard_id][1]}, "
+              f"successful {summary.get('successful', '?')}, failed {summary.get('failed', '?')}, "
+              f"{'complete' if summary.get('complete') else 'incomplete'}")
+    print(f"\nSuccessful: {successful}")
+    print(f"Failed: {failed}")
+    print(f"Unchanged (skipped): {unchanged}")
+    for message, count in errors.most_common(10):
+        print(f"  {count:>8}  {message}")
+    if incomplete:
+        print(f"Incomplete shards: {incomplete}; run the same command again to resume them")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a file with one batch_import process per shard")
+    parser.add_argument("file_path", help="JSONL or Parquet file to import")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="number of shards/processes (default: CPU count)")
+    parser.add_argument("--embed-only", metavar="DIR", default=None,
+                        help="write documents and embeddings to Parquet/npy files in DIR instead of OpenSearch")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between progress reports")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file_path):
+        print(f"File not found: {args.file_path}")
+        sys.exit(1)
+
+    shards = args.processes
+    with open_reader(args.file_path) as reader:
+        if not reader.seekable:
+            print("Sharding needs an uncompressed JSONL or a Parquet file")
+            sys.exit(1)
+        size = reader.total
+        unit = reader.unit
+        ranges = [reader.shard_range(shards, shard_id) for shard_id in range(shards)]
+
+    if Config.BULK_LOAD_SETTINGS and not args.embed_only:
+        from opensearch_client import OpenSearchClient
+
+        # Applied once for all shards and restored after the last one exits; shards leave the settings alone
+        Config.validate_config()
+        client = OpenSearchClient(Config.get_aws_session())
+        client.ensure_index_exists()
+        bulk_load = client.bulk_load(Config.FORCE_MERGE)
+    else:
+        bulk_load = nullcontext()
+    with bulk_load:
+        run_shards(args, shards, ranges, size, unit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import argparse
+from contextlib import nullcontext
+from datetime import datetime
+
+from config import Config
+from embedding_store import list_parts, read_part, LocalVectorStore
+
+def loaded_parts(progress_file):
+    if not os.path.exists(progress_file):
+        return set()
+    with open(progress_file, 'r') as f:
+        return {line.strip() for line in f if line.strip()}
+
+def load_opensearch(directory, parts, reload=False):
+    """Bulk index every part not loaded yet; a part is recorded as loaded once all its documents were sent"""
+    from opensearch_client import OpenSearchClient
+
+    Config.validate_config()
+    client = OpenSearchClient(Config.get_aws_session())
+    client.ensure_index_exists()
+    progress_file = os.path.join(directory, f"load_progress.{Config.COLLECTION_INDEX_NAME}.txt")
+    if reload and os.path.exists(progress_file):
+        os.remove(progress_file)
+    done = loaded_parts(progress_file)
+    remaining = [part for part in parts if os.path.basename(part) not in done]
+    print(f"{len(parts)} parts, {len(parts) - len(remaining)} already loaded into {Config.COLLECTION_INDEX_NAME}")
+    error_log_file = f"load_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    successful = failed = 0
+    start_time = time.time()
+    # Refresh off and no replicas while loading, restored (and optionally force-merged) afterwards
+    with client.bulk_load(Config.FORCE_MERGE) if Config.BULK_LOAD_SETTINGS else nullcontext():
+        for number, part in enumerate(remaining, 1):
+            # Vectors were checked when the part was written; documents are serialized lazily, chunk by chunk
+            response = client.bulk_indexer.index(read_part(part))
+            errors = [next(iter(item.values())) for item in response['items']]
+            errors = [item for item in errors if item.get('status', 500) >= 300]
+            if errors:
+                with open(error_log_file, 'a') as f:
+                    for item in errors:
+                        f.write(f"{os.path.basename(part)} {item.get('_id')}: {item.get('error')}\n")
+            successful += len(response['items']) - len(errors)
+            failed += len(errors)
+            with open(progress_file, 'a') as f:
+                f.write(os.path.basename(part) + "\n")
+            elapsed = time.time() - start_time
+            print(f"[{number}/{len(remaining)}] {os.path.basename(part)}: {len(response['items'])} documents, "
+                  f"{len(errors)} failed, {successful / max(elapsed, 1e-6):.0f} docs/s")
+    print(f"\nLoaded in {time.time() - start_time:.2f} seconds")
+    print(f"Successful: {successful}")
+    print(f"Failed: {failed}")
+    if failed:
+        print(f"Error log: {error_log_file}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load embeddings written by batch_import_to_opensearch.py --embed-only")
+    parser.add_argument("directory", help="directory the embed-only import wrote to")
+    parser.add_argument("--local", metavar="DIR", default=None,
+                        help="build a local vector store in DIR instead of indexing into OpenSearch")
+    parser.add_argument("--reload", action="store_true", help="index every part again, even the ones already loaded")
+    args = parser.parse_args()
+
+    parts = list_parts(args.directory)
+    if not parts:
+        print(f"No embedding files found in {args.directory}")
+        sys.exit(1)
+
+    try:
+        if args.local:
+            start_time = time.time()
+            total = LocalVectorStore.build(parts, args.local)
+            print(f"Local vector store with {total} documents written to {args.local} in {time.time() - start_time:.2f} seconds")
+        else:
+            load_opensearch(args.directory, parts, args.reload)
+    except KeyboardInterrupt:
+        print("\nProcess interrupted by user; run the same command again to load the remaining parts")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Fatal error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from opensearchpy import OpenSearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 from config import Config
-import json
-import numpy as np
+from bulk_indexer import BulkIndexer
+import time
+import threading
 
 class OpenSearchClient:
     def __init__(self, aws_session):
@@ -25,6 +26,14 @@ class OpenSearchClient:
             connection_class=RequestsHttpConnection,
             timeout=300
         )
+        self.bulk_indexer = BulkIndexer(
+            self.client,
+            Config.COLLECTION_INDEX_NAME,
+            max_docs=Config.BULK_MAX_DOCS,
+            max_bytes=Config.BULK_MAX_BYTES,
+            max_workers=Config.BULK_WORKERS,
+            max_retries=Config.BULK_MAX_RETRIES
+        )
 
     def delete_index(self):
         """删除索引"""
@@ -38,9 +47,41 @@ class OpenSearchClient:
         else:
             print(f"Index {index_name} does not exist")
 
+    # 每张图片一个nested文档; 嵌套字段的k-NN需要faiss或lucene引擎
+    IMAGES_MAPPING = {
+        "type": "nested",
+        "properties": {
+            "url": {"type": "keyword"},
+            "embedding": {
+                "type": "knn_vector",
+                "dimension": 1024,
+                "method": {
+                    "name": "hnsw",
+                    "space_type": "l2",
+                    "engine": "faiss",
+                    "parameters": {
+                        "ef_construction": 128,
+                        "m": 16
+                    }
+                }
+            }
+        }
+    }
+
     def ensure_index_exists(self):
         index_name = Config.COLLECTION_INDEX_NAME
-        if not self.client.indices.exists(index=index_name):
+        if self.client.indices.exists(index=index_name):
+            # 旧版本创建的索引: 补上新增的字段, 已有字段不变
+            try:
+                self.client.indices.put_mapping(index=index_name, body={
+                    "properties": {
+                        "fingerprint": {"type": "keyword"},
+                        "images": self.IMAGES_MAPPING
+                    }
+                })
+            except Exception as e:
+                print(f"Warning: Error updating index mapping: {str(e)}")
+        else:
             settings = {
                 "settings": {
                     "index": {
@@ -60,6 +101,8 @@ class OpenSearchClient:
                         "rating_number": {"type": "integer"},
                         "store": {"type": "keyword"},
                         "image_url": {"type": "keyword"},
+                        "fingerprint": {"type": "keyword"},
+                        "images": self.IMAGES_MAPPING,
                         "image_embedding": {
                             "type": "knn_vector",
                             "dimension": 1024,
@@ -94,23 +137,27 @@ class OpenSearchClient:
             except Exception as e:
                 raise Exception(f"Error creating index: {str(e)}")
 
+    # 向量字段及其维度
+    VECTOR_FIELDS = {
+        'description_embedding': Config.TEXT_VECTOR_DIMENSION,
+        'image_embedding': Config.IMAGE_VECTOR_DIMENSION
+    }
+
+    def validate_document(self, document):
+        """校验向量维度(包括每张图片的向量); 文档原样写入, 不做任何复制或转换"""
+        embeddings = [(field, document.get(field), dimension) for field, dimension in self.VECTOR_FIELDS.items()]
+        embeddings += [('images.embedding', image.get('embedding'), Config.IMAGE_VECTOR_DIMENSION) for image in document.get('images', [])]
+        for field, embedding, dimension in embeddings:
+            if embedding is None:
+                continue
+            if not isinstance(embedding, list) or len(embedding) != dimension:
+                size = len(embedding) if isinstance(embedding, list) else type(embedding).__name__
+                raise ValueError(f"{field} dimension mismatch. Expected {dimension}, got {size}")
+
     def index_document(self, document):
         index_name = Config.COLLECTION_INDEX_NAME
         try:
-            if 'description_embedding' in document:
-                embedding = document['description_embedding']
-                if len(embedding) != 1536:
-                    raise ValueError(f"Description embedding dimension mismatch. Expected 1536, got {len(embedding)}")
-                document['description_embedding'] = np.array(embedding, dtype=np.float32).tolist()
-            
-            if 'image_embedding' in document:
-                embedding = document['image_embedding']
-                if len(embedding) != 1024:
-                    raise ValueError(f"Image embedding dimension mismatch. Expected 1024, got {len(embedding)}")
-                document['image_embedding'] = np.array(embedding, dtype=np.float32).tolist()
-
-            document_json = json.dumps(document)
-            document = json.loads(document_json)
+            self.validate_document(document)
             
             response = self.client.index(
                 index=index_name,
@@ -120,3 +167,108 @@ class OpenSearchClient:
             return response
         except Exception as e:
             raise Exception(f"Error indexing document: {str(e)}")
+
+    def get_documents(self, ids, fields):
+        """批量读取已有文档(mget), 只返回fields中的字段; 返回id -> _source, 不存在的id不在结果中"""
+        if not ids:
+            return {}
+        response = self.client.mget(
+            index=Config.COLLECTION_INDEX_NAME,
+            body={'ids': list(ids)},
+            params={'_source_includes': ",".join(fields)}
+        )
+        return {doc['_id']: doc.get('_source', {}) for doc in response['docs'] if doc.get('found')}
+
+    def bulk_index(self, documents, op='index'):
+        """
+        批量写入文档, 返回与输入顺序一致的bulk items; 单个文档的错误在item的error中.
+        op='update'时按id部分更新已有文档
+        """
+        items = [None] * len(documents)
+        valid = []
+        for i, document in enumerate(documents):
+            try:
+                self.validate_document(document)
+                valid.append((i, document))
+            except Exception as e:
+                items[i] = {op: {'_id': document.get('id'), 'status': 400, 'error': str(e)}}
+        response = self.bulk_indexer.index([document for _, document in valid], op=op)
+        for (i, _), item in zip(valid, response['items']):
+            items[i] = item
+        errors = sum(1 for item in items if 'error' in item[op])
+        return {"errors": errors > 0, "items": items, "failed": errors}
+
+    def bulk_writer(self, on_result, max_docs=None, max_seconds=None):
+        """按数量或时间自动批量写入的BulkWriter"""
+        return BulkWriter(
+            self,
+            on_result,
+            max_docs or Config.BULK_MAX_DOCS * Config.BULK_WORKERS,
+            Config.BULK_FLUSH_SECONDS if max_seconds is None else max_seconds
+        )
+
+    def bulk_load(self, force_merge=False):
+        """导入期间关闭refresh和副本, 结束后恢复为配置的INDEX_REFRESH_INTERVAL和INDEX_NUMBER_OF_REPLICAS"""
+        return self.bulk_indexer.bulk_load_settings(force_merge, {
+            'refresh_interval': Config.INDEX_REFRESH_INTERVAL,
+            'number_of_replicas': Config.INDEX_NUMBER_OF_REPLICAS
+        })
+
+class BulkWriter:
+    """
+    缓冲文档, 达到max_docs或最早的文档等待超过max_seconds时批量写入.
+
+    add(key, document, op='update')的文档按id部分更新已有文档, 其余的整体写入.
+    每个文档写入后调用on_result(key, error), 成功时error为None. 写入在锁内串行执行,
+    所以回调不会并发; 后台线程负责按时间flush, 即使没有新文档进入也会写出.
+    """
+    def __init__(self, client, on_result, max_docs, max_seconds):
+        self.client = client
+        self.on_result = on_result
+        self.max_docs = max_docs
+        self.max_seconds = max_seconds
+        self._entries = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_on_age, name="bulk-writer", daemon=True)
+        self._timer.start()
+
+    def add(self, key, document, op='index'):
+        with self._lock:
+            if not self._entries:
+                self._oldest = time.time()
+            self._entries.append((key, document, op))
+            if len(self._entries) >= self.max_docs:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._entries:
+            return
+        entries, self._entries, self._oldest = self._entries, [], None
+        for op in ('index', 'update'):
+            batch = [(key, document) for key, document, entry_op in entries if entry_op == op]
+            if not batch:
+                continue
+            try:
+                response = self.client.bulk_index([document for _, document in batch], op)
+                errors = [next(iter(item.values())).get('error') for item in response['items']]
+            except Exception as e:
+                errors = [f"Error indexing document: {str(e)}"] * len(batch)
+            for (key, _), error in zip(batch, errors):
+                self.on_result(key, None if error is None else str(error))
+
+    def _flush_on_age(self):
+        while not self._closed.wait(min(1.0, max(0.1, self.max_seconds))):
+            with self._lock:
+                if self._oldest is not None and time.time() - self._oldest >= self.max_seconds:
+                    self._flush()
+
+    def close(self):
+        self._closed.set()
+        self._timer.join()
+        self.flush()
@@ -0,0 +1,119 @@
+import time
+import random
+import threading
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+# Bedrock错误码: 限流, 以及可以重试的临时错误
+THROTTLING_ERRORS = {'ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException'}
+TRANSIENT_ERRORS = {'ServiceUnavailableException', 'InternalServerException', 'ModelTimeoutException', 'ModelNotReadyException'}
+
+def error_code(e):
+    return e.response.get('Error', {}).get('Code') if isinstance(e, ClientError) else None
+
+class AdaptiveRateLimiter:
+    """
+    多个线程共享的令牌桶, 速率按AIMD调整: 每次成功加法增长(约每秒增加increase次/秒),
+    被限流或延迟明显升高时乘法减小. 一个cooldown内最多减小一次, 同时返回的一批限流不会把速率压到最低.
+
+    call()在限流和临时错误时按带抖动的指数退避重试; stats()返回当前速率、每秒请求数、
+    限流比例和正在进行的请求数.
+    """
+    def __init__(self, initial_rate=5.0, min_rate=0.5, max_rate=50.0, burst=None, increase=2.0, decrease=0.5,
+                 latency_factor=2.0, cooldown=1.0, max_retries=6, base_delay=0.5, max_delay=30.0, window=60.0):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._latency = None
+        self._baseline = None
+        self._in_flight = 0
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def _capacity(self):
+        return self.burst or max(1.0, self.rate)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _record(self, now, throttled):
+        self._events.append((now, throttled))
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    def _decrease(self, now, factor):
+        if now - self._last_decrease >= self.cooldown:
+            self.rate = max(self.min_rate, self.rate * factor)
+            self._last_decrease = now
+
+    def release(self, latency=None, throttled=False):
+        with self._lock:
+            now = time.monotonic()
+            self._in_flight -= 1
+            self._record(now, throttled)
+            if throttled:
+                self._decrease(now, self.decrease)
+                return
+            if latency is not None:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                self._baseline = self._latency if self._baseline is None else min(self._baseline, self._latency)
+                if self._latency > self.latency_factor * self._baseline:
+                    # 延迟升高说明已接近服务端的容量, 轻微回退
+                    self._decrease(now, 0.9)
+                    return
+            self.rate = min(self.max_rate, self.rate + self.increase / max(self.rate, 1.0))
+
+    def call(self, fn, *args, **kwargs):
+        """限速调用fn, 限流和临时错误按带抖动的指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                code = error_code(e)
+                self.release(throttled=code in THROTTLING_ERRORS)
+                if attempt == self.max_retries or (code not in THROTTLING_ERRORS and code not in TRANSIENT_ERRORS):
+                    raise
+                time.sleep(min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.5))
+                continue
+            self.release(latency=time.monotonic() - started)
+            return result
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._events and self._events[0][0] < now - self.window:
+                self._events.popleft()
+            total = len(self._events)
+            throttled = sum(1 for _, t in self._events if t)
+            span = min(self.window, max(1e-6, now - self._events[0][0])) if self._events else self.window
+            return {
+                'rate_limit': round(self.rate, 2),
+                'requests_per_second': round(total / span, 2),
+                'throttle_rate': round(throttled / total, 3) if total else 0.0,
+                'in_flight': self._in_flight
+            }
@@ -0,0 +1,191 @@
+import io
+import os
+import json
+import gzip
+
+from import_pipeline import shard_range
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# process_record只用到这些字段, 其余字段在解析后立即丢弃
+RECORD_FIELDS = (
+    'parent_asin', 'title', 'features', 'description', 'main_category', 'categories',
+    'images', 'price', 'average_rating', 'rating_number', 'store'
+)
+
+def project(record, fields=RECORD_FIELDS):
+    return {field: record[field] for field in fields if field in record}
+
+class JsonLinesReader:
+    """
+    逐批读取未压缩的JSONL文件. 位置是字节偏移, 可以直接seek续传, 也可以按字节区间分片.
+    records(start, end)产出(结束位置, 记录, 错误), 记录只保留fields中的字段.
+    """
+    unit = 'B'
+    seekable = True
+
+    def __init__(self, path, fields=RECORD_FIELDS, batch_bytes=4 * 1024 * 1024):
+        self.path = path
+        self.fields = fields
+        self.batch_bytes = batch_bytes
+        self._file = self._open()
+
+    def _open(self):
+        return open(self.path, 'rb')
+
+    @property
+    def total(self):
+        return os.path.getsize(self.path)
+
+    def shard_range(self, shards, shard_id):
+        return shard_range(self._file, self.total, shards, shard_id)
+
+    def _seek(self, position):
+        self._file.seek(position)
+
+    def offset_of_line(self, line_number, start=0):
+        """从start开始跳过line_number行之后的位置, 用于只有行号的旧进度文件"""
+        self._seek(start)
+        position = start
+        for _ in range(line_number):
+            line = self._file.readline()
+            if not line:
+                break
+            position += len(line)
+        return position
+
+    def _parse(self, line):
+        try:
+            record = loads(line)
+        except ValueError as e:
+            return None, f"Error parsing JSON: {str(e)}"
+        if not isinstance(record, dict):
+            return None, "Error parsing JSON: not an object"
+        return project(record, self.fields), None
+
+    def records(self, start=0, end=None):
+        self._seek(start)
+        position = start
+        while True:
+            lines = self._file.readlines(self.batch_bytes)
+            if not lines:
+                return
+            for line in lines:
+                if end is not None and position >= end:
+                    return
+                position += len(line)
+                record, error = self._parse(line)
+                yield position, record, error
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class CompressedJsonLinesReader(JsonLinesReader):
+    """
+    流式解压gzip/zstd压缩的JSONL, 不需要先解压到磁盘. 位置是解压后的字节偏移;
+    续传时从头解压并跳过已处理的部分(不解析), 不支持分片.
+    """
+    seekable = False
+
+    def _open(self):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'rb')
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstd input needs the zstandard package installed")
+        raw = open(self.path, 'rb')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), buffer_size=1024 * 1024)
+
+    @property
+    def total(self):
+        # 解压后的大小事先不知道
+        return None
+
+    def shard_range(self, shards, shard_id):
+        raise ValueError("Sharding needs an uncompressed JSONL or a Parquet file")
+
+    def _seek(self, position):
+        self._file.close()
+        self._file = self._open()
+        while position > 0:
+            skipped = len(self._file.read(min(position, self.batch_bytes)))
+            if not skipped:
+                break
+            position -= skipped
+
+class ParquetReader:
+    """
+    按row group读取Parquet快照, 只读取fields中存在的列. 位置是行号;
+    续传和分片时整块跳过之前的row group.
+    """
+    unit = 'records'
+    seekable = True
+
+    def __init__(self, path, fields=RECORD_FIELDS, batch_size=1024):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Parquet input needs pyarrow installed")
+        self.path = path
+        self.batch_size = batch_size
+        self._file = pq.ParquetFile(path)
+        names = set(self._file.schema_arrow.names)
+        self.columns = [field for field in fields if field in names]
+
+    @property
+    def total(self):
+        return self._file.metadata.num_rows
+
+    def shard_range(self, shards, shard_id):
+        return self.total * shard_id // shards, self.total * (shard_id + 1) // shards
+
+    def offset_of_line(self, line_number, start=0):
+        return min(self.total, start + line_number)
+
+    def records(self, start=0, end=None):
+        end = self.total if end is None else end
+        row = 0
+        for group in range(self._file.num_row_groups):
+            group_rows = self._file.metadata.row_group(group).num_rows
+            if row + group_rows <= start:
+                row += group_rows
+                continue
+            if row >= end:
+                return
+            table = self._file.read_row_group(group, columns=self.columns)
+            for batch in table.to_batches(self.batch_size):
+                for record in batch.to_pylist():
+                    if start <= row < end:
+                        # 缺失的列在Parquet中是null, 按JSON中不存在该字段处理
+                        yield row + 1, {field: value for field, value in record.items() if value is not None}, None
+                    row += 1
+                    if row >= end:
+                        return
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def open_reader(path):
+    """按扩展名选择: .parquet, .gz / .zst / .zstd压缩的JSONL, 其他按未压缩JSONL读取"""
+    if path.endswith('.parquet'):
+        return ParquetReader(path)
+    if path.endswith(('.gz', '.zst', '.zstd')):
+        return CompressedJsonLinesReader(path)
+    return JsonLinesReader(path)
@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import random
+import tempfile
+from types import SimpleNamespace
+from pathlib import Path
+
+# Add batch_import directory to Python path
+batch_import_path = str(Path(__file__).parent.parent)
+if batch_import_path not in sys.path:
+    sys.path.insert(0, batch_import_path)
+
+from import_pipeline import shard_range, CommitTracker
+from record_readers import JsonLinesReader
+from batch_import_to_opensearch import BatchImporter
+
+def write_jsonl(path, count, seed=7):
+    """Lines of very different lengths, so equal byte cuts land in the middle of lines"""
+    rng = random.Random(seed)
+    offsets = []
+    with open(path, 'wb') as f:
+        for number in range(1, count + 1):
+            record = {'parent_asin': f"A{number}", 'title': "x" * rng.randint(0, 400)}
+            f.write((json.dumps(record) + "\n").encode('utf-8'))
+            offsets.append(f.tell())
+    # offsets[i] is the byte offset just past line i + 1
+    return offsets
+
+def read_asins(reader, start, end):
+    return [record['parent_asin'] for _, record, _ in reader.records(start, end)]
+
+class ImportResumeTest:
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="import_resume_test_")
+        self.path = os.path.join(self.directory, "records.jsonl")
+        self.count = 500
+        self.offsets = write_jsonl(self.path, self.count)
+        self.line_starts = {0} | set(self.offsets)
+
+    def test_shard_boundaries_cut_mid_line(self):
+        """Every shard starts at a line start and each line is read by exactly one shard"""
+        size = os.path.getsize(self.path)
+        with JsonLinesReader(self.path) as reader, open(self.path, 'rb') as f:
+            for shards in [1, 2, 3, 7, 64, 499, 800]:
+                ranges = [shard_range(f, size, shards, shard_id) for shard_id in range(shards)]
+                mid_line_cuts = sum(1 for shard_id in range(1, shards) if size * shard_id // shards not in self.line_starts)
+                if ranges[0][0] != 0 or ranges[-1][1] != size:
+                    return False
+                if any(end != next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:])):
+                    return False
+                if any(start not in self.line_starts for start, _ in ranges):
+                    return False
+                asins = [asin for start, end in ranges for asin in read_asins(reader, start, end)]
+                if asins != [f"A{number}" for number in range(1, self.count + 1)]:
+                    return False
+                print(f"{shards} shards: {mid_line_cuts} cuts moved to the next line start")
+        return True
+
+    def test_watermark_with_gaps(self):
+        """The checkpoint only moves past lines that are committed with everything before them"""
+        tracker = CommitTracker()
+        for line in [2, 5, 1, 4]:
+            tracker.commit(line, self.offsets[line - 1])
+        if (tracker.watermark, tracker.offset) != (2, self.offsets[1]):
+            return False
+        tracker.commit(3, self.offsets[2])
+        if (tracker.watermark, tracker.offset) != (5, self.offsets[4]):
+            return False
+        # Lines committed without an offset keep the last known one
+        tracker.commit(7, self.offsets[6])
+        tracker.commit(6, None)
+        print(f"watermark {tracker.watermark}, offset {tracker.offset}")
+        return (tracker.watermark, tracker.offset) == (7, self.offsets[6])
+
+    def test_resume_from_saved_offset(self):
+        """Lines finished out of order, interrupted, saved, and resumed: every line is covered, none before the watermark twice"""
+        size = os.path.getsize(self.path)
+        progress = SimpleNamespace(progress_file=os.path.join(self.directory, "import_progress.shard-1-of-3.txt"))
+        with JsonLinesReader(self.path) as reader:
+            start, end = reader.shard_range(3, 1)
+            first_line = self.offsets.index(start) + 2 if start else 1
+            # First run: read 60 lines of the shard, finish all but a few of them, then stop
+            tracker = CommitTracker(first_line - 1, start)
+            read = []
+            for number, (position, record, _) in enumerate(reader.records(start, end)):
+                read.append((first_line + number, position, record['parent_asin']))
+                if len(read) == 60:
+                    break
+            unfinished = {first_line + 10, first_line + 30}
+            for line, position, _ in reversed(read):
+                if line not in unfinished:
+                    tracker.commit(line, position)
+            BatchImporter.save_progress(progress, tracker.watermark, tracker.offset)
+
+            # Second run: load the checkpoint and continue from its byte offset
+            line, offset = BatchImporter.get_last_processed_line(progress)
+            if (line, offset) != (first_line + 9, self.offsets[first_line + 8]):
+                return False
+            if reader.offset_of_line(line - (first_line - 1), start) != offset:
+                return False
+            resumed = read_asins(reader, offset, end)
+            expected = read_asins(reader, start, end)
+        committed = [asin for number, _, asin in read if number <= line]
+        print(f"shard {start}-{end} of {size} bytes: {len(committed)} committed, {len(resumed)} resumed")
+        return committed + resumed == expected and resumed[0] == f"A{first_line + 10}"
+
+def main():
+    test = ImportResumeTest()
+    for name in ["test_shard_boundaries_cut_mid_line", "test_watermark_with_gaps", "test_resume_from_saved_offset"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,21 @@
-import copy
 import base64
 import uuid
+import time
 import logging
 import datetime
 from fastapi import FastAPI, HTTPException, Request, UploadFile
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import traceback
 import json
 import jsonlines
 
 from models.api_response import APIResponse
-from models.request_models import ImageUploadRequest, ImageUpdateRequest, ImageSearchRequest, BatchUploadRequest, BatchDescnEnrichRequest, CheckBatchJobStateRequest, BatchEmbeddingRequest
+from models.request_models import ImageUploadRequest, AsyncImageUploadRequest, PresignedUploadRequest, ImageUpdateRequest, ImageSearchRequest, BatchUploadRequest, BatchDescnEnrichRequest, PipelineCreateRequest, CheckBatchJobStateRequest, BatchEmbeddingRequest
 from utils.config import Config
 from utils.aws_client_factory import AWSClientFactory
-from utils.get_image_mime_type import get_image_mime_type
+from utils.image_quality import create_quality_gate
 from utils.exceptions import (
     ImageProcessingError,
     ImageUploadError,
@@ -25,8 +26,17 @@ from utils.exceptions import (
 from services.opensearch_client import OpenSearchClient
 from services.embedding_generator import EmbeddingGenerator
 from services.image_retrieve import ImageRetrieve
-from services.img_descn_generator import enrich_image_desc, description_generator_invocation_job
 from services.image_rerank import ImageRerank
+from services.image_ingestor import ImageIngestor
+from services.ingestion_queue import SqsIngestionQueue, create_ingestion_queue
+from services.ingestion_worker import IngestionWorker
+from services.s3_event_ingestor import S3EventIngestor
+from services.batch_payload_builder import BatchPayloadBuilder
+from services.batch_pipeline import BatchPipeline
+from services.pipeline_orchestrator import PipelineOrchestrator
+from services.manifest_store import create_manifest_store
+from services.batch_enrichment import CheckpointedEnrichment
+from services.enrichment_router import ENRICHMENT_MODES
 
 # Configure logging
 logger = logging.getLogger()
@@ -48,6 +58,50 @@ bedrock_client = AWSClientFactory.create_bedrock_runtime_client()
 opensearch_client = OpenSearchClient()
 embedding_generator = EmbeddingGenerator(bedrock_client)
 image_retrieve = ImageRetrieve(embedding_generator, opensearch_client)
+quality_gate = create_quality_gate()
+image_ingestor = ImageIngestor(s3_client, embedding_generator, quality_gate, opensearch_client)
+ingestion_queue = create_ingestion_queue(s3_client)
+ingestion_worker = IngestionWorker(
+    ingestion_queue,
+    image_ingestor,
+    opensearch_client,
+    max_workers=Config.INGEST_WORKERS,
+    bulk_max_docs=Config.INGEST_BULK_MAX_DOCS,
+    bulk_max_wait_seconds=Config.INGEST_BULK_MAX_WAIT_SECONDS
+)
+batch_payload_builder = BatchPayloadBuilder(
+    s3_client,
+    image_ingestor,
+    max_workers=Config.BATCH_FETCH_WORKERS,
+    part_size=Config.BATCH_MULTIPART_PART_SIZE
+)
+batch_pipeline = BatchPipeline(s3_client, embedding_generator, opensearch_client, image_ingestor, batch_payload_builder)
+pipeline_store = create_manifest_store(s3_client, Config.PIPELINE_MANIFEST_PREFIX, Config.PIPELINE_MANIFEST_DIR)
+pipeline_orchestrator = PipelineOrchestrator(
+    s3_client,
+    AWSClientFactory.create_bedrock_client(),
+    batch_pipeline,
+    pipeline_store,
+    max_concurrent_jobs=Config.PIPELINE_MAX_CONCURRENT_JOBS,
+    poll_min_seconds=Config.PIPELINE_POLL_MIN_SECONDS,
+    poll_max_seconds=Config.PIPELINE_POLL_MAX_SECONDS,
+    list_chunk_records=Config.PIPELINE_LIST_CHUNK_RECORDS,
+    lease_seconds=Config.PIPELINE_LEASE_SECONDS
+)
+batch_enrichment = CheckpointedEnrichment(
+    s3_client,
+    AWSClientFactory.create_bedrock_client(),
+    batch_pipeline,
+    create_manifest_store(s3_client, Config.ENRICH_CHECKPOINT_PREFIX, Config.ENRICH_CHECKPOINT_DIR),
+    plan_chunk_records=Config.ENRICH_PLAN_CHUNK_RECORDS
+)
+s3_event_ingestor = S3EventIngestor(
+    s3_client,
+    image_ingestor,
+    opensearch_client,
+    max_workers=Config.S3_EVENT_WORKERS,
+    bulk_max_docs=Config.INGEST_BULK_MAX_DOCS
+)
 
 logger.info("Initializing application and clients")
 
@@ -59,6 +113,32 @@ except Exception as e:
     logger.error(f"Failed to ensure OpenSearch index exists: {str(e)}")
     raise
 
+# Resume ingestion items persisted by a previous process; SQS redelivers them by itself
+if ingestion_queue.local and (ingestion_queue.recover() or ingestion_queue.has_pending()):
+    ingestion_worker.start()
+
+# Resume local pipelines that were still running when the previous process stopped; deployed
+# pipelines are stepped by the scheduled tick and /advance, since Lambda freezes background threads
+if pipeline_store.local:
+    try:
+        resumed = pipeline_orchestrator.resume_all()
+        if resumed:
+            logger.info(f"Resumed {resumed} batch pipelines")
+    except Exception as e:
+        logger.error(f"Failed to resume batch pipelines: {str(e)}")
+
+def distribution_url(image_path):
+    """
+    Map a stored image path (an object key such as images/{sha256}.jpg, or an
+    s3://bucket/key URI from the batch pipeline) to its CloudFront URL.
+    """
+    key = image_path.replace(f"s3://{Config.BUCKET_NAME}/", "").lstrip('/')
+    return f"{Config.DDSTRIBUTION_DOMAIN.rstrip('/')}/{key}"
+
+def rendition_urls(result):
+    """Map the rendition S3 keys of a search hit to CloudFront URLs."""
+    return {name: distribution_url(key) for name, key in (result.get('renditions') or {}).items()}
+
 @app.exception_handler(ImageProcessingError)
 async def image_processing_exception_handler(request: Request, exc: ImageProcessingError):
     logger.error(f"ImageProcessingError: {exc.detail}")
@@ -93,76 +173,34 @@ async def upload_image(request: ImageUploadRequest) -> APIResponse:
     logger.info("Starting image upload process")
     try:
         # Validate image data
-        try:
-            image_data = base64.b64decode(request.image)
-            logger.info("Image data successfully decoded")
-        except Exception as e:
-            logger.error(f"Failed to decode image data: {str(e)}")
-            raise ImageUploadError("Invalid image data format", {"detail": str(e)})
+        image_data = image_ingestor.decode_image(request.image)
 
         image_id = str(uuid.uuid4())
-        s3_key = f'images/{image_id}'
         logger.info(f"Generated image ID: {image_id}")
 
-        # Upload to S3
-        try:
-            s3_client.put_object(
-                Bucket=Config.BUCKET_NAME,
-                Key=s3_key,
-                Body=image_data,
-                ContentType='image/jpeg'
-            )
-            logger.info(f"Successfully uploaded image to S3: {s3_key}")
-        except Exception as e:
-            logger.error(f"Failed to upload image to S3: {str(e)}")
-            raise ImageUploadError("Failed to upload image to S3", {"detail": str(e)})
-        
-        # Get description
-        description = ''
-        if request.description == '':
-            # Generate description
-            try:
-                logger.info("Starting description generation")
-                description = enrich_image_desc(request.image)
-                logger.info("Successfully generated description")
-            except Exception as e:
-                logger.error(f"Failed to generate description: {str(e)}")
-                raise ImageUploadError("Failed to generate description", {"detail": str(e)})
-        else:
-            description = request.description
-        # Generate embedding
+        # Skip blank, tiny or corrupt images before any S3 write or Bedrock call
+        quality_flags = image_ingestor.check_quality(image_data)
+
+        # Upload to S3 under the content-addressed key
+        s3_key, content_hash, created = image_ingestor.store_image(image_data)
         try:
-            logger.info("Starting embedding generation")
-            embedding = embedding_generator.generate_embedding(request.image, description)
-            logger.info("Successfully generated image embedding")
-        except Exception as e:
-            tb_str = traceback.format_exc()
-            logger.error(f"Failed to generate image embedding: {str(e)}")
-            print(tb_str)
-            raise ImageUploadError("Failed to generate image embedding", {"detail": str(e)})
+            rendition_keys, embed_base64 = image_ingestor.store_renditions(content_hash, image_data)
+
+            # Get description and embedding from the 320 px rendition
+            document = image_ingestor.build_document(image_id, embed_base64, request.description, s3_key, rendition_keys, content_hash, quality_flags)
+        except ImageProcessingError:
+            image_ingestor.discard_image(s3_key, content_hash, created)
+            raise
 
         # Index in OpenSearch
         try:
-            dt = datetime.datetime.now().isoformat()
-            document = {
-                    'id': image_id,
-                    'description': description,
-                    'embedding': embedding,
-                    'createtime': dt,
-                    'image_path': s3_key
-            }                           
             logger.info(f"Indexing document in OpenSearch: {image_id}")
             _ret = opensearch_client.index_document(document)
             logger.info(f"Successfully indexed document in OpenSearch: {image_id}")
         except Exception as e:
             logger.error(f"Failed to index document in OpenSearch: {str(e)}")
-            # Clean up S3 object if OpenSearch indexing fails
-            try:
-                logger.info(f"Attempting to clean up S3 object after failed indexing: {s3_key}")
-                s3_client.delete_object(Bucket=Config.BUCKET_NAME, Key=s3_key)
-                logger.info(f"Successfully cleaned up S3 object: {s3_key}")
-            except Exception as cleanup_error:
-                logger.error(f"Failed to clean up S3 object: {str(cleanup_error)}")
+            # Clean up S3 objects if OpenSearch indexing fails
+            image_ingestor.discard_image(s3_key, content_hash, created)
             raise OpenSearchError("Failed to index image metadata", {"detail": str(e)})
 
         logger.info(f"Image upload process completed successfully: {image_id}")
@@ -176,61 +214,136 @@ async def upload_image(request: ImageUploadRequest) -> APIResponse:
         logger.error(f"Unexpected error during image upload: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/images/async")
+async def upload_images_async(request: AsyncImageUploadRequest) -> APIResponse:
+    logger.info(f"Queueing {len(request.images)} images for async ingestion")
+    try:
+        if not request.images:
+            raise InvalidRequestError("At least one image must be provided", {"images": 0})
+        payloads = []
+        for image in request.images:
+            # Reject undecodable payloads up front instead of failing in the worker
+            image_ingestor.decode_image(image.image)
+            payloads.append({
+                "image_id": str(uuid.uuid4()),
+                "image": image.image,
+                "description": image.description,
+                "tags": image.tags
+            })
+        job = await run_in_threadpool(ingestion_queue.enqueue, payloads)
+        if ingestion_queue.local:
+            ingestion_worker.start()
+            ingestion_worker.notify()
+        logger.info(f"Queued ingestion job {job['job_id']}")
+        return APIResponse.accepted(
+            message="Images accepted for ingestion",
+            data={
+                "job_id": job["job_id"],
+                "item_ids": job["item_ids"],
+                "image_ids": [payload["image_id"] for payload in payloads]
+            }
+        )
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error during async image upload: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/images/jobs/{job_id}")
+async def get_ingestion_job(job_id: str) -> APIResponse:
+    status = await run_in_threadpool(ingestion_queue.get_job_status, job_id)
+    if status is None:
+        raise ImageProcessingError(
+            status_code=404,
+            error_code="JOB_NOT_FOUND",
+            message=f"Ingestion job {job_id} not found",
+            details={"job_id": job_id}
+        )
+    return APIResponse.success(
+        message="Ingestion job status",
+        data=status
+    )
+
+@app.post("/images/upload-urls")
+async def create_upload_urls(request: PresignedUploadRequest) -> APIResponse:
+    logger.info(f"Creating {request.count} presigned upload URLs")
+    if request.count < 1 or request.count > Config.PRESIGNED_URL_MAX_COUNT:
+        raise InvalidRequestError(
+            f"count must be between 1 and {Config.PRESIGNED_URL_MAX_COUNT}",
+            {"count": request.count}
+        )
+    if not request.content_type.startswith("image/"):
+        raise InvalidRequestError("content_type must be an image MIME type", {"content_type": request.content_type})
+    try:
+        uploads = []
+        for _ in range(request.count):
+            image_id = str(uuid.uuid4())
+            s3_key = f"{Config.DIRECT_UPLOAD_PREFIX}{image_id}"
+            url = s3_client.generate_presigned_url(
+                "put_object",
+                Params={
+                    "Bucket": Config.BUCKET_NAME,
+                    "Key": s3_key,
+                    "ContentType": request.content_type
+                },
+                ExpiresIn=Config.PRESIGNED_URL_EXPIRES_SECONDS
+            )
+            uploads.append({
+                "image_id": image_id,
+                "key": s3_key,
+                "url": url,
+                "headers": {"Content-Type": request.content_type}
+            })
+        return APIResponse.success(
+            message="Presigned upload URLs created",
+            data={"expires_in": Config.PRESIGNED_URL_EXPIRES_SECONDS, "uploads": uploads}
+        )
+    except Exception as e:
+        logger.error(f"Failed to create presigned upload URLs: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/events")
+async def handle_events(request: Request):
+    # Non-HTTP invocations (S3/SQS events) are forwarded here by the Lambda Web Adapter
+    event = await request.json()
+    if event.get("source") == "aws.events":
+        # Scheduled tick: advance running batch pipelines (deployed pipelines have no runner thread)
+        # and continue checkpointed enrichments
+        deadline = time.time() + Config.ENRICH_TIME_BUDGET_SECONDS
+        states = await run_in_threadpool(pipeline_orchestrator.step_all, deadline)
+        logger.info(f"Advanced {len(states)} batch pipelines")
+        enrichments = await run_in_threadpool(batch_enrichment.run_all, deadline)
+        return JSONResponse(content={"pipelines": states, "enrichments": enrichments})
+    if SqsIngestionQueue.is_ingest_event(event):
+        # Async uploads queued by POST /images/async, processed before this invocation returns
+        result = await run_in_threadpool(ingestion_worker.handle, event)
+        logger.info(f"Indexed {result['indexed']} of {result['processed']} queued images")
+        return JSONResponse(content=result)
+    result = await run_in_threadpool(s3_event_ingestor.handle, event)
+    logger.info(f"Indexed {result['indexed']} of {result['processed']} uploaded objects")
+    return JSONResponse(content=result)
+
 @app.post("/images/batch-upload")
 async def batch_upload(request: BatchUploadRequest) -> APIResponse:
     logger.info("Starting batch upload process")
     try:
-        jobArn_list = request.batch_embedding_output["jobArn_list"]
         error_list = [] # To store images without generated description
-        for jobArn in jobArn_list:
-            # One job is one batch
-            documents = []
-            job_output = request.batch_embedding_output[jobArn]
-            output_directory = job_output["output"]
-            image_s3_uris_path = job_output["image_s3_uris"]
-            # Get batch inference output: output_json_list
-            s3_folder_prefix = output_directory.replace("s3://"+Config.BUCKET_NAME+"/","")
-            s3_folder_prefix = s3_folder_prefix + jobArn.split("/")[-1] + "/"
-            s3_key = s3_folder_prefix + output_directory.split("/")[-2] + ".jsonl.out"
-            response = s3_client.get_object(Bucket=Config.BUCKET_NAME,Key=s3_key)
-            file_content = response["Body"].read().decode("utf-8")
-            file_content_list = file_content.split("\n")[:-1]
-            output_json_list = []
-            for content in file_content_list:
-                output_json_list.append(json.loads(content))
-            # Get image s3 uris
-            s3_key = image_s3_uris_path.replace("s3://"+Config.BUCKET_NAME+"/","")
-            response = s3_client.get_object(Bucket=Config.BUCKET_NAME,Key=s3_key)
-            file_content = response["Body"].read().decode("utf-8")
-            s3_uris_json = json.loads(file_content)
-            # Construct documents
-            image_num = 0
-            if len(s3_uris_json) != len(output_json_list):
-                raise HTTPException(status_code=500, detail=f"The number of s3 uris is {len(s3_uris_json)} while there are {len(output_json_list)} outputs.")
-            else:
-                image_num = len(output_json_list)
-                logger.info(f"Bulk uploading {str(image_num)} images.")
-            for i in range(image_num):
-                if "error" in output_json_list[i]:
-                    error_list.append(s3_uris_json[output_json_list[i]["recordId"]])
-                    continue
-                dt = datetime.datetime.now().isoformat()
-                document = {
-                    'description': output_json_list[i]["modelInput"]["inputText"],
-                    'embedding': output_json_list[i]["modelOutput"]['embedding'],
-                    'createtime': dt,
-                    'image_path': s3_uris_json[output_json_list[i]["recordId"]]
-                }
-                documents.append(document)
-            # bulk index
-            try:
-                logger.info("Starting bulk indexing")
-                response = opensearch_client.bulk_upload(documents)
-                logger.info(response)
-                logger.info(f"Successfully bulk index {str(len(documents))} images in batch {jobArn}")
-            except Exception as e:
-                logger.error(f"Batch upload failed in OpenSearch: {str(e)}")
-                raise OpenSearchError("Batch upload failed in OpenSearch:", {"detail": str(e)})
+        def index_jobs():
+            # One job is one batch; batches are read and indexed concurrently
+            return batch_pipeline.map_jobs(
+                lambda jobArn, job: batch_pipeline.index_embedding_output(jobArn, job, request.generate_renditions),
+                request.batch_embedding_output
+            )
+
+        if request.bulk_load_settings:
+            def index_jobs_with_bulk_settings():
+                with opensearch_client.bulk_load(request.force_merge):
+                    return index_jobs()
+            results = await run_in_threadpool(index_jobs_with_bulk_settings)
+        else:
+            results = await run_in_threadpool(index_jobs)
+        for result in results.values():
+            error_list.extend(result["error_list"])
 
         return APIResponse.success(
             message="Batch upload completed successfully",
@@ -244,6 +357,13 @@ async def batch_upload(request: BatchUploadRequest) -> APIResponse:
         raise HTTPException(status_code=500, detail=f"Error in batch upload: {str(e)}")
 
 
+@app.get("/images/quality-stats")
+async def get_quality_stats() -> APIResponse:
+    return APIResponse.success(
+        message="Quality gate counters",
+        data={"mode": Config.QUALITY_GATE_MODE, **quality_gate.stats()}
+    )
+
 @app.put("/images")
 async def update_image(request: ImageUpdateRequest) -> APIResponse:
     logger.info(f"Starting image update process for ID: {request.image_id}")
@@ -316,8 +436,7 @@ async def search_images(request: ImageSearchRequest) -> APIResponse:
                     query_text=request.query_text,
                     query_image_base64=request.query_image
                 )
-            bucket_prefix = f"s3://{Config.BUCKET_NAME}/"
-            results = [{**result, "image_path": f"{Config.DDSTRIBUTION_DOMAIN}{result['image_path'].replace(bucket_prefix, '')}"} for result in reranked_results]
+            results = [{**result, "image_path": distribution_url(result['image_path']), "renditions": rendition_urls(result)} for result in reranked_results]
             sorted_results = sorted(results, key=lambda x: x['score'], reverse=True)
             return APIResponse.success(
                 message="Search completed successfully",
@@ -326,8 +445,7 @@ async def search_images(request: ImageSearchRequest) -> APIResponse:
         else:
             logger.info(f"type of rerank {type(request.rerank)}")
             logger.info("Search without reranking")
-            bucket_prefix = f"s3://{Config.BUCKET_NAME}"
-            results = [{**result, "image_path": f"{Config.DDSTRIBUTION_DOMAIN}{result['image_path'].replace(bucket_prefix, '')}"} for result in results]
+            results = [{**result, "image_path": distribution_url(result['image_path']), "renditions": rendition_urls(result)} for result in results]
             return APIResponse.success(
                 message="Search completed successfully",
                 data={"results": results}
@@ -342,6 +460,20 @@ async def search_images(request: ImageSearchRequest) -> APIResponse:
 async def delete_image(image_id: str) -> APIResponse:
     logger.info(f"Starting image deletion process for ID: {image_id}")
     try:
+        # Look up where the image is stored; direct uploads live outside images/
+        rendition_keys = {}
+        shared = False
+        try:
+            stored = opensearch_client.get_document(image_id)
+            s3_key = stored.get('image_path') or f'images/{image_id}'
+            s3_key = s3_key.replace(f"s3://{Config.BUCKET_NAME}/", "")
+            rendition_keys = stored.get('renditions') or {}
+            # Content-addressed objects are shared by every document with the same bytes
+            if stored.get('content_hash'):
+                shared = opensearch_client.count_by_content_hash(stored['content_hash']) > 1
+        except Exception:
+            s3_key = f'images/{image_id}'
+
         # Delete from OpenSearch
         try:
             logger.info(f"Deleting document from OpenSearch: {image_id}")
@@ -352,14 +484,19 @@ async def delete_image(image_id: str) -> APIResponse:
             raise ImageNotFoundError(image_id)
 
         # Delete from S3
+        if shared:
+            logger.info(f"Keeping S3 object still referenced by other documents: {s3_key}")
+            rendition_keys = {}
+            s3_key = None
         try:
-            s3_key = f'images/{image_id}'
-            logger.info(f"Deleting object from S3: {s3_key}")
-            s3_client.delete_object(
-                Bucket=Config.BUCKET_NAME,
-                Key=s3_key
-            )
-            logger.info(f"Successfully deleted object from S3: {s3_key}")
+            if s3_key:
+                logger.info(f"Deleting object from S3: {s3_key}")
+                s3_client.delete_object(
+                    Bucket=Config.BUCKET_NAME,
+                    Key=s3_key
+                )
+                logger.info(f"Successfully deleted object from S3: {s3_key}")
+            image_ingestor.delete_renditions(rendition_keys)
         except Exception as e:
             logger.error(f"Failed to delete object from S3: {str(e)}")
             raise ImageProcessingError(
@@ -383,84 +520,54 @@ async def delete_image(image_id: str) -> APIResponse:
 @app.post("/images/batch-descn-enrich")
 async def batch_descn_enrich(request: BatchDescnEnrichRequest) -> APIResponse:
     logger.info("Starting batch description enrichment process")
+    if request.mode is not None and request.mode not in ENRICHMENT_MODES:
+        raise ImageProcessingError(
+            status_code=400,
+            error_code="INVALID_MODE",
+            message=f"mode must be one of {', '.join(ENRICHMENT_MODES)}",
+            details={"mode": request.mode}
+        )
     try:
-        # Initialization: Create a reusable Paginator
-        paginator = s3_client.get_paginator('list_objects_v2')
-        first = True
-        next_token = None
-        response_data = {}
-        jobArn_list = []
-        batch_num = 0
-        pre_batch_base64_list = {}
-
-        while first or next_token:
-            logger.info(f"batch {str(batch_num)}")
-            first = False
-            # Create a PageIterator from the Paginator
-            page_iterator = paginator.paginate(
-                Bucket=Config.BUCKET_NAME,
-                Prefix=request.s3_folder_prefix,
-                PaginationConfig={'PageSize': request.batch_size,'StartingToken':next_token}
+        if request.checkpoint_id:
+            checkpoint = await run_in_threadpool(batch_enrichment.get, request.checkpoint_id)
+            if checkpoint is None:
+                raise ImageProcessingError(
+                    status_code=404,
+                    error_code="CHECKPOINT_NOT_FOUND",
+                    message=f"Enrichment checkpoint {request.checkpoint_id} not found",
+                    details={"checkpoint_id": request.checkpoint_id}
+                )
+            logger.info(f"Resuming enrichment {request.checkpoint_id} after batch {checkpoint['next_batch_num'] - 1}")
+        else:
+            checkpoint = await run_in_threadpool(batch_enrichment.create, {
+                "s3_folder_prefix": request.s3_folder_prefix,
+                "batch_size": request.batch_size,
+                "max_edge": Config.BATCH_IMAGE_MAX_EDGE if request.max_edge is None else request.max_edge,
+                "quality": request.quality or Config.BATCH_IMAGE_QUALITY,
+                "inventory_manifest": request.inventory_manifest,
+                "mode": request.mode or Config.ENRICH_DEFAULT_MODE,
+                "deadline_minutes": request.deadline_minutes
+            })
+        # Stop listing and creating batches early enough to return within the Lambda timeout
+        deadline = time.time() + Config.ENRICH_TIME_BUDGET_SECONDS
+        if request.plan_only:
+            # Report the job layout; a later call with checkpoint_id submits exactly this plan
+            checkpoint = await run_in_threadpool(batch_enrichment.plan, checkpoint["checkpoint_id"], deadline)
+            return APIResponse.success(
+                message="Batch description enrichment planned; call again with checkpoint_id to submit"
+                    if checkpoint["plan"] is not None
+                    else "Batch description enrichment listing checkpointed; call again with checkpoint_id and plan_only to continue",
+                data=CheckpointedEnrichment.response_data(checkpoint)
             )
+        checkpoint = await run_in_threadpool(batch_enrichment.run, checkpoint["checkpoint_id"], deadline)
 
-            # A page is one batch
-            for page in page_iterator:
-                # Get next token
-                is_truncated = page['IsTruncated']
-                if is_truncated:
-                    next_token = page['NextContinuationToken']
-                else:
-                    next_token = None
-                # Get batch image data
-                image_base64_list = {}
-                for obj in page['Contents']:
-                    # Get image base64
-                    s3_key = obj['Key']
-                    response = s3_client.get_object(Bucket=Config.BUCKET_NAME,Key=s3_key)
-                    streaming_body = response.get("Body").read()
-                    image_base64 = base64.b64encode(streaming_body).decode('utf-8')
-                    s3_uri = f"s3://{Config.BUCKET_NAME}/{s3_key}"
-                    # Get MIME type
-                    with open('/tmp/temp_image', 'wb') as f:
-                        s3_client.download_fileobj(Config.BUCKET_NAME, s3_key, f)
-                    mime_type = get_image_mime_type('/tmp/temp_image')
-                    # logger.info(f"MIME type: {mime_type}")
-                    image_base64_list[s3_uri] = {"base64": image_base64, "mime_type": mime_type}
-                
-                if len(pre_batch_base64_list) == 0:
-                    pre_batch_base64_list = copy.deepcopy(image_base64_list)
-                    continue
-                if len(image_base64_list) < 100:
-                    pre_batch_base64_list.update(image_base64_list)
-                    image_base64_list = {}
-                # Batch generate description
-                jobArn, output_s3_uri, s3_uris = description_generator_invocation_job(pre_batch_base64_list, batch_num)
-                # Update batch_num
-                batch_num += 1
-                # Construct response data
-                response_data[jobArn] = {"output": output_s3_uri,"image_s3_uris": s3_uris}
-                jobArn_list.append(jobArn)
-                # Update previous base64 list
-                pre_batch_base64_list = copy.deepcopy(image_base64_list)
-            # for page in paginator
-        # while first or next_token
-        # Handle the last batch
-        if len(pre_batch_base64_list) > 100:
-            if len(pre_batch_base64_list) < 100:
-                raise HTTPException(status_code=500, detail=f"At least 100 images for a batch, got {str(len(pre_batch_base64_list))} instead. Fail to use batch generation.")
-            else:
-                # Batch generate description
-                jobArn, output_s3_uri, s3_uris = description_generator_invocation_job(pre_batch_base64_list, batch_num)
-                # Construct response data
-                response_data[jobArn] = {"output": output_s3_uri,"image_s3_uris": s3_uris}
-                jobArn_list.append(jobArn)
-
-        response_data["jobArn_list"] = jobArn_list
-        
         return APIResponse.success(
-            message="Batch description enrichment successfully started",
-            data=response_data
+            message="Batch description enrichment successfully started" if checkpoint["done"]
+                else "Batch description enrichment checkpointed; call again with checkpoint_id to continue",
+            data=CheckpointedEnrichment.response_data(checkpoint)
         )
+    except ImageProcessingError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in batch job creation: {str(e)}")
 
@@ -475,35 +582,12 @@ async def batch_embedding_generation(request: BatchEmbeddingRequest) -> APIRespo
             if request.s3_folder_prefix == "":
                 raise HTTPException(status_code=500, detail=f"The parameter s3_folder_prefix must not be empty when generated_descn is false.")
         if request.generated_descn:
-            jobArn_list = request.batch_descn_output["jobArn_list"]
             embedding_jobArn_list = []
-            # One job is one batch
-            for jobArn in jobArn_list:
-                output_directory = request.batch_descn_output[jobArn]["output"]
-                # Get batch inference output: output_json_list
-                s3_folder_prefix = output_directory.replace("s3://"+Config.BUCKET_NAME+"/","")
-                s3_folder_prefix = s3_folder_prefix + jobArn.split("/")[-1] + "/"
-                s3_key = s3_folder_prefix + output_directory.split("/")[-2] + ".jsonl.out"
-                response = s3_client.get_object(Bucket=Config.BUCKET_NAME,Key=s3_key)
-                file_content = response["Body"].read().decode("utf-8")
-                file_content_list = file_content.split("\n")[:-1]
-                output_json_list = []
-                for content in file_content_list:
-                    output_json_list.append(json.loads(content))
-                # Construct batch generate embedding dict
-                batch_gen_embedding_dict = {}
-                for output_json in output_json_list:
-                    if "error" in output_json:
-                        continue
-                    batch_gen_embedding_dict[output_json["recordId"]] = {
-                        "image_base64": output_json["modelInput"]["messages"][0]["content"][0]["image"]["source"]["bytes"],
-                        "description": output_json["modelOutput"]["output"]["message"]["content"][0]["text"]
-                    }
-                # create generation invocation job
-                file_prefix = output_directory.split("/")[-2].replace("-descn","")
-                embedding_jobArn, output_s3_uri = embedding_generator.create_embedding_generator_invocation_job(batch_gen_embedding_dict,file_prefix)
-                response_data[embedding_jobArn] = {"output": output_s3_uri, "image_s3_uris": request.batch_descn_output[jobArn]["image_s3_uris"]}
-                embedding_jobArn_list.append(embedding_jobArn)
+            # One job is one batch; batches are converted concurrently
+            results = await run_in_threadpool(batch_pipeline.map_jobs, batch_pipeline.start_embedding_job, request.batch_descn_output)
+            for started in results.values():
+                response_data[started["jobArn"]] = started["job"]
+                embedding_jobArn_list.append(started["jobArn"])
             response_data["jobArn_list"] = embedding_jobArn_list
         return APIResponse.success(
             message="Batch embedding generation successfully started",
@@ -512,6 +596,69 @@ async def batch_embedding_generation(request: BatchEmbeddingRequest) -> APIRespo
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in batch job creation: {str(e)}")
 
+def get_pipeline_or_404(pipeline_id):
+    manifest = pipeline_orchestrator.get(pipeline_id)
+    if manifest is None:
+        raise ImageProcessingError(
+            status_code=404,
+            error_code="PIPELINE_NOT_FOUND",
+            message=f"Pipeline {pipeline_id} not found",
+            details={"pipeline_id": pipeline_id}
+        )
+    return manifest
+
+@app.post("/pipelines")
+async def create_pipeline(request: PipelineCreateRequest) -> APIResponse:
+    logger.info(f"Creating batch pipeline for {request.s3_folder_prefix}")
+    try:
+        options = {
+            "s3_folder_prefix": request.s3_folder_prefix,
+            "inventory_manifest": request.inventory_manifest,
+            "batch_size": request.batch_size,
+            "max_edge": Config.BATCH_IMAGE_MAX_EDGE if request.max_edge is None else request.max_edge,
+            "quality": request.quality or Config.BATCH_IMAGE_QUALITY,
+            "generate_renditions": request.generate_renditions
+        }
+        manifest = await run_in_threadpool(pipeline_orchestrator.create, options)
+        # List the first chunks and submit their batches within the request budget; the scheduled tick
+        # (and a runner thread in local runs) list and advance the rest
+        deadline = time.time() + Config.PIPELINE_REQUEST_BUDGET_SECONDS
+        manifest = await run_in_threadpool(pipeline_orchestrator.step, manifest["pipeline_id"], deadline)
+        if pipeline_store.local:
+            pipeline_orchestrator.start(manifest["pipeline_id"])
+        return APIResponse.accepted(
+            message="Batch pipeline started",
+            data=PipelineOrchestrator.summarize(manifest)
+        )
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error during pipeline creation: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error in pipeline creation: {str(e)}")
+
+@app.get("/pipelines/{pipeline_id}")
+async def get_pipeline(pipeline_id: str) -> APIResponse:
+    manifest = await run_in_threadpool(get_pipeline_or_404, pipeline_id)
+    return APIResponse.success(
+        message="Batch pipeline status",
+        data=PipelineOrchestrator.summarize(manifest)
+    )
+
+@app.post("/pipelines/{pipeline_id}/advance")
+async def advance_pipeline(pipeline_id: str) -> APIResponse:
+    """Poll once and move finished batches on; for schedulers driving pipelines across invocations."""
+    await run_in_threadpool(get_pipeline_or_404, pipeline_id)
+    try:
+        deadline = time.time() + Config.PIPELINE_REQUEST_BUDGET_SECONDS
+        manifest = await run_in_threadpool(pipeline_orchestrator.step, pipeline_id, deadline)
+        return APIResponse.success(
+            message="Batch pipeline advanced",
+            data=PipelineOrchestrator.summarize(manifest)
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error while advancing pipeline {pipeline_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error advancing pipeline: {str(e)}")
+
 @app.post("/check-batch-job-state")
 async def batch_descn_enrich(request: CheckBatchJobStateRequest) -> APIResponse:
     logger.info("Check batch job state")
@@ -24,6 +24,18 @@ class APIResponse(BaseModel):
         
         return response
 
+    @classmethod
+    def accepted(cls, message: str = "Accepted", data: Optional[Dict[str, Any]] = None) -> JSONResponse:
+        # 构造异步任务已受理的响应 (HTTP 202)
+        api_response = cls(
+            code=202,
+            message=message,
+            data=data,
+            timestamp=datetime.utcnow().isoformat(),
+        )
+
+        return JSONResponse(status_code=202, content=api_response.dict())
+
     @classmethod
     def error(cls, code: int, message: str, data: Optional[Dict[str, Any]] = None) -> JSONResponse:
         # 构造 API 响应
@@ -6,6 +6,13 @@ class ImageUploadRequest(BaseModel):
     description: Optional[str] = ""
     tags: List[str] = []
 
+class AsyncImageUploadRequest(BaseModel):
+    images: List[ImageUploadRequest]
+
+class PresignedUploadRequest(BaseModel):
+    count: Optional[int] = 1
+    content_type: Optional[str] = "image/jpeg"
+
 class ImageUpdateRequest(BaseModel):
     image_id: str
     description: Optional[str]
@@ -19,10 +26,35 @@ class ImageSearchRequest(BaseModel):
 
 class BatchUploadRequest(BaseModel):
     batch_embedding_output: dict
+    generate_renditions: Optional[bool] = True
+    # Turn refresh off and replicas to 0 while loading (restored afterwards); force_merge then merges to one segment
+    bulk_load_settings: Optional[bool] = False
+    force_merge: Optional[bool] = False
 
 class BatchDescnEnrichRequest(BaseModel):
     s3_folder_prefix: str
     batch_size: Optional[int] = 500
+    # Downscale images to this longest edge (0 keeps originals) and JPEG quality before building the batch input
+    max_edge: Optional[int] = None
+    quality: Optional[int] = None
+    # s3://.../manifest.json of an S3 Inventory report (CSV or Parquet) to read keys from instead of listing the prefix
+    inventory_manifest: Optional[str] = None
+    # Resume an enrichment that stopped before the Lambda timeout; the other fields are then ignored
+    checkpoint_id: Optional[str] = None
+    # Only plan the job layout (returned as "plan") without submitting anything
+    plan_only: Optional[bool] = False
+    # 'auto' routes by workload size and deadline, 'online' uses on-demand calls only, 'batch' uses batch jobs
+    mode: Optional[str] = None
+    # Images should be searchable within this many minutes; images batch jobs cannot make it in time go online
+    deadline_minutes: Optional[float] = None
+
+class PipelineCreateRequest(BaseModel):
+    s3_folder_prefix: str
+    inventory_manifest: Optional[str] = None
+    batch_size: Optional[int] = 500
+    max_edge: Optional[int] = None
+    quality: Optional[int] = None
+    generate_renditions: Optional[bool] = True
 
 class BatchEmbeddingRequest(BaseModel):
     generated_descn: bool
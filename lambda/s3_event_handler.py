@@ -0,0 +1,32 @@
+import logging
+
+from utils.config import Config
+from utils.aws_client_factory import AWSClientFactory
+from services.opensearch_client import OpenSearchClient
+from services.embedding_generator import EmbeddingGenerator
+from services.image_ingestor import ImageIngestor
+from services.s3_event_ingestor import S3EventIngestor
+from utils.image_quality import create_quality_gate
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Lambda entry point for S3 ObjectCreated batches (direct or through SQS).
+# The API function receives the same events through the Lambda Web Adapter
+# pass-through path (POST /events in index.py).
+s3_client = AWSClientFactory.create_s3_client()
+bedrock_client = AWSClientFactory.create_bedrock_runtime_client()
+opensearch_client = OpenSearchClient()
+s3_event_ingestor = S3EventIngestor(
+    s3_client,
+    ImageIngestor(s3_client, EmbeddingGenerator(bedrock_client), create_quality_gate(), opensearch_client),
+    opensearch_client,
+    max_workers=Config.S3_EVENT_WORKERS,
+    bulk_max_docs=Config.INGEST_BULK_MAX_DOCS
+)
+
+def handler(event, context):
+    result = s3_event_ingestor.handle(event)
+    logger.info(f"Indexed {result['indexed']} of {result['processed']} uploaded objects")
+    return result
@@ -0,0 +1,292 @@
+import time
+import uuid
+import logging
+import datetime
+from array import array
+from typing import Dict, List, Optional, Tuple
+from utils.config import Config
+from services.batch_pipeline import BatchPipeline
+from services.key_source import create_key_source
+from services.manifest_store import ManifestConflictError
+from services.shard_planner import create_shard_planner, split_by_plan
+from services.enrichment_router import EnrichmentMode, create_enrichment_router
+from services.img_descn_generator import description_job_paths, description_job_name
+
+logger = logging.getLogger()
+
+class CheckpointedEnrichment:
+    """
+    Batch description enrichment that can stop at any batch boundary and be
+    resumed by a later invocation.
+
+    The first runs list the input ``plan_chunk_records`` keys at a time,
+    writing the measured sizes of each chunk to a part of the checkpoint,
+    until the input is exhausted or the deadline passes; once it is, the job
+    layout is planned with ``ShardPlanner`` and stored in the checkpoint, and
+    batches then follow the planned record counts.
+    ``EnrichmentRouter`` marks the shards that go through on-demand inference
+    instead (small workloads, the part of a large one that has to be
+    searchable before batch jobs would finish, and shards below the batch-job
+    minimum); they are indexed directly with the same checkpointing.
+
+    After every batch the checkpoint records the key source cursor after the
+    last key that went into a job (listing resumes from there), how many
+    keys were consumed, the next batch number and the jobs created so far. Before a job is created the batch is
+    recorded as ``in_flight`` with a deterministic job id; if the process dies
+    between ``create_model_invocation_job`` and the checkpoint write, the
+    resume finds the job by name instead of creating it again.
+
+    A run takes a lease on the checkpoint with a conditional write and saves
+    every change conditionally on the version it wrote last, so a client
+    resume and the scheduled ``run_all`` can never both submit the same
+    batch; the one that loses returns without running.
+    """
+    def __init__(self, s3_client, bedrock_client, batch_pipeline: BatchPipeline, store, lease_seconds: float = 900,
+                 plan_chunk_records: int = 100000):
+        self.s3 = s3_client
+        self.bedrock = bedrock_client
+        self.batch_pipeline = batch_pipeline
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.plan_chunk_records = plan_chunk_records
+
+    def create(self, options: Dict) -> Dict:
+        checkpoint = {
+            "checkpoint_id": str(uuid.uuid4()),
+            "createtime": datetime.datetime.now().isoformat(),
+            "updatetime": datetime.datetime.now().isoformat(),
+            "options": options,
+            "cursor": None,
+            "keys_consumed": 0,
+            "next_batch_num": 0,
+            "in_flight": None,
+            # Listing progress while the plan is built; the sizes are kept in parts sizes-NNNNNN
+            "planning": {"cursor": None, "records": 0, "parts": 0},
+            "plan": None,
+            "done": False,
+            "lease_until": 0,
+            "jobs": {},
+            "jobArn_list": [],
+            "skipped_images": [],
+            "batch_stats": [],
+            "online": {"indexed": 0, "error_images": []}
+        }
+        self.store.save(checkpoint["checkpoint_id"], checkpoint)
+        return checkpoint
+
+    def get(self, checkpoint_id: str) -> Optional[Dict]:
+        return self.store.load(checkpoint_id)
+
+    def _save(self, checkpoint: Dict, lease: Dict):
+        """Save conditionally on the version this run wrote last; raises ManifestConflictError if the lease was lost."""
+        checkpoint["updatetime"] = datetime.datetime.now().isoformat()
+        lease["version"] = self.store.save(checkpoint["checkpoint_id"], checkpoint, lease["version"])
+
+    def _acquire(self, checkpoint_id: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """The checkpoint and a lease on it, or the checkpoint and None if it is done or another run holds it."""
+        checkpoint, version = self.store.load_versioned(checkpoint_id)
+        if checkpoint is None or checkpoint["done"] or checkpoint["lease_until"] > time.time():
+            return checkpoint, None
+        checkpoint["lease_until"] = time.time() + self.lease_seconds
+        lease = {"version": version}
+        try:
+            self._save(checkpoint, lease)
+        except ManifestConflictError:
+            logger.info(f"Enrichment {checkpoint_id} is being run elsewhere")
+            return self.store.load(checkpoint_id), None
+        return checkpoint, lease
+
+    def _release(self, checkpoint: Dict, lease: Dict):
+        checkpoint["lease_until"] = 0
+        try:
+            self._save(checkpoint, lease)
+        except ManifestConflictError:
+            logger.error(f"Enrichment {checkpoint['checkpoint_id']} lease was taken over before the run finished")
+
+    def _job_id(self, checkpoint: Dict, batch_num: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{checkpoint['checkpoint_id']}/{batch_num}"))
+
+    def _find_job(self, job_id: str) -> Optional[str]:
+        job_name = description_job_name(job_id)
+        response = self.bedrock.list_model_invocation_jobs(nameContains=job_name)
+        for summary in response.get("invocationJobSummaries", []):
+            if summary["jobName"] == job_name:
+                return summary["jobArn"]
+        return None
+
+    def _record_job(self, checkpoint: Dict, batch_num: int, jobArn: Optional[str], job: Dict, build_result: Optional[Dict]):
+        if build_result is not None:
+            checkpoint["skipped_images"].extend(build_result["skipped"])
+            checkpoint["batch_stats"].append({
+                "batch": batch_num,
+                "records": build_result["records"],
+                "bytes": build_result["bytes"],
+                "original_image_bytes": build_result["original_image_bytes"],
+                "image_bytes": build_result["image_bytes"],
+                "compression_ratio": build_result["compression_ratio"]
+            })
+        if jobArn is not None:
+            checkpoint["jobs"][jobArn] = job
+            checkpoint["jobArn_list"].append(jobArn)
+
+    def _key_source(self, checkpoint: Dict):
+        options = checkpoint["options"]
+        return create_key_source(self.s3, options["s3_folder_prefix"], options.get("inventory_manifest"))
+
+    def _plan(self, checkpoint: Dict, lease: Dict, deadline: Optional[float]) -> bool:
+        """
+        List and measure the input a chunk at a time until it is exhausted or
+        ``deadline`` passes (at least one chunk per call), then plan it.
+        Returns whether the plan is complete.
+        """
+        checkpoint_id = checkpoint["checkpoint_id"]
+        planning = checkpoint["planning"]
+        options = checkpoint["options"]
+        planner = create_shard_planner(options["batch_size"])
+        key_source = self._key_source(checkpoint)
+        while True:
+            listed, planning["cursor"] = key_source.list_chunk(planning["cursor"], self.plan_chunk_records)
+            if listed:
+                self.store.save_part(checkpoint_id, f"sizes-{planning['parts']:06d}",
+                                     {"sizes": planner.measure(listed).tolist()})
+                planning["parts"] += 1
+                planning["records"] += len(listed)
+            if len(listed) < self.plan_chunk_records:
+                break
+            self._save(checkpoint, lease)
+            if deadline is not None and time.time() > deadline:
+                logger.info(f"Enrichment {checkpoint_id}: listed {planning['records']} keys, planning continues next run")
+                return False
+        sizes = array('q')
+        for part in range(planning["parts"]):
+            sizes.extend(self.store.load_part(checkpoint_id, f"sizes-{part:06d}")["sizes"])
+        router = create_enrichment_router(planner)
+        checkpoint["plan"] = router.plan_sizes(sizes, options.get("mode", EnrichmentMode.BATCH), options.get("deadline_minutes"))
+        self._save(checkpoint, lease)
+        for part in range(planning["parts"]):
+            self.store.delete_part(checkpoint_id, f"sizes-{part:06d}")
+        return True
+
+    def plan(self, checkpoint_id: str, deadline: Optional[float] = None) -> Optional[Dict]:
+        """
+        Enumerate the input and store the planned job layout; nothing is
+        submitted. ``plan`` stays None while listing has to continue in a
+        later call. A checkpoint leased by a run is returned unchanged.
+        """
+        checkpoint, lease = self._acquire(checkpoint_id)
+        if lease is None:
+            return checkpoint
+        try:
+            if checkpoint["plan"] is None:
+                self._plan(checkpoint, lease, deadline)
+            return checkpoint
+        finally:
+            self._release(checkpoint, lease)
+
+    def _index_online(self, checkpoint: Dict, s3_uris: List[str]):
+        result = self.batch_pipeline.index_online(s3_uris)
+        checkpoint["online"]["indexed"] += result["indexed"]
+        checkpoint["online"]["error_images"].extend(result["error_list"])
+
+    def _recover_in_flight(self, checkpoint: Dict, lease: Dict):
+        in_flight = checkpoint["in_flight"]
+        # Online shards are simply redone: their document IDs are deterministic
+        jobArn = None if in_flight.get("online") else self._find_job(in_flight["job_id"])
+        if jobArn is not None:
+            logger.info(f"Adopting batch {in_flight['batch_num']} job {jobArn} created before the interruption")
+            _, output_directory, s3_uris_path = description_job_paths(in_flight["job_id"], in_flight["batch_num"])
+            self._record_job(checkpoint, in_flight["batch_num"], jobArn,
+                             {"output": output_directory, "image_s3_uris": s3_uris_path}, None)
+            checkpoint["cursor"] = in_flight["cursor"]
+            checkpoint["keys_consumed"] += in_flight["keys"]
+            checkpoint["next_batch_num"] = in_flight["batch_num"] + 1
+        # Otherwise the job was never created and the batch is simply listed and submitted again
+        checkpoint["in_flight"] = None
+        self._save(checkpoint, lease)
+
+    def run(self, checkpoint_id: str, deadline: float) -> Optional[Dict]:
+        """
+        Create description jobs batch by batch until the prefix is exhausted
+        or the next batch would not finish before ``deadline`` (a
+        ``time.time()`` value). Returns the checkpoint; ``done`` tells whether
+        another run is needed. A checkpoint leased by another run is returned
+        unchanged.
+        """
+        checkpoint, lease = self._acquire(checkpoint_id)
+        if lease is None:
+            return checkpoint
+        try:
+            if checkpoint["plan"] is None and not self._plan(checkpoint, lease, deadline):
+                return checkpoint
+            if checkpoint["in_flight"] is not None:
+                self._recover_in_flight(checkpoint, lease)
+            options = checkpoint["options"]
+            shards = checkpoint["plan"]["shards"]
+            # Keys paired with the cursor after them, so each batch knows where the next one resumes
+            positioned = ((key, cursor) for key, _, cursor in self._key_source(checkpoint).iter_positioned(checkpoint["cursor"]))
+            max_records = checkpoint["plan"]["limits"]["max_records"]
+            batch_seconds = 0
+            finished = True
+            for batch in split_by_plan(positioned, shards[checkpoint["next_batch_num"]:], max_records):
+                if time.time() + batch_seconds > deadline:
+                    finished = False
+                    break
+                started_at = time.time()
+                batch_keys = [key for key, _ in batch]
+                batch_cursor = batch[-1][1]
+                batch_num = checkpoint["next_batch_num"]
+                online = batch_num < len(shards) and shards[batch_num]["online"]
+                job_id = self._job_id(checkpoint, batch_num)
+                logger.info(f"batch {str(batch_num)}: {len(batch_keys)} images{' (online)' if online else ''}")
+                checkpoint["in_flight"] = {"batch_num": batch_num, "job_id": job_id, "cursor": batch_cursor,
+                                           "keys": len(batch_keys), "online": online}
+                self._save(checkpoint, lease)
+                if online:
+                    self._index_online(checkpoint, [f"s3://{Config.BUCKET_NAME}/{key}" for key in batch_keys])
+                else:
+                    started = self.batch_pipeline.start_description_job(
+                        batch_keys, batch_num, options["max_edge"], options["quality"], job_id
+                    )
+                    self._record_job(checkpoint, batch_num, started["jobArn"], started["job"], started["build_result"])
+                    if started["jobArn"] is None and started["build_result"]["records"]:
+                        # Too few images passed the quality gate for a batch job
+                        self._index_online(checkpoint, list(started["build_result"]["s3_uri_map"].values()))
+                checkpoint["cursor"] = batch_cursor
+                checkpoint["keys_consumed"] += len(batch_keys)
+                checkpoint["next_batch_num"] = batch_num + 1
+                checkpoint["in_flight"] = None
+                self._save(checkpoint, lease)
+                batch_seconds = max(batch_seconds, time.time() - started_at)
+            checkpoint["done"] = finished
+            return checkpoint
+        finally:
+            self._release(checkpoint, lease)
+
+    def run_all(self, deadline: float) -> Dict[str, bool]:
+        """Continue every unfinished enrichment until ``deadline``; returns checkpoint_id -> done."""
+        results = {}
+        for checkpoint_id in self.store.list_ids():
+            checkpoint = self.store.load(checkpoint_id)
+            if checkpoint is None or checkpoint["done"]:
+                continue
+            try:
+                results[checkpoint_id] = self.run(checkpoint_id, deadline)["done"]
+            except Exception as e:
+                logger.error(f"Failed to resume enrichment {checkpoint_id}: {str(e)}")
+                results[checkpoint_id] = False
+        return results
+
+    @staticmethod
+    def response_data(checkpoint: Dict) -> Dict:
+        """The /images/batch-descn-enrich response: jobs keyed by ARN plus the checkpoint fields."""
+        return {
+            **checkpoint["jobs"],
+            "jobArn_list": checkpoint["jobArn_list"],
+            "skipped_images": checkpoint["skipped_images"],
+            "batch_stats": checkpoint["batch_stats"],
+            "online": checkpoint["online"],
+            "plan": checkpoint["plan"],
+            "planned_records": checkpoint["planning"]["records"],
+            "checkpoint_id": checkpoint["checkpoint_id"],
+            "done": checkpoint["done"]
+        }
@@ -0,0 +1,167 @@
+import json
+import base64
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Iterable, Iterator, Callable, Dict, List, Optional
+from utils.config import Config
+from utils.exceptions import ImageQualityError
+from utils.get_image_mime_type import get_image_mime_type_from_bytes
+from utils.image_renditions import downscale_image
+
+logger = logging.getLogger()
+
+def bounded_map(executor: ThreadPoolExecutor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    """
+    Like ``executor.map`` but keeps at most ``window`` calls in flight, so a
+    long input never queues (and holds the results of) every call at once.
+    Results are yielded in input order.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class S3MultipartJsonlWriter:
+    """
+    Writes JSONL records straight into an S3 multipart upload. Only one part
+    (``part_size`` bytes, at least the 5 MiB S3 minimum) is held in memory.
+    """
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = 8 * 1024 * 1024):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, self.MIN_PART_SIZE)
+        self.records = 0
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._parts: List[Dict] = []
+        self._upload_id = self.s3.create_multipart_upload(
+            Bucket=bucket, Key=key, ContentType='application/jsonl'
+        )['UploadId']
+
+    def write(self, record: Dict):
+        line = json.dumps(record).encode('utf-8') + b"\n"
+        self._buffer += line
+        self.records += 1
+        self.bytes_written += len(line)
+        if len(self._buffer) >= self.part_size:
+            self._flush_part()
+
+    def _flush_part(self):
+        part_number = len(self._parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=bytes(self._buffer)
+        )
+        self._parts.append({"ETag": response['ETag'], "PartNumber": part_number})
+        self._buffer = bytearray()
+
+    def close(self):
+        # The last part may be smaller than 5 MiB; an empty upload still needs one part
+        if self._buffer or not self._parts:
+            self._flush_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts}
+        )
+
+    def abort(self):
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload of {self.key}: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+class BatchPayloadBuilder:
+    """
+    Streams the images of one batch into a Bedrock batch-inference input file.
+
+    Objects are fetched on a bounded thread pool, the MIME type is sniffed
+    from the leading bytes in memory and each record is written to the
+    multipart upload as soon as it is ready, so memory stays flat regardless
+    of the batch size.
+    """
+    def __init__(self, s3_client, image_ingestor=None, max_workers: int = 16, part_size: int = 8 * 1024 * 1024):
+        self.s3 = s3_client
+        self.image_ingestor = image_ingestor
+        self.max_workers = max_workers
+        self.part_size = part_size
+
+    def _fetch(self, s3_key: str, max_edge: Optional[int], quality: int) -> Dict:
+        s3_uri = f"s3://{Config.BUCKET_NAME}/{s3_key}"
+        try:
+            image_data = self.s3.get_object(Bucket=Config.BUCKET_NAME, Key=s3_key)['Body'].read()
+            if self.image_ingestor is not None:
+                self.image_ingestor.check_quality(image_data)
+            mime_type = get_image_mime_type_from_bytes(image_data)
+            if mime_type not in Config.QUALITY_ALLOWED_MIME_TYPES:
+                return {"s3_uri": s3_uri, "skipped": [f"mime_type:{mime_type}"]}
+            original_size = len(image_data)
+            if max_edge:
+                # Resized once here; the embedding job reuses these bytes from the description output
+                image_data, resized_mime_type = downscale_image(image_data, max_edge, quality)
+                mime_type = resized_mime_type or mime_type
+            return {"s3_uri": s3_uri, "image_data": image_data, "mime_type": mime_type, "original_size": original_size}
+        except ImageQualityError as e:
+            return {"s3_uri": s3_uri, "skipped": e.detail["details"]["issues"]}
+        except Exception as e:
+            logger.error(f"Failed to fetch {s3_uri}: {str(e)}")
+            return {"s3_uri": s3_uri, "skipped": [f"fetch_error:{str(e)}"]}
+
+    def build(self, s3_keys: Iterable[str], payload_key: str,
+              make_record: Callable[[str, str, str], Dict],
+              max_edge: Optional[int] = None, quality: int = 85) -> Dict:
+        """
+        Write one record per image to ``payload_key``.
+
+        ``make_record(record_id, image_base64, mime_type)`` returns the JSONL
+        record. When ``max_edge`` is set, larger images are downscaled and
+        re-encoded as JPEG at ``quality`` before they are base64-encoded.
+        Returns the recordId -> S3 URI map, the skipped images, the written
+        record/byte counts and the original vs. embedded image byte totals.
+        """
+        s3_uri_map = {}
+        skipped = []
+        original_bytes = 0
+        image_bytes = 0
+        fetch = partial(self._fetch, max_edge=max_edge, quality=quality)
+        with S3MultipartJsonlWriter(self.s3, Config.BUCKET_NAME, payload_key, self.part_size) as writer, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for fetched in bounded_map(executor, fetch, s3_keys, self.max_workers * 2):
+                if "skipped" in fetched:
+                    skipped.append({"s3_uri": fetched["s3_uri"], "issues": fetched["skipped"]})
+                    continue
+                original_bytes += fetched["original_size"]
+                image_bytes += len(fetched["image_data"])
+                record_id = str(writer.records).zfill(11)
+                image_base64 = base64.b64encode(fetched["image_data"]).decode('utf-8')
+                writer.write(make_record(record_id, image_base64, fetched["mime_type"]))
+                s3_uri_map[record_id] = fetched["s3_uri"]
+            records, bytes_written = writer.records, writer.bytes_written
+        compression_ratio = round(original_bytes / image_bytes, 2) if image_bytes else None
+        logger.info(f"Wrote {records} records ({bytes_written} bytes, image compression {compression_ratio}x) to {payload_key}")
+        return {
+            "s3_uri_map": s3_uri_map,
+            "skipped": skipped,
+            "records": records,
+            "bytes": bytes_written,
+            "original_image_bytes": original_bytes,
+            "image_bytes": image_bytes,
+            "compression_ratio": compression_ratio
+        }
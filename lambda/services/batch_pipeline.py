@@ -0,0 +1,277 @@
+import json
+import time
+import uuid
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from utils.config import Config
+from utils.exceptions import OpenSearchError, ImageQualityError
+from services.img_descn_generator import description_generator_invocation_job
+from services.batch_payload_builder import S3MultipartJsonlWriter, bounded_map
+from services.record_manifest import RecordManifest
+
+logger = logging.getLogger()
+
+class BatchPipeline:
+    """
+    The per-batch stages of Bedrock batch ingestion: describe -> embed -> index.
+
+    A job entry is the dict the batch endpoints exchange with clients:
+    ``{"output": <job output s3 uri>, "image_s3_uris": <recordId -> S3 URI map uri>}``.
+    Used by the /images/batch-* endpoints and by the pipeline orchestrator.
+    """
+    def __init__(self, s3_client, embedding_generator, opensearch_client, image_ingestor, payload_builder):
+        self.s3 = s3_client
+        self.embedding_generator = embedding_generator
+        self.opensearch_client = opensearch_client
+        self.image_ingestor = image_ingestor
+        self.payload_builder = payload_builder
+
+    @staticmethod
+    def _key(s3_uri: str) -> str:
+        return s3_uri.replace("s3://" + Config.BUCKET_NAME + "/", "")
+
+    def output_keys(self, jobArn: str, output_directory: str) -> List[Dict]:
+        """
+        The ``.jsonl.out`` objects Bedrock wrote for a job (one per input
+        file), as ``{"Key", "Size"}`` dicts in key order.
+        """
+        s3_folder_prefix = self._key(output_directory) + jobArn.split("/")[-1] + "/"
+        outputs = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=Config.BUCKET_NAME, Prefix=s3_folder_prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(".jsonl.out"):
+                    outputs.append({"Key": obj['Key'], "Size": obj['Size']})
+        if not outputs:
+            raise Exception(f"No output found for batch job {jobArn} under {s3_folder_prefix}")
+        return outputs
+
+    def _get_range(self, s3_key: str, byte_range: Tuple[int, int]) -> bytes:
+        return self.s3.get_object(
+            Bucket=Config.BUCKET_NAME, Key=s3_key, Range=f"bytes={byte_range[0]}-{byte_range[1]}"
+        )['Body'].read()
+
+    def _iter_lines(self, s3_key: str, size: int, start: int = 0) -> Iterator[Tuple[bytes, int]]:
+        """
+        Yield the lines of one object from byte ``start`` on, each with the
+        offset just past it. Small objects are streamed from a single GET;
+        large ones are fetched as concurrent ranged GETs (at most
+        ``BATCH_OUTPUT_RANGE_WINDOW`` ranges buffered) and re-split on newlines.
+        """
+        range_size = Config.BATCH_OUTPUT_RANGE_SIZE
+        offset = start
+        if size - start <= range_size:
+            kwargs = {"Range": f"bytes={start}-"} if start else {}
+            body = self.s3.get_object(Bucket=Config.BUCKET_NAME, Key=s3_key, **kwargs)['Body']
+            for line in body.iter_lines(keepends=True):
+                offset += len(line)
+                line = line.rstrip(b"\r\n")
+                if line:
+                    yield line, offset
+            return
+        ranges = [(begin, min(begin + range_size, size) - 1) for begin in range(start, size, range_size)]
+        remainder = b""
+        with ThreadPoolExecutor(max_workers=Config.BATCH_OUTPUT_RANGE_WINDOW) as executor:
+            fetch = partial(self._get_range, s3_key)
+            for chunk in bounded_map(executor, fetch, ranges, Config.BATCH_OUTPUT_RANGE_WINDOW):
+                lines = (remainder + chunk).split(b"\n")
+                remainder = lines.pop()
+                for line in lines:
+                    offset += len(line) + 1
+                    if line:
+                        yield line, offset
+        if remainder:
+            yield remainder, offset + len(remainder)
+
+    def iter_job_output_positioned(self, jobArn: str, output_directory: str,
+                                   position: Optional[Dict] = None) -> Iterator[Tuple[Dict, Dict]]:
+        """
+        Parse the output records of a job from ``position`` on, each with the
+        position just past it: ``{"file": index, "offset": byte}`` into the
+        job's output files, so a later call can continue where this one stopped.
+        """
+        position = position or {"file": 0, "offset": 0}
+        outputs = self.output_keys(jobArn, output_directory)
+        for file_index in range(position["file"], len(outputs)):
+            output = outputs[file_index]
+            start = position["offset"] if file_index == position["file"] else 0
+            for line, offset in self._iter_lines(output["Key"], output["Size"], start):
+                yield json.loads(line), {"file": file_index, "offset": offset}
+
+    def iter_job_output(self, jobArn: str, output_directory: str) -> Iterator[Dict]:
+        """Parse the output records of a job one line at a time, across all of its output files."""
+        for output_json, _ in self.iter_job_output_positioned(jobArn, output_directory):
+            yield output_json
+
+    def read_s3_uri_map(self, image_s3_uris_path: str):
+        """The recordId -> S3 URI ``RecordManifest`` of a batch (a dict for legacy ``.json`` maps)."""
+        return RecordManifest.load(self.s3, self._key(image_s3_uris_path))
+
+    def start_description_job(self, s3_keys: List[str], batch_num: int, max_edge=None, quality: int = 85,
+                              job_id: str = None) -> Dict:
+        """
+        Returns ``{"jobArn", "job", "build_result"}``; ``jobArn`` is None when
+        fewer than ``Config.BATCH_MIN_RECORDS`` images passed the quality gate.
+        Those images (``build_result["s3_uri_map"]``) belong to ``index_online``.
+        """
+        jobArn, output_s3_uri, s3_uris, build_result = description_generator_invocation_job(
+            s3_keys, batch_num, self.payload_builder, max_edge, quality, job_id, Config.BATCH_MIN_RECORDS
+        )
+        return {
+            "jobArn": jobArn,
+            "job": {"output": output_s3_uri, "image_s3_uris": s3_uris},
+            "build_result": build_result
+        }
+
+    def start_embedding_job(self, descn_jobArn: str, descn_job: Dict) -> Dict:
+        """
+        Feed the descriptions (and image bytes) of a finished description job
+        into an embedding job. Output records are copied one by one into a
+        multipart upload of the embedding input, so memory stays flat.
+        """
+        output_directory = descn_job["output"]
+        file_prefix = output_directory.split("/")[-2].replace("-descn", "")
+        payload_key = self.embedding_generator.embedding_payload_key(file_prefix)
+        with S3MultipartJsonlWriter(self.s3, Config.BUCKET_NAME, payload_key, Config.BATCH_MULTIPART_PART_SIZE) as writer:
+            for output_json in self.iter_job_output(descn_jobArn, output_directory):
+                if "error" in output_json:
+                    continue
+                writer.write(self.embedding_generator.build_embedding_record(
+                    output_json["recordId"],
+                    output_json["modelInput"]["messages"][0]["content"][0]["image"]["source"]["bytes"],
+                    output_json["modelOutput"]["output"]["message"]["content"][0]["text"]
+                ))
+        logger.info(f"Wrote {writer.records} embedding records to {payload_key}")
+        embedding_jobArn, output_s3_uri = self.embedding_generator.start_embedding_invocation_job(file_prefix)
+        return {"jobArn": embedding_jobArn, "job": {"output": output_s3_uri, "image_s3_uris": descn_job["image_s3_uris"]}}
+
+    def _index_chunk(self, documents: List[Dict], generate_renditions: bool) -> List[str]:
+        # Write thumbnail/display renditions so search results and rerank read small objects
+        if generate_renditions:
+            with ThreadPoolExecutor(max_workers=Config.RENDITION_WORKERS) as executor:
+                rendition_list = list(executor.map(self.image_ingestor.create_renditions_for_object, [document['image_path'] for document in documents]))
+            for document, (rendition_keys, content_hash) in zip(documents, rendition_list):
+                document['renditions'] = rendition_keys
+                document['content_hash'] = content_hash
+        try:
+            response = self.opensearch_client.bulk_upload(documents)
+        except Exception as e:
+            logger.error(f"Batch upload failed in OpenSearch: {str(e)}")
+            raise OpenSearchError("Batch upload failed in OpenSearch:", {"detail": str(e)})
+        failed = self.failed_documents(documents, response)
+        logger.info(f"Bulk indexed {str(len(documents) - len(failed))} images ({len(failed)} failed)")
+        return failed
+
+    @staticmethod
+    def failed_documents(documents: List[Dict], response: Dict) -> List[str]:
+        """image_path of every document whose bulk item reported an error."""
+        failed = []
+        for document, item in zip(documents, response.get("items", [])):
+            result = next(iter(item.values()))
+            if "error" in result:
+                logger.error(f"Failed to index {document['image_path']}: {result['error']}")
+                failed.append(document['image_path'])
+        return failed
+
+    def index_embedding_output(self, jobArn: str, job: Dict, generate_renditions: bool = True,
+                               progress: Optional[Dict] = None, deadline: Optional[float] = None,
+                               on_chunk: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Bulk index the output of a finished embedding job. Records are read
+        line by line and indexed in chunks of ``BATCH_INDEX_CHUNK_DOCS``, so
+        only one chunk of embeddings is held at a time.
+
+        Returns ``{"indexed", "error_list", "position", "done"}``: the number
+        of indexed documents, the S3 URIs of records that errored, and where
+        reading stopped. After every chunk the progress is passed to
+        ``on_chunk`` (to be saved), and once ``deadline`` (a ``time.time()``
+        value) has passed the call returns with ``done`` False; passing that
+        result back as ``progress`` continues after the last indexed chunk.
+        """
+        progress = dict(progress or {"indexed": 0, "error_list": [], "position": None})
+        s3_uris_json = self.read_s3_uri_map(job["image_s3_uris"])
+        logger.info(f"Bulk uploading up to {str(len(s3_uris_json))} images from batch {jobArn}")
+        documents = []
+        errors = []
+        position = progress["position"]
+
+        def flush():
+            failed = self._index_chunk(documents, generate_renditions) if documents else []
+            progress["indexed"] += len(documents) - len(failed)
+            progress["error_list"] = progress["error_list"] + errors + failed
+            progress["position"] = position
+            if on_chunk is not None:
+                on_chunk(progress)
+
+        for output_json, position in self.iter_job_output_positioned(jobArn, job["output"], progress["position"]):
+            if output_json["recordId"] not in s3_uris_json:
+                raise Exception(f"Record {output_json['recordId']} of batch {jobArn} has no S3 URI")
+            if "error" in output_json:
+                errors.append(s3_uris_json[output_json["recordId"]])
+            else:
+                documents.append({
+                    'description': output_json["modelInput"]["inputText"],
+                    'embedding': output_json["modelOutput"]['embedding'],
+                    'createtime': datetime.datetime.now().isoformat(),
+                    'image_path': s3_uris_json[output_json["recordId"]]
+                })
+            if len(documents) >= Config.BATCH_INDEX_CHUNK_DOCS:
+                flush()
+                documents = []
+                errors = []
+                if deadline is not None and time.time() > deadline:
+                    logger.info(f"Indexed {progress['indexed']} images of batch {jobArn} before the deadline")
+                    return {**progress, "done": False}
+        if documents or errors:
+            flush()
+        logger.info(f"Successfully bulk index {str(progress['indexed'])} images in batch {jobArn}")
+        return {**progress, "done": True}
+
+    def map_jobs(self, fn, jobs: Dict) -> Dict:
+        """
+        Run ``fn(jobArn, job)`` for every job of a batch response
+        (``{"jobArn_list": [...], jobArn: job}``) concurrently; results keyed by jobArn.
+        """
+        jobArn_list = jobs["jobArn_list"]
+        with ThreadPoolExecutor(max_workers=Config.BATCH_OUTPUT_JOB_WORKERS) as executor:
+            results = executor.map(lambda jobArn: fn(jobArn, jobs[jobArn]), jobArn_list)
+            return dict(zip(jobArn_list, results))
+
+    def index_online(self, s3_uris: List[str]) -> Dict:
+        """
+        Describe, embed and index images with on-demand Bedrock calls, for
+        batches below the batch-job minimum. Document IDs derive from the S3
+        URI, so running this twice for the same images overwrites instead of
+        duplicating.
+        """
+        def prepare(s3_uri):
+            try:
+                return self.image_ingestor.prepare_existing_object(s3_uri, str(uuid.uuid5(uuid.NAMESPACE_URL, s3_uri)))
+            except ImageQualityError:
+                return None
+            except Exception as e:
+                logger.error(f"Online enrichment failed for {s3_uri}: {str(e)}")
+                return s3_uri
+
+        documents = []
+        error_list = []
+        with ThreadPoolExecutor(max_workers=Config.ONLINE_ENRICH_WORKERS) as executor:
+            for s3_uri, prepared in zip(s3_uris, executor.map(prepare, s3_uris)):
+                if isinstance(prepared, dict):
+                    documents.append(prepared)
+                elif prepared is not None:
+                    error_list.append(s3_uri)
+        failed = []
+        if documents:
+            try:
+                response = self.opensearch_client.bulk_upload(documents)
+            except Exception as e:
+                logger.error(f"Batch upload failed in OpenSearch: {str(e)}")
+                raise OpenSearchError("Batch upload failed in OpenSearch:", {"detail": str(e)})
+            failed = self.failed_documents(documents, response)
+            error_list.extend(failed)
+        logger.info(f"Indexed {len(documents) - len(failed)} of {len(s3_uris)} images with online inference")
+        return {"indexed": len(documents) - len(failed), "error_list": error_list}
@@ -48,16 +48,49 @@ class EmbeddingGenerator:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error generating embedding: {str(e)}")
 
+    @staticmethod
+    def embedding_payload_key(file_prefix):
+        return f"INVOCATION-INPUT-NO-IMAGE/{file_prefix}-embedding.jsonl"
+
+    @staticmethod
+    def build_embedding_record(recordId, input_image, input_description):
+        return {
+            "recordId": recordId, 
+            "modelInput": {
+                "inputText": input_description,
+                "inputImage": input_image,
+                "embeddingConfig": {
+                    "outputEmbeddingLength": Config.VECTOR_DIMENSION
+                }
+            }
+        }
+
     def create_embedding_generator_invocation_job(self, batch_gen_embedding_dict, file_prefix):
         # Initialization: Initialize an S3 client
         s3_client = AWSClientFactory.create_s3_client()
+        embedding_payload_file_name = f"{file_prefix}-embedding.jsonl"
+        try:
+            # Construct embedding generation payload
+            embedding_gen_batch_inference_data = []
+            for recordId in batch_gen_embedding_dict:
+                input_image = batch_gen_embedding_dict[recordId]["image_base64"]
+                input_description = batch_gen_embedding_dict[recordId]["description"]
+                embedding_gen_batch_inference_data.append(self.build_embedding_record(recordId, input_image, input_description))
+            with jsonlines.open(f'/tmp/{embedding_payload_file_name}', 'w') as writer:
+                writer.write_all(embedding_gen_batch_inference_data)
+                s3_client.upload_file(f'/tmp/{embedding_payload_file_name}', Config.BUCKET_NAME, self.embedding_payload_key(file_prefix))
+        except (ClientError, Exception) as e:
+            raise HTTPException(status_code=500, detail=f"Error when creating invocation job: {str(e)}")
+        return self.start_embedding_invocation_job(file_prefix)
+
+    def start_embedding_invocation_job(self, file_prefix):
+        """Start the embedding batch job for an input file already written to ``embedding_payload_key(file_prefix)``."""
         # Initialization: Initialize a bedrock client
         bedrock_client = AWSClientFactory.create_bedrock_client()
         # Initialization: Invocation job configuration
-        embedding_payload_file_name = f"{file_prefix}-embedding.jsonl"
         embeddingGeneratorInputDataConfig=({
             "s3InputDataConfig": {
-                "s3Uri": f"s3://{Config.BUCKET_NAME}/INVOCATION-INPUT-NO-IMAGE/{embedding_payload_file_name}"
+                "s3Uri": f"s3://{Config.BUCKET_NAME}/{self.embedding_payload_key(file_prefix)}"
             }
         })
         embedding_output_folder_name = f"{file_prefix}-embedding/"
@@ -67,25 +100,6 @@ class EmbeddingGenerator:
             }
         })
         try:
-            # Construct embedding generation payload
-            embedding_gen_batch_inference_data = []
-            for recordId in batch_gen_embedding_dict:
-                input_image = batch_gen_embedding_dict[recordId]["image_base64"]
-                input_description = batch_gen_embedding_dict[recordId]["description"]
-                embedding_gen_payload = {
-                    "recordId": recordId, 
-                    "modelInput": {
-                        "inputText": input_description,
-                        "inputImage": input_image,
-                        "embeddingConfig": {
-                            "outputEmbeddingLength": Config.VECTOR_DIMENSION
-                        }
-                    }
-                }
-                embedding_gen_batch_inference_data.append(embedding_gen_payload)
-            with jsonlines.open(f'/tmp/{embedding_payload_file_name}', 'w') as writer:
-                writer.write_all(embedding_gen_batch_inference_data)
-                s3_client.upload_file(f'/tmp/{embedding_payload_file_name}', Config.BUCKET_NAME, 'INVOCATION-INPUT-NO-IMAGE/'+embedding_payload_file_name)
             # Create and start invocation job
             uuid = file_prefix.split("-")[0]
             embedding_gen_response = bedrock_client.create_model_invocation_job(
@@ -98,4 +112,4 @@ class EmbeddingGenerator:
             jobArn = embedding_gen_response.get('jobArn')
             return jobArn, f"s3://{Config.BUCKET_NAME}/INVOCATION-OUTPUT-NO-IMAGE/{embedding_output_folder_name}"
         except (ClientError, Exception) as e:
-            raise HTTPException(status_code=500, detail=f"Error when creating invocation job: {str(e)}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Error when creating invocation job: {str(e)}")
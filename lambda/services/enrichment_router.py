@@ -0,0 +1,92 @@
+import math
+import logging
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+from utils.config import Config
+from services.shard_planner import ShardPlanner
+
+logger = logging.getLogger()
+
+class EnrichmentMode:
+    AUTO = "auto"
+    BATCH = "batch"
+    ONLINE = "online"
+
+ENRICHMENT_MODES = (EnrichmentMode.AUTO, EnrichmentMode.BATCH, EnrichmentMode.ONLINE)
+
+class EnrichmentRouter:
+    """
+    Decides how many images of an enrichment go through on-demand
+    ``invoke_model`` calls and how many through Bedrock batch jobs.
+
+    Online throughput is estimated as ``online_workers`` concurrent calls at
+    ``images_per_worker_minute`` each, capped by the account quota
+    ``max_images_per_minute``. A batch job is expected to finish after
+    ``batch_latency_minutes`` regardless of size.
+
+    In ``auto`` mode small workloads (up to ``online_max_records``) run
+    online. With a deadline that batch jobs cannot meet, the first images go
+    online, as many as the online capacity finishes in time, and the rest
+    still go to batch jobs. ``online`` and ``batch`` force the route, except
+    that batches below the batch-job minimum always run online.
+    """
+    def __init__(self, planner: ShardPlanner, online_workers: int, images_per_worker_minute: float,
+                 max_images_per_minute: float, batch_latency_minutes: float, online_max_records: int,
+                 online_shard_records: int):
+        self.planner = planner
+        self.online_workers = online_workers
+        self.images_per_worker_minute = images_per_worker_minute
+        self.max_images_per_minute = max_images_per_minute
+        self.batch_latency_minutes = batch_latency_minutes
+        self.online_max_records = online_max_records
+        self.online_shard_records = online_shard_records
+
+    def online_rate(self) -> float:
+        """Estimated online images per minute."""
+        return min(self.online_workers * self.images_per_worker_minute, self.max_images_per_minute)
+
+    def online_records(self, total_records: int, mode: str, deadline_minutes: Optional[float]) -> Tuple[int, str]:
+        """Number of leading records to enrich online, and why."""
+        if mode == EnrichmentMode.ONLINE:
+            return total_records, "online requested"
+        if mode == EnrichmentMode.BATCH:
+            return 0, "batch requested"
+        if total_records <= self.online_max_records:
+            return total_records, f"at most {self.online_max_records} images"
+        if deadline_minutes is None or deadline_minutes >= self.batch_latency_minutes:
+            return 0, "batch jobs meet the deadline"
+        capacity = int(self.online_rate() * deadline_minutes)
+        if capacity >= total_records:
+            return total_records, "online finishes before the deadline"
+        return capacity, f"batch jobs miss the deadline; {capacity} images fit online"
+
+    def plan(self, objects: Iterable[Tuple[str, int]], mode: str = EnrichmentMode.AUTO,
+             deadline_minutes: Optional[float] = None) -> Dict:
+        return self.plan_sizes(self.planner.measure(objects), mode, deadline_minutes)
+
+    def plan_sizes(self, sizes: array, mode: str = EnrichmentMode.AUTO, deadline_minutes: Optional[float] = None) -> Dict:
+        """Route and plan from sizes measured with ``planner.measure``."""
+        online_head, reason = self.online_records(len(sizes), mode, deadline_minutes)
+        plan = self.planner.plan_sizes(sizes, online_head, self.online_shard_records)
+        rate = self.online_rate()
+        plan["routing"] = {
+            "mode": mode,
+            "deadline_minutes": deadline_minutes,
+            "reason": reason,
+            "online_images_per_minute": rate,
+            "estimated_online_minutes": math.ceil(plan["online_records"] / rate) if rate else None,
+            "estimated_batch_minutes": self.batch_latency_minutes if plan["batch_jobs"] else 0
+        }
+        logger.info(f"Routed {plan['online_records']} of {plan['total_records']} images online ({reason})")
+        return plan
+
+def create_enrichment_router(planner: ShardPlanner) -> EnrichmentRouter:
+    return EnrichmentRouter(
+        planner,
+        Config.ONLINE_ENRICH_WORKERS,
+        Config.ONLINE_IMAGES_PER_WORKER_MINUTE,
+        Config.ONLINE_MAX_IMAGES_PER_MINUTE,
+        Config.BATCH_JOB_EXPECTED_MINUTES,
+        Config.ONLINE_AUTO_MAX_RECORDS,
+        Config.ONLINE_SHARD_RECORDS
+    )
@@ -0,0 +1,217 @@
+import base64
+import hashlib
+import datetime
+import logging
+from botocore.exceptions import ClientError
+from utils.config import Config
+from utils.exceptions import ImageUploadError, ImageQualityError
+from utils.get_image_mime_type import get_image_mime_type_from_bytes
+from utils.image_renditions import RENDITIONS, generate_renditions, rendition_key, content_addressed_key
+from services.img_descn_generator import enrich_image_desc
+
+logger = logging.getLogger()
+
+class ImageIngestor:
+    """
+    Per-image ingest steps shared by the synchronous upload endpoint and the
+    asynchronous ingestion workers: store the bytes in S3, write the
+    renditions, describe the image when no description is given, embed it
+    and build the OpenSearch document.
+    """
+    def __init__(self, s3_client, embedding_generator, quality_gate=None, opensearch_client=None):
+        self.s3 = s3_client
+        self.embedding_generator = embedding_generator
+        self.quality_gate = quality_gate
+        # Consulted before a rollback deletes content-addressed objects
+        self.opensearch_client = opensearch_client
+
+    def check_quality(self, image_data):
+        """
+        Run the quality gate before anything is stored or sent to Bedrock.
+        Raises ``ImageQualityError`` in reject mode; otherwise returns the
+        issues found so the caller can flag the document.
+        """
+        if self.quality_gate is None or Config.QUALITY_GATE_MODE == 'off':
+            return []
+        issues = self.quality_gate.check(image_data)
+        if issues:
+            logger.info(f"Quality gate issues: {issues}")
+            if Config.QUALITY_GATE_MODE == 'reject':
+                raise ImageQualityError(issues)
+        return issues
+
+    def decode_image(self, image_base64):
+        try:
+            image_data = base64.b64decode(image_base64)
+            logger.info("Image data successfully decoded")
+            return image_data
+        except Exception as e:
+            logger.error(f"Failed to decode image data: {str(e)}")
+            raise ImageUploadError("Invalid image data format", {"detail": str(e)})
+
+    def _object_exists(self, s3_key):
+        try:
+            self.s3.head_object(Bucket=Config.BUCKET_NAME, Key=s3_key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def store_image(self, image_data):
+        """
+        Store the original under its content-addressed key
+        ``images/{sha256}.{ext}`` with immutable cache headers.
+
+        Returns ``(s3_key, content_hash, created)``. ``created`` is False when
+        identical bytes were already stored; callers must not delete the
+        object on failure in that case.
+        """
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        content_type = get_image_mime_type_from_bytes(image_data)
+        s3_key = content_addressed_key(content_hash, content_type)
+        try:
+            if self._object_exists(s3_key):
+                logger.info(f"Image already stored, reusing S3 object: {s3_key}")
+                return s3_key, content_hash, False
+            self.s3.put_object(
+                Bucket=Config.BUCKET_NAME,
+                Key=s3_key,
+                Body=image_data,
+                ContentType=content_type,
+                CacheControl=Config.IMMUTABLE_CACHE_CONTROL
+            )
+            logger.info(f"Successfully uploaded image to S3: {s3_key}")
+            return s3_key, content_hash, True
+        except Exception as e:
+            logger.error(f"Failed to upload image to S3: {str(e)}")
+            raise ImageUploadError("Failed to upload image to S3", {"detail": str(e)})
+
+    def store_renditions(self, content_hash, image_data):
+        """
+        Write every rendition of the image under ``renditions/{content_hash}/``.
+
+        Returns ``(rendition_keys, embed_base64)``: the S3 keys by rendition
+        name, and the base64 of the 320 px rendition used as model input.
+        """
+        try:
+            renditions = generate_renditions(image_data)
+        except Exception as e:
+            logger.error(f"Failed to generate renditions: {str(e)}")
+            raise ImageUploadError("Failed to generate image renditions", {"detail": str(e)})
+        rendition_keys = {}
+        try:
+            for name, (body, content_type) in renditions.items():
+                key = rendition_key(content_hash, name)
+                self.s3.put_object(
+                    Bucket=Config.BUCKET_NAME,
+                    Key=key,
+                    Body=body,
+                    ContentType=content_type,
+                    CacheControl=Config.IMMUTABLE_CACHE_CONTROL
+                )
+                rendition_keys[name] = key
+            logger.info(f"Stored {len(rendition_keys)} renditions for {content_hash}")
+        except Exception as e:
+            # Renditions are content-addressed and may be shared, so nothing is rolled back here
+            logger.error(f"Failed to upload renditions to S3: {str(e)}")
+            raise ImageUploadError("Failed to upload image renditions to S3", {"detail": str(e)})
+        embed_base64 = base64.b64encode(renditions["embed"][0]).decode('utf-8')
+        return rendition_keys, embed_base64
+
+    def create_renditions_for_object(self, s3_path):
+        """
+        Write renditions for an object that is already in the bucket (batch
+        pipeline). Returns ``(rendition_keys, content_hash)``, or ``({}, None)``
+        on failure so the document is still indexed and served from the original.
+        """
+        s3_key = s3_path.replace(f"s3://{Config.BUCKET_NAME}/", "")
+        try:
+            response = self.s3.get_object(Bucket=Config.BUCKET_NAME, Key=s3_key)
+            image_data = response['Body'].read()
+            content_hash = hashlib.sha256(image_data).hexdigest()
+            rendition_keys, _ = self.store_renditions(content_hash, image_data)
+            return rendition_keys, content_hash
+        except Exception as e:
+            logger.error(f"Skipping renditions for {s3_key}: {str(e)}")
+            return {}, None
+
+    def prepare_existing_object(self, s3_path, image_id):
+        """
+        Build the document for an object that is already in the bucket with
+        on-demand Bedrock calls (batch leftovers too small for a batch job).
+        Raises ``ImageQualityError`` in reject mode like the upload paths.
+        """
+        s3_key = s3_path.replace(f"s3://{Config.BUCKET_NAME}/", "")
+        image_data = self.s3.get_object(Bucket=Config.BUCKET_NAME, Key=s3_key)['Body'].read()
+        quality_flags = self.check_quality(image_data)
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        rendition_keys, embed_base64 = self.store_renditions(content_hash, image_data)
+        return self.build_document(image_id, embed_base64, "", s3_path, rendition_keys, content_hash, quality_flags)
+
+    def discard_image(self, s3_key, content_hash, created):
+        """
+        Roll back a failed ingest, unless the objects predate it or a
+        concurrent upload of the same bytes has indexed a document pointing at
+        them in the meantime.
+        """
+        if not created:
+            return
+        if self.opensearch_client is not None:
+            try:
+                if self.opensearch_client.count_by_content_hash(content_hash) > 0:
+                    logger.info(f"Keeping S3 object {s3_key}: indexed by another upload")
+                    return
+            except Exception as e:
+                # Leaving an orphaned object is safer than breaking an indexed document
+                logger.error(f"Failed to check documents for {content_hash}, keeping S3 objects: {str(e)}")
+                return
+        self.delete_image(s3_key)
+        self.delete_renditions({name: rendition_key(content_hash, name) for name in RENDITIONS})
+
+    def delete_renditions(self, rendition_keys):
+        for key in (rendition_keys or {}).values():
+            self.delete_image(key)
+
+    def delete_image(self, s3_key):
+        try:
+            logger.info(f"Attempting to clean up S3 object: {s3_key}")
+            self.s3.delete_object(Bucket=Config.BUCKET_NAME, Key=s3_key)
+            logger.info(f"Successfully cleaned up S3 object: {s3_key}")
+        except Exception as cleanup_error:
+            logger.error(f"Failed to clean up S3 object: {str(cleanup_error)}")
+
+    def build_document(self, image_id, image_base64, description, s3_key, rendition_keys=None, content_hash=None,
+                       quality_flags=None):
+        """
+        Generate the description (if empty) and the multimodal embedding, and
+        return the document to index. Nothing is written to OpenSearch here.
+        ``image_base64`` should be the ``embed`` rendition when one exists.
+        """
+        if not description:
+            try:
+                logger.info("Starting description generation")
+                description = enrich_image_desc(image_base64)
+                logger.info("Successfully generated description")
+            except Exception as e:
+                logger.error(f"Failed to generate description: {str(e)}")
+                raise ImageUploadError("Failed to generate description", {"detail": str(e)})
+
+        try:
+            logger.info("Starting embedding generation")
+            embedding = self.embedding_generator.generate_embedding(image_base64, description)
+            logger.info("Successfully generated image embedding")
+        except Exception as e:
+            logger.error(f"Failed to generate image embedding: {str(e)}", exc_info=True)
+            raise ImageUploadError("Failed to generate image embedding", {"detail": str(e)})
+
+        return {
+            'id': image_id,
+            'description': description,
+            'embedding': embedding,
+            'createtime': datetime.datetime.now().isoformat(),
+            'image_path': s3_key,
+            'renditions': rendition_keys or {},
+            'content_hash': content_hash,
+            'quality_flags': quality_flags or []
+        }
@@ -129,8 +129,10 @@ class ImageRerank:
                 s3_uri = f"s3://{Config.BUCKET_NAME}/{image_path}"
                 item['image_path'] = s3_uri
             
-            # Get Image object from S3
-            object_key = image_path.replace(f"s3://{Config.BUCKET_NAME}/", "") if image_path.startswith('s3://') else image_path
+            # Get Image object from S3, preferring the small grid thumbnail
+            object_key = item.get('renditions', {}).get('thumb')
+            if not object_key:
+                object_key = image_path.replace(f"s3://{Config.BUCKET_NAME}/", "") if image_path.startswith('s3://') else image_path
             try:
                 image = self._get_image_from_s3(object_key)
                 images.append(image)
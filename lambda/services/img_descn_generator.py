@@ -10,6 +10,7 @@ from utils.aws_client_factory import AWSClientFactory
 import uuid
 import jsonlines
 import logging
+from services.record_manifest import RecordManifest
 
 def image_resize(base64_image_data,width,height):
         try:
@@ -81,29 +82,91 @@ def enrich_image_desc(image_base64):
         # exit(1)
         raise HTTPException(status_code=500, detail=f"Error in resize image: {str(e)}")
 
-def description_generator_invocation_job(image_base64_list, batch_num):
+def mime_type_to_image_format(mime_type):
+    if mime_type == "image/jpeg":
+        return "jpeg"
+    elif mime_type == "image/png":
+        return "png"
+    elif mime_type == "image/webp":
+        return "webp"
+    elif mime_type == "image/gif":
+        return "gif"
+    raise HTTPException(status_code=500, detail=f"Only support MIME type of image/jpeg, image/png, image/webp, image/gif. Got {mime_type} which is not supported.")
+
+def build_description_record(record_id, image_base64, mime_type):
+    """One Bedrock batch-inference input record asking Nova for a description."""
+    return {
+        "recordId": record_id,
+        "modelInput": {
+            "schemaVersion": "messages-v1",
+            "inferenceConfig": {"max_new_tokens": 5000},
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "image": {
+                                "format": mime_type_to_image_format(mime_type),
+                                "source": {"bytes": image_base64},
+                            }
+                        },
+                        {
+                            "text": "Generate description for the image"
+                        }
+                    ],
+                }
+            ]
+        }
+    }
+
+def description_job_paths(job_id, batch_num):
+    """
+    Object locations of one description job: ``(payload_key, output_directory,
+    s3_uris_path)``. They depend only on ``job_id`` and ``batch_num``, so a
+    job whose creation was interrupted can be found again.
+    """
+    file_prefix = f"{job_id}-{str(batch_num)}"
+    return (
+        f"INVOCATION-INPUT-NO-IMAGE/{file_prefix}-descn.jsonl",
+        f"s3://{Config.BUCKET_NAME}/INVOCATION-OUTPUT-NO-IMAGE/{file_prefix}-descn/",
+        f"s3://{Config.BUCKET_NAME}/S3-URI-NO-IMAGE/{file_prefix}-s3uri.ridm"
+    )
+
+def description_job_name(job_id):
+    return f"generate-description-{job_id}"
+
+def description_generator_invocation_job(s3_keys, batch_num, payload_builder, max_edge=None, quality=85, job_id=None,
+                                         min_records=1):
+    """
+    Stream the images under ``s3_keys`` into a description batch input file
+    with ``payload_builder`` (a ``BatchPayloadBuilder``), write the
+    recordId -> S3 URI ``RecordManifest``, then start the Bedrock batch job.
+    ``max_edge`` and ``quality`` downscale the images before they are
+    embedded in the file. ``job_id`` (a UUID string) names the job and its
+    objects; a random one is used when it is not given.
+
+    Returns ``(jobArn, output_directory, s3_uris_path, build_result)``.
+    ``jobArn`` is None when fewer than ``min_records`` images survived the
+    quality gate; no job is started and the input file is removed.
+    """
     # Configure logging
     logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    logger.addHandler(logging.StreamHandler())
     logger.info(f'Start generating invocation job')
 
     # Get uuid
-    uuid_str = str(uuid.uuid4())
-    
+    uuid_str = job_id or str(uuid.uuid4())
+
     # Initialization: Initialize an S3 client
     s3_client = AWSClientFactory.create_s3_client()
     # Initialization: Initialize a bedrock client
     bedrock_client = AWSClientFactory.create_bedrock_client()
     # Initialization: Invocation job configuration
-    description_payload_file_name = f"{uuid_str}-{str(batch_num)}-descn.jsonl"
+    payload_key, output_directory, s3_uris_path = description_job_paths(uuid_str, batch_num)
     discriptionGeneratorInputDataConfig=({
         "s3InputDataConfig": {
-            "s3Uri": f"s3://{Config.BUCKET_NAME}/INVOCATION-INPUT-NO-IMAGE/{description_payload_file_name}"
+            "s3Uri": f"s3://{Config.BUCKET_NAME}/{payload_key}"
         }
     })
-    description_output_folder_name = f"{uuid_str}-{str(batch_num)}-descn/"
-    output_directory = f"s3://{Config.BUCKET_NAME}/INVOCATION-OUTPUT-NO-IMAGE/{description_output_folder_name}"
     discriptionGeneratorOutputDataConfig=({
         "s3OutputDataConfig": {
             "s3Uri": output_directory
@@ -111,75 +174,23 @@ def description_generator_invocation_job(image_base64_list, batch_num):
     })
 
     try:
-        # Construct description generation payload
-        descn_gen_batch_inference_data = []
-        s3_uri_json = {}
-        count = 0
-        for s3_uri in image_base64_list:
-            # Get base64 string
-            image_base64 = image_base64_list[s3_uri]["base64"]
-            mime_type = image_base64_list[s3_uri]["mime_type"]
-            if mime_type == "image/jpeg":
-                format = "jpeg"
-            elif mime_type == "image/png":
-                format = "png"
-            elif mime_type == "image/webp":
-                format = "webp"
-            elif mime_type == "image/gif":
-                format = "gif"
-            else:
-                raise HTTPException(status_code=500, detail=f"Only support MIME type of image/jpeg, image/png, image/webp, image/gif. Got {mime_type} which is not supported.")
-            # Get current time
-            record_id = str(count).zfill(11)
-            descn_gen_payload = {
-                "recordId": record_id, 
-                "modelInput": {
-                    "schemaVersion": "messages-v1",
-                    "inferenceConfig": {"max_new_tokens": 5000},
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "image": {
-                                        "format": format,
-                                        "source": {"bytes": image_base64},
-                                    }
-                                },
-                                {
-                                    "text": "Generate description for the image"
-                                }
-                            ],
-                        }
-                    ]
-                }
-            }
-            descn_gen_batch_inference_data.append(descn_gen_payload)
-            s3_uri_json[record_id] = s3_uri
-            count += 1
-        # Write to local jsonl file
-        with jsonlines.open(f'/tmp/{description_payload_file_name}', 'w') as writer:
-            logger.info(f"payload length {len(description_payload_file_name)}")
-            writer.write_all(descn_gen_batch_inference_data)
-            s3_client.upload_file(f'/tmp/{description_payload_file_name}', Config.BUCKET_NAME, 'INVOCATION-INPUT-NO-IMAGE/'+description_payload_file_name)
+        # Stream the description generation payload to S3
+        build_result = payload_builder.build(s3_keys, payload_key, build_description_record, max_edge, quality)
+        if build_result["records"] < max(min_records, 1):
+            s3_client.delete_object(Bucket=Config.BUCKET_NAME, Key=payload_key)
+            return None, output_directory, None, build_result
+        # Write the recordId -> S3 URI manifest before the job exists, so a started job always has one
+        RecordManifest.write(s3_client, s3_uris_path.replace(f"s3://{Config.BUCKET_NAME}/", ""), build_result["s3_uri_map"])
         # Create and start invocation job
         descn_gen_response = bedrock_client.create_model_invocation_job(
             roleArn=Config.BEDROCK_INVOKE_JOB_ROLE,
             modelId=Config.MULTIMODEL_LLM_ID,
-            jobName=f"generate-description-{uuid_str}",
+            jobName=description_job_name(uuid_str),
             inputDataConfig=discriptionGeneratorInputDataConfig,
             outputDataConfig=discriptionGeneratorOutputDataConfig
         )
         jobArn = descn_gen_response.get('jobArn')
-        # Write all base64 images to a json file
-        s3uri_file_name = f"{uuid_str}-{str(batch_num)}-s3uri.json"
-        with open("/tmp/"+s3uri_file_name, "w") as file:
-            logger.info(f"s3 uri json length: {len(s3_uri_json)}")
-            s3_uri_jsonstr = json.dumps(s3_uri_json, indent=len(s3_uri_json))
-            file.write(s3_uri_jsonstr)
-            s3_client.upload_file("/tmp/"+s3uri_file_name, Config.BUCKET_NAME, 'S3-URI-NO-IMAGE/'+s3uri_file_name)
-            file.close()
-
-        return jobArn, output_directory, f"s3://{Config.BUCKET_NAME}/S3-URI-NO-IMAGE/{s3uri_file_name}"
+
+        return jobArn, output_directory, s3_uris_path, build_result
     except (ClientError, Exception) as e:
         raise HTTPException(status_code=500, detail=f"Error when creating invocation job: {str(e)}")
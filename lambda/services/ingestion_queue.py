@@ -0,0 +1,413 @@
+import os
+import json
+import time
+import uuid
+import datetime
+import logging
+import threading
+from typing import List, Dict, Optional, Tuple
+from utils.config import Config
+from utils.aws_client_factory import AWSClientFactory
+
+logger = logging.getLogger()
+
+class ItemState:
+    PENDING = "PENDING"
+    PROCESSING = "PROCESSING"
+    INDEXED = "INDEXED"
+    FAILED = "FAILED"
+
+FINISHED_STATES = (ItemState.INDEXED, ItemState.FAILED)
+
+def job_status(job_id: str, createtime: str, items: List[Dict]) -> Dict:
+    """The ``GET /images/jobs/{job_id}`` response body from the job's items, in request order."""
+    counts = {ItemState.PENDING: 0, ItemState.PROCESSING: 0, ItemState.INDEXED: 0, ItemState.FAILED: 0}
+    for item in items:
+        counts[item["state"]] += 1
+    return {
+        "job_id": job_id,
+        "createtime": createtime,
+        "counts": counts,
+        "done": counts[ItemState.PENDING] == 0 and counts[ItemState.PROCESSING] == 0,
+        "items": [
+            {
+                "item_id": item["item_id"],
+                "state": item["state"],
+                "attempts": item["attempts"],
+                "error": item["error"],
+                "image_id": item.get("image_id"),
+                "updatetime": item["updatetime"]
+            }
+            for item in items
+        ]
+    }
+
+class FileIngestionQueue:
+    """
+    Ingestion work items kept on the local filesystem, for local runs and
+    tests. Items are processed by the in-process ``IngestionWorker`` thread,
+    so this queue only lasts as long as the process (and its disk) does.
+
+    Layout under ``queue_dir``::
+
+        jobs/{job_id}.json          -> {"job_id", "createtime", "item_ids"}
+        items/{item_id}.json        -> {"item_id", "job_id", "state", "payload", ...}
+        pending/{order}-{item_id}   -> empty marker, oldest first by name
+        processing/{item_id}        -> empty marker
+
+    ``claim`` and ``has_pending`` only list the marker directories, never the
+    item files. Every write goes to a temporary file followed by
+    ``os.replace`` so a crash never leaves a half-written item behind. Items
+    that were PROCESSING when the process died are put back to PENDING by
+    ``recover()``. Finished jobs are deleted by ``expire()`` once all their
+    items have been finished for ``retention_seconds``.
+    """
+    local = True
+
+    def __init__(self, queue_dir: str, retention_seconds: float = 86400):
+        self.queue_dir = queue_dir
+        self.retention_seconds = retention_seconds
+        self.jobs_dir = os.path.join(queue_dir, "jobs")
+        self.items_dir = os.path.join(queue_dir, "items")
+        self.pending_dir = os.path.join(queue_dir, "pending")
+        self.processing_dir = os.path.join(queue_dir, "processing")
+        for directory in (self.jobs_dir, self.items_dir, self.pending_dir, self.processing_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _write_json(self, path: str, data: Dict):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path: str) -> Optional[Dict]:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _touch(path: str):
+        with open(path, "w"):
+            pass
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _item_path(self, item_id: str) -> str:
+        return os.path.join(self.items_dir, f"{item_id}.json")
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _pending_path(self, item: Dict) -> str:
+        return os.path.join(self.pending_dir, f"{item['order']}-{item['item_id']}")
+
+    def enqueue(self, payloads: List[Dict]) -> Dict:
+        """Persist one job with one work item per payload and return the job record."""
+        job_id = str(uuid.uuid4())
+        now = datetime.datetime.now().isoformat()
+        items = []
+        with self._lock:
+            for payload in payloads:
+                item = {
+                    "item_id": str(uuid.uuid4()),
+                    "job_id": job_id,
+                    # Zero-padded so pending markers sort oldest first
+                    "order": f"{time.time_ns():020d}",
+                    "state": ItemState.PENDING,
+                    "createtime": now,
+                    "updatetime": now,
+                    "attempts": 0,
+                    "error": None,
+                    "payload": payload
+                }
+                self._write_json(self._item_path(item["item_id"]), item)
+                items.append(item)
+            job = {"job_id": job_id, "createtime": now, "item_ids": [item["item_id"] for item in items]}
+            self._write_json(self._job_path(job_id), job)
+            # Markers last: an item is only claimable once the job record exists
+            for item in items:
+                self._touch(self._pending_path(item))
+        return job
+
+    def claim(self, max_items: int) -> List[Dict]:
+        """Move up to ``max_items`` PENDING items to PROCESSING, oldest first."""
+        claimed = []
+        with self._lock:
+            for marker in sorted(os.listdir(self.pending_dir))[:max_items]:
+                item_id = marker.split("-", 1)[1]
+                item = self._read_json(self._item_path(item_id))
+                self._remove(os.path.join(self.pending_dir, marker))
+                if item is None:
+                    continue
+                item["state"] = ItemState.PROCESSING
+                item["attempts"] += 1
+                item["updatetime"] = datetime.datetime.now().isoformat()
+                self._write_json(self._item_path(item_id), item)
+                self._touch(os.path.join(self.processing_dir, item_id))
+                claimed.append(item)
+        return claimed
+
+    def mark(self, item: Dict, state: str, error: Optional[str] = None, result: Optional[Dict] = None):
+        """Record the final state of a claimed item and drop its payload once it is done."""
+        with self._lock:
+            stored = self._read_json(self._item_path(item["item_id"]))
+            if stored is None:
+                return
+            stored["state"] = state
+            stored["error"] = error
+            stored["updatetime"] = datetime.datetime.now().isoformat()
+            if result is not None:
+                stored["result"] = result
+            if state in FINISHED_STATES:
+                stored["payload"] = None
+            self._write_json(self._item_path(item["item_id"]), stored)
+            if state in FINISHED_STATES:
+                self._remove(os.path.join(self.processing_dir, item["item_id"]))
+
+    def recover(self) -> int:
+        """Requeue items left in PROCESSING by a previous process."""
+        recovered = 0
+        with self._lock:
+            for item_id in os.listdir(self.processing_dir):
+                item = self._read_json(self._item_path(item_id))
+                if item and item["state"] == ItemState.PROCESSING:
+                    item["state"] = ItemState.PENDING
+                    self._write_json(self._item_path(item_id), item)
+                    self._touch(self._pending_path(item))
+                    recovered += 1
+                self._remove(os.path.join(self.processing_dir, item_id))
+        return recovered
+
+    def has_pending(self) -> bool:
+        with os.scandir(self.pending_dir) as entries:
+            return any(True for _ in entries)
+
+    def expire(self) -> int:
+        """Delete jobs whose items all finished more than ``retention_seconds`` ago; returns the number deleted."""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=self.retention_seconds)).isoformat()
+        expired = 0
+        with self._lock:
+            for file_name in os.listdir(self.jobs_dir):
+                if not file_name.endswith(".json"):
+                    continue
+                job = self._read_json(os.path.join(self.jobs_dir, file_name))
+                if job is None or job["createtime"] > cutoff:
+                    continue
+                items = [self._read_json(self._item_path(item_id)) for item_id in job["item_ids"]]
+                if any(item and (item["state"] not in FINISHED_STATES or item["updatetime"] > cutoff) for item in items):
+                    continue
+                for item_id in job["item_ids"]:
+                    self._remove(self._item_path(item_id))
+                self._remove(self._job_path(job["job_id"]))
+                expired += 1
+        return expired
+
+    def get_job_status(self, job_id: str) -> Optional[Dict]:
+        job = self._read_json(self._job_path(job_id))
+        if job is None:
+            return None
+        items = []
+        for item_id in job["item_ids"]:
+            item = self._read_json(self._item_path(item_id))
+            if item is not None:
+                items.append({**item, "image_id": (item.get("result") or {}).get("image_id")})
+        return job_status(job_id, job["createtime"], items)
+
+class SqsIngestionQueue:
+    """
+    Ingestion work items for deployed functions, shared by every instance.
+
+    Each payload (the base64 image can be far larger than an SQS message) is
+    written to ``payload_prefix{job_id}/{item_id}.json`` in S3, the item
+    state to a DynamoDB table keyed by ``job_id`` (partition) and
+    ``item_id`` (sort), and a ``{"ingest": {"job_id", "item_id"}}`` message
+    to SQS. The queue triggers the function, which processes the messages
+    within the invocation (``IngestionWorker.handle``); nothing runs after a
+    response is sent. A message whose processing was cut short becomes
+    visible again and is retried; payloads are deleted once an item is
+    finished and the DynamoDB ``expires_at`` TTL removes finished items
+    after ``retention_seconds``.
+
+    Claiming an item is a conditional update that sets ``claimed_until``
+    ``claim_seconds`` ahead: a duplicate delivery of a message whose item is
+    being processed is retried later rather than processed twice, and the
+    item can only be claimed again once that claim has run out.
+    """
+    local = False
+    SEND_BATCH_SIZE = 10
+
+    def __init__(self, sqs_client, queue_url: str, s3_client, bucket: str, payload_prefix: str, table,
+                 retention_seconds: float = 86400, claim_seconds: float = 900):
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.payload_prefix = payload_prefix
+        self.table = table
+        self.retention_seconds = retention_seconds
+        self.claim_seconds = claim_seconds
+
+    def _payload_key(self, job_id: str, item_id: str) -> str:
+        return f"{self.payload_prefix}{job_id}/{item_id}.json"
+
+    def _expires_at(self) -> int:
+        return int(time.time() + self.retention_seconds)
+
+    @staticmethod
+    def is_ingest_event(event: Dict) -> bool:
+        """True for SQS events delivered from the ingestion queue."""
+        records = event.get("Records") or []
+        if not records or records[0].get("eventSource") != "aws:sqs":
+            return False
+        try:
+            return "ingest" in json.loads(records[0]["body"])
+        except (TypeError, ValueError):
+            return False
+
+    def enqueue(self, payloads: List[Dict]) -> Dict:
+        """Persist payloads and item states, then send one message per item; returns the job record."""
+        job_id = str(uuid.uuid4())
+        now = datetime.datetime.now().isoformat()
+        item_ids = [str(uuid.uuid4()) for _ in payloads]
+        for item_id, payload in zip(item_ids, payloads):
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self._payload_key(job_id, item_id),
+                Body=json.dumps(payload).encode('utf-8'),
+                ContentType='application/json'
+            )
+        with self.table.batch_writer() as batch:
+            for position, (item_id, payload) in enumerate(zip(item_ids, payloads)):
+                batch.put_item(Item={
+                    "job_id": job_id,
+                    "item_id": item_id,
+                    "position": position,
+                    "state": ItemState.PENDING,
+                    "createtime": now,
+                    "updatetime": now,
+                    "attempts": 0,
+                    "image_id": payload["image_id"],
+                    "expires_at": self._expires_at()
+                })
+        for start in range(0, len(item_ids), self.SEND_BATCH_SIZE):
+            entries = [
+                {"Id": str(index), "MessageBody": json.dumps({"ingest": {"job_id": job_id, "item_id": item_id}})}
+                for index, item_id in enumerate(item_ids[start:start + self.SEND_BATCH_SIZE])
+            ]
+            response = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get("Failed"):
+                raise RuntimeError(f"Failed to queue {len(response['Failed'])} ingestion items: {response['Failed'][0].get('Message')}")
+        return {"job_id": job_id, "createtime": now, "item_ids": item_ids}
+
+    def _claim_one(self, job_id: str, item_id: str) -> Optional[Dict]:
+        now = time.time()
+        try:
+            state = self.table.update_item(
+                Key={"job_id": job_id, "item_id": item_id},
+                UpdateExpression="SET #state = :processing, updatetime = :updatetime, claimed_until = :claimed_until ADD attempts :one",
+                # Only pending items, or items whose claim ran out because the invocation processing them died
+                ConditionExpression=("attribute_exists(item_id) AND (#state = :pending OR "
+                                     "(#state = :processing AND (attribute_not_exists(claimed_until) OR claimed_until < :now)))"),
+                ExpressionAttributeNames={"#state": "state"},
+                ExpressionAttributeValues={
+                    ":processing": ItemState.PROCESSING, ":pending": ItemState.PENDING,
+                    ":updatetime": datetime.datetime.now().isoformat(), ":one": 1,
+                    ":now": int(now), ":claimed_until": int(now + self.claim_seconds)
+                },
+                ReturnValues="ALL_NEW",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD"
+            )["Attributes"]
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException as e:
+            current = e.response.get("Item", {}).get("state", {}).get("S")
+            if current == ItemState.PROCESSING:
+                # Another invocation holds the claim; retry the message after the visibility timeout
+                raise RuntimeError(f"Ingestion item {item_id} is being processed elsewhere")
+            # A redelivered message of a finished (or expired) item is dropped
+            logger.info(f"Skipping ingestion item {item_id}: already finished")
+            return None
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=self._payload_key(job_id, item_id))["Body"].read()
+        except self.s3.exceptions.NoSuchKey:
+            self.mark({"job_id": job_id, "item_id": item_id}, ItemState.FAILED, error="Payload not found")
+            return None
+        return {"item_id": item_id, "job_id": job_id, "attempts": int(state["attempts"]), "payload": json.loads(body)}
+
+    def claim_event(self, event: Dict) -> Tuple[List[Dict], List[str]]:
+        """
+        Items of an SQS event, moved to PROCESSING. Returns the items and the
+        message ids that could not be claimed and should be retried.
+        """
+        items = []
+        failed_message_ids = []
+        for record in event.get("Records", []):
+            try:
+                ref = json.loads(record["body"])["ingest"]
+                item = self._claim_one(ref["job_id"], ref["item_id"])
+            except Exception as e:
+                logger.error(f"Failed to claim ingestion message {record.get('messageId')}: {str(e)}")
+                failed_message_ids.append(record["messageId"])
+                continue
+            if item is not None:
+                items.append({**item, "message_id": record["messageId"]})
+        return items, failed_message_ids
+
+    def mark(self, item: Dict, state: str, error: Optional[str] = None, result: Optional[Dict] = None):
+        """Record the final state of a claimed item and delete its payload once it is done."""
+        values = {":state": state, ":error": error, ":now": datetime.datetime.now().isoformat(),
+                  ":expires": self._expires_at()}
+        expression = "SET #state = :state, #error = :error, updatetime = :now, expires_at = :expires"
+        if result is not None and result.get("image_id"):
+            expression += ", image_id = :image_id"
+            values[":image_id"] = result["image_id"]
+        self.table.update_item(
+            Key={"job_id": item["job_id"], "item_id": item["item_id"]},
+            UpdateExpression=expression,
+            ExpressionAttributeNames={"#state": "state", "#error": "error"},
+            ExpressionAttributeValues=values
+        )
+        if state in FINISHED_STATES:
+            self.s3.delete_object(Bucket=self.bucket, Key=self._payload_key(item["job_id"], item["item_id"]))
+
+    def get_job_status(self, job_id: str) -> Optional[Dict]:
+        items = []
+        query = {
+            "KeyConditionExpression": "job_id = :job_id",
+            "ExpressionAttributeValues": {":job_id": job_id},
+            "ConsistentRead": True
+        }
+        while True:
+            response = self.table.query(**query)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                break
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        if not items:
+            return None
+        items.sort(key=lambda item: int(item["position"]))
+        items = [{**item, "attempts": int(item["attempts"]), "error": item.get("error")} for item in items]
+        return job_status(job_id, min(item["createtime"] for item in items), items)
+
+def create_ingestion_queue(s3_client):
+    """The queue selected by ``Config.INGEST_QUEUE``: 'local' keeps items on disk, anything else uses SQS and DynamoDB."""
+    if Config.INGEST_QUEUE == 'local':
+        return FileIngestionQueue(Config.INGEST_QUEUE_DIR, Config.INGEST_RETENTION_SECONDS)
+    return SqsIngestionQueue(
+        AWSClientFactory.create_sqs_client(),
+        Config.INGEST_QUEUE_URL,
+        s3_client,
+        Config.BUCKET_NAME,
+        Config.INGEST_PAYLOAD_PREFIX,
+        AWSClientFactory.create_dynamodb_table(Config.INGEST_JOB_TABLE),
+        Config.INGEST_RETENTION_SECONDS,
+        Config.INGEST_CLAIM_SECONDS
+    )
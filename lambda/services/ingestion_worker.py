@@ -0,0 +1,204 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Callable, Optional
+from services.ingestion_queue import ItemState
+from services.image_ingestor import ImageIngestor
+
+logger = logging.getLogger()
+
+class BulkIndexBuffer:
+    """
+    Coalesces finished documents into bulk requests. A flush happens as soon as
+    ``max_docs`` documents are buffered, or when the oldest buffered document
+    has waited ``max_wait_seconds``.
+    """
+    def __init__(self, opensearch_client, max_docs: int, max_wait_seconds: float,
+                 on_result: Callable[[Dict, Optional[str]], None]):
+        self.opensearch_client = opensearch_client
+        self.max_docs = max_docs
+        self.max_wait_seconds = max_wait_seconds
+        self.on_result = on_result
+        self._entries: List[Dict] = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def add(self, entry: Dict):
+        """``entry`` holds at least ``item_id`` and ``document``."""
+        batch = None
+        with self._lock:
+            if not self._entries:
+                self._oldest = time.monotonic()
+            self._entries.append(entry)
+            if len(self._entries) >= self.max_docs:
+                batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def flush_if_due(self):
+        batch = None
+        with self._lock:
+            if self._entries and time.monotonic() - self._oldest >= self.max_wait_seconds:
+                batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _take(self) -> List[Dict]:
+        batch = self._entries
+        self._entries = []
+        self._oldest = None
+        return batch
+
+    def _send(self, batch: List[Dict]):
+        logger.info(f"Bulk indexing {len(batch)} documents")
+        try:
+            response = self.opensearch_client.bulk_upload([entry["document"] for entry in batch])
+        except Exception as e:
+            logger.error(f"Bulk indexing failed: {str(e)}")
+            for entry in batch:
+                self.on_result(entry, str(e))
+            return
+        items = response.get("items", [])
+        for i, entry in enumerate(batch):
+            error = None
+            if i < len(items):
+                result = next(iter(items[i].values()))
+                if "error" in result:
+                    error = str(result["error"])
+            self.on_result(entry, error)
+
+class IngestionWorker:
+    """
+    Processes ingestion queue items: images are described and embedded
+    concurrently on a thread pool, and the resulting documents are indexed
+    through a ``BulkIndexBuffer``.
+
+    With a local queue (``FileIngestionQueue``) ``start`` runs a background
+    dispatcher that claims items as they arrive. With the SQS queue the
+    function is invoked with the queued messages and ``handle`` processes
+    them before the invocation returns.
+    """
+    EXPIRE_INTERVAL_SECONDS = 600
+
+    def __init__(self, queue, ingestor: ImageIngestor, opensearch_client,
+                 max_workers: int = 4, bulk_max_docs: int = 50, bulk_max_wait_seconds: float = 2.0,
+                 poll_interval: float = 0.5):
+        self.queue = queue
+        self.ingestor = ingestor
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.buffer = BulkIndexBuffer(opensearch_client, bulk_max_docs, bulk_max_wait_seconds, self._on_indexed)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._wakeup = threading.Event()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"Requeued {recovered} ingestion items left in progress")
+        self._thread = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _run(self):
+        last_expired = 0
+        while True:
+            if time.monotonic() - last_expired >= self.EXPIRE_INTERVAL_SECONDS:
+                expired = self.queue.expire()
+                if expired:
+                    logger.info(f"Expired {expired} finished ingestion jobs")
+                last_expired = time.monotonic()
+            with self._in_flight_lock:
+                free_slots = self.max_workers - self._in_flight
+            items = self.queue.claim(free_slots) if free_slots > 0 else []
+            for item in items:
+                with self._in_flight_lock:
+                    self._in_flight += 1
+                self._executor.submit(self._process, item)
+            self.buffer.flush_if_due()
+            if not items:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _prepare(self, item: Dict) -> Optional[Dict]:
+        """The buffer entry of an item, or None once the item is marked FAILED."""
+        payload = item["payload"]
+        image_id = payload["image_id"]
+        stored = None
+        try:
+            image_data = self.ingestor.decode_image(payload["image"])
+            quality_flags = self.ingestor.check_quality(image_data)
+            stored = self.ingestor.store_image(image_data)
+            s3_key, content_hash, created = stored
+            rendition_keys, embed_base64 = self.ingestor.store_renditions(content_hash, image_data)
+            document = self.ingestor.build_document(image_id, embed_base64, payload.get("description", ""), s3_key,
+                                                    rendition_keys, content_hash, quality_flags)
+            if payload.get("tags"):
+                document["tags"] = payload["tags"]
+            return {"item": item, "document": document, "stored": stored}
+        except Exception as e:
+            logger.error(f"Failed to process ingestion item {item['item_id']}: {str(e)}")
+            if stored:
+                self.ingestor.discard_image(*stored)
+            self.queue.mark(item, ItemState.FAILED, error=str(getattr(e, "detail", e)))
+            return None
+
+    def _process(self, item: Dict):
+        try:
+            entry = self._prepare(item)
+            if entry is not None:
+                self.buffer.add(entry)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+            self.notify()
+
+    def handle(self, event: Dict) -> Dict:
+        """
+        Process one SQS event from the ingestion queue within the invocation.
+        Messages that could not be claimed are reported in ``batchItemFailures``
+        and retried by SQS; items that fail to process are marked FAILED.
+        """
+        items, failed_message_ids = self.queue.claim_event(event)
+        logger.info(f"Ingesting {len(items)} queued images")
+        if items:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+                entries = [entry for entry in executor.map(self._prepare, items) if entry is not None]
+        else:
+            entries = []
+        results = {}
+        for entry in entries:
+            self.buffer.add({**entry, "results": results})
+        self.buffer.flush()
+        indexed = sum(1 for error in results.values() if error is None)
+        return {
+            "processed": len(items),
+            "indexed": indexed,
+            "failed": len(items) - indexed,
+            "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_message_ids]
+        }
+
+    def _on_indexed(self, entry: Dict, error: Optional[str]):
+        if error is None:
+            self.queue.mark(entry["item"], ItemState.INDEXED, result={"image_id": entry["document"]["id"]})
+        else:
+            self.ingestor.discard_image(*entry["stored"])
+            self.queue.mark(entry["item"], ItemState.FAILED, error=error)
+        if "results" in entry:
+            entry["results"][entry["item"]["item_id"]] = error
@@ -0,0 +1,233 @@
+import io
+import csv
+import gzip
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+from utils.config import Config
+from utils.image_renditions import RENDITION_PREFIX
+from services.batch_payload_builder import bounded_map
+
+logger = logging.getLogger()
+
+# Split points for prefixes without sub-folders, in S3 (UTF-8 byte) order
+KEY_RANGE_SPLIT_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+def is_image_key(key: str) -> bool:
+    return not key.endswith('/') and not key.startswith(RENDITION_PREFIX)
+
+def parse_s3_uri(s3_uri: str) -> Tuple[str, str]:
+    bucket, _, key = s3_uri.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+class S3PrefixKeySource:
+    """
+    Lists the image keys under a prefix with several list_objects_v2
+    paginators running at once.
+
+    The prefix is cut into key ranges ``(lower, upper]``: at the sub-folders
+    found by one delimiter listing, or, for flat prefixes, at
+    ``KEY_RANGE_SPLIT_CHARS``. Each range is listed from ``StartAfter=lower``
+    until a key passes ``upper``. Ranges are listed concurrently but yielded
+    in order, so keys come out sorted exactly as a single paginator returns
+    them and ``start_after`` resumption keeps working.
+    """
+    def __init__(self, s3_client, s3_folder_prefix: str, max_workers: int = 16):
+        self.s3 = s3_client
+        self.prefix = s3_folder_prefix
+        self.max_workers = max_workers
+
+    def _boundaries(self) -> List[str]:
+        response = self.s3.list_objects_v2(Bucket=Config.BUCKET_NAME, Prefix=self.prefix, Delimiter='/')
+        sub_prefixes = [common['Prefix'] for common in response.get('CommonPrefixes', [])]
+        if len(sub_prefixes) >= 2 and not response.get('IsTruncated'):
+            return sorted(sub_prefixes)
+        return [self.prefix + char for char in KEY_RANGE_SPLIT_CHARS]
+
+    def partitions(self, start_after: Optional[str] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+        """Key ranges ``(lower, upper]`` covering the prefix after ``start_after``; None is unbounded."""
+        bounds = [None] + self._boundaries() + [None]
+        ranges = []
+        for lower, upper in zip(bounds, bounds[1:]):
+            if start_after is not None and upper is not None and upper <= start_after:
+                continue
+            if start_after is not None and (lower is None or lower < start_after):
+                lower = start_after
+            ranges.append((lower, upper))
+        return ranges
+
+    def _list_range(self, key_range: Tuple[Optional[str], Optional[str]]) -> List[Tuple[str, int]]:
+        lower, upper = key_range
+        kwargs = {"Bucket": Config.BUCKET_NAME, "Prefix": self.prefix}
+        if lower:
+            kwargs["StartAfter"] = lower
+        keys = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get('Contents', []):
+                if upper is not None and obj['Key'] > upper:
+                    return keys
+                if is_image_key(obj['Key']):
+                    keys.append((obj['Key'], obj.get('Size', 0)))
+        return keys
+
+    def iter_positioned(self, cursor: Optional[Dict] = None) -> Iterator[Tuple[str, int, Dict]]:
+        """Yield ``(key, size, cursor)`` for every image key in S3 order; ``cursor`` resumes after that key."""
+        start_after = (cursor or {}).get("start_after")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for objects in bounded_map(executor, self._list_range, self.partitions(start_after), self.max_workers):
+                for key, size in objects:
+                    yield key, size, {"start_after": key}
+
+    def iter_objects(self, cursor: Optional[Dict] = None) -> Iterator[Tuple[str, int]]:
+        for key, size, _ in self.iter_positioned(cursor):
+            yield key, size
+
+    def list_chunk(self, cursor: Optional[Dict], max_keys: int) -> Tuple[List[Tuple[str, int]], Optional[Dict]]:
+        """
+        Up to ``max_keys`` ``(key, size)`` pairs after ``cursor`` with a
+        single paginator, which stops as soon as it has enough; for callers
+        that list a little at a time and must not list whole key ranges.
+        Returns the pairs and the cursor to continue from.
+        """
+        kwargs = {"Bucket": Config.BUCKET_NAME, "Prefix": self.prefix}
+        if cursor and cursor.get("start_after"):
+            kwargs["StartAfter"] = cursor["start_after"]
+        objects = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get('Contents', []):
+                if is_image_key(obj['Key']):
+                    objects.append((obj['Key'], obj.get('Size', 0)))
+                    if len(objects) >= max_keys:
+                        return objects, {"start_after": obj['Key']}
+        return objects, ({"start_after": objects[-1][0]} if objects else cursor)
+
+class S3InventoryKeySource:
+    """
+    Reads image keys from an S3 Inventory report instead of listing the
+    bucket. ``manifest_uri`` points at the report's ``manifest.json``; CSV
+    (gzip) and Parquet data files are supported and fetched concurrently.
+    Keys are yielded in manifest file order; the resume cursor is
+    ``{"file": index, "row": row}``, the next parsed row of a data file, so a
+    resume starts reading at that file instead of counting keys again from
+    the first one.
+    """
+    def __init__(self, s3_client, manifest_uri: str, s3_folder_prefix: str = "", max_workers: int = 8):
+        self.s3 = s3_client
+        self.manifest_uri = manifest_uri
+        self.prefix = s3_folder_prefix or ""
+        self.max_workers = max_workers
+        self._manifest = None
+        # The last data file read by list_chunk, which consecutive chunks usually share
+        self._loaded: Tuple[int, List[Tuple[str, str, int]]] = (-1, [])
+
+    def _read(self, bucket: str, key: str) -> bytes:
+        return self.s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    def _keys_from_csv(self, data: bytes, schema: List[str]) -> List[Tuple[str, str, int]]:
+        columns = {name: index for index, name in enumerate(schema)}
+        delete_marker = columns.get("IsDeleteMarker")
+        size = columns.get("Size")
+        rows = []
+        for row in csv.reader(io.StringIO(gzip.decompress(data).decode('utf-8'))):
+            if delete_marker is not None and row[delete_marker].lower() == "true":
+                continue
+            # CSV inventory keys are URL-encoded
+            rows.append((row[columns["Bucket"]], unquote(row[columns["Key"]]),
+                         int(row[size] or 0) if size is not None else 0))
+        return rows
+
+    def _keys_from_parquet(self, data: bytes) -> List[Tuple[str, str, int]]:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Parquet inventory reports need pyarrow installed")
+        table = pq.read_table(io.BytesIO(data))
+        columns = {name.lower(): name for name in table.column_names}
+        buckets = table.column(columns["bucket"]).to_pylist()
+        keys = table.column(columns["key"]).to_pylist()
+        sizes = table.column(columns["size"]).to_pylist() if "size" in columns else [0] * len(keys)
+        markers = table.column(columns["is_delete_marker"]).to_pylist() if "is_delete_marker" in columns else [False] * len(keys)
+        return [(bucket, key, size or 0) for bucket, key, size, marker in zip(buckets, keys, sizes, markers) if not marker]
+
+    def _read_manifest(self) -> Dict:
+        if self._manifest is not None:
+            return self._manifest
+        manifest_bucket, manifest_key = parse_s3_uri(self.manifest_uri)
+        manifest = json.loads(self._read(manifest_bucket, manifest_key))
+        if manifest.get("sourceBucket") and manifest["sourceBucket"] != Config.BUCKET_NAME:
+            raise Exception(f"Inventory {self.manifest_uri} describes bucket {manifest['sourceBucket']}, not {Config.BUCKET_NAME}")
+        file_format = manifest.get("fileFormat", "CSV").upper()
+        if file_format not in ("CSV", "PARQUET"):
+            raise Exception(f"Unsupported inventory format {file_format}")
+        manifest["fileFormat"] = file_format
+        manifest["dataBucket"] = manifest.get("destinationBucket", f"arn:aws:s3:::{manifest_bucket}").split(":::")[-1]
+        self._manifest = manifest
+        return manifest
+
+    def _load(self, data_file: Dict) -> List[Tuple[str, str, int]]:
+        manifest = self._read_manifest()
+        data = self._read(manifest["dataBucket"], data_file["key"])
+        if manifest["fileFormat"] == "CSV":
+            schema = [name.strip() for name in manifest.get("fileSchema", "").split(",")]
+            return self._keys_from_csv(data, schema)
+        return self._keys_from_parquet(data)
+
+    def _wanted(self, bucket: str, key: str) -> bool:
+        return bucket == Config.BUCKET_NAME and key.startswith(self.prefix) and is_image_key(key)
+
+    @staticmethod
+    def _cursor_after(file_index: int, row_index: int, rows: List) -> Dict:
+        if row_index + 1 >= len(rows):
+            return {"file": file_index + 1, "row": 0}
+        return {"file": file_index, "row": row_index + 1}
+
+    def iter_positioned(self, cursor: Optional[Dict] = None) -> Iterator[Tuple[str, int, Dict]]:
+        """Yield ``(key, size, cursor)`` for every image key in the report; ``cursor`` resumes after that key."""
+        files = self._read_manifest()["files"]
+        start_file = (cursor or {}).get("file", 0)
+        start_row = (cursor or {}).get("row", 0)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            loaded = bounded_map(executor, self._load, files[start_file:], self.max_workers)
+            for file_index, rows in enumerate(loaded, start_file):
+                for row_index in range(start_row if file_index == start_file else 0, len(rows)):
+                    bucket, key, size = rows[row_index]
+                    if self._wanted(bucket, key):
+                        yield key, size, self._cursor_after(file_index, row_index, rows)
+
+    def iter_objects(self, cursor: Optional[Dict] = None) -> Iterator[Tuple[str, int]]:
+        for key, size, _ in self.iter_positioned(cursor):
+            yield key, size
+
+    def list_chunk(self, cursor: Optional[Dict], max_keys: int) -> Tuple[List[Tuple[str, int]], Optional[Dict]]:
+        """
+        Up to ``max_keys`` ``(key, size)`` pairs from ``cursor`` on, reading
+        only the data files they come from. Returns the pairs and the cursor
+        to continue from.
+        """
+        files = self._read_manifest()["files"]
+        file_index = (cursor or {}).get("file", 0)
+        row_index = (cursor or {}).get("row", 0)
+        objects = []
+        while file_index < len(files) and len(objects) < max_keys:
+            if self._loaded[0] != file_index:
+                self._loaded = (file_index, self._load(files[file_index]))
+            rows = self._loaded[1]
+            while row_index < len(rows) and len(objects) < max_keys:
+                bucket, key, size = rows[row_index]
+                row_index += 1
+                if self._wanted(bucket, key):
+                    objects.append((key, size))
+            if row_index >= len(rows):
+                file_index += 1
+                row_index = 0
+        return objects, {"file": file_index, "row": row_index}
+
+def create_key_source(s3_client, s3_folder_prefix: str, inventory_manifest: Optional[str] = None):
+    """An inventory reader when ``inventory_manifest`` is given, otherwise a parallel prefix lister."""
+    if inventory_manifest:
+        return S3InventoryKeySource(s3_client, inventory_manifest, s3_folder_prefix, Config.INVENTORY_READ_WORKERS)
+    return S3PrefixKeySource(s3_client, s3_folder_prefix, Config.LIST_WORKERS)
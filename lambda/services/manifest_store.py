@@ -0,0 +1,166 @@
+import os
+import json
+import uuid
+import fcntl
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from botocore.exceptions import ClientError
+from utils.config import Config
+
+class ManifestConflictError(Exception):
+    """The manifest changed since it was loaded; the conditional save was not applied."""
+
+class LocalManifestStore:
+    """
+    Manifests as JSON files under ``manifest_dir``, written atomically. The
+    version of a manifest is the MD5 of its file, and a conditional save
+    compares it under an exclusive lock on ``.lock``. Parts of a manifest
+    (large lists it only references) live under ``{manifest_id}/``.
+    """
+    local = True
+    _thread_lock = threading.Lock()
+
+    def __init__(self, manifest_dir: str):
+        self.manifest_dir = manifest_dir
+        os.makedirs(manifest_dir, exist_ok=True)
+
+    def _path(self, manifest_id: str) -> str:
+        return os.path.join(self.manifest_dir, f"{manifest_id}.json")
+
+    def _part_path(self, manifest_id: str, name: str) -> str:
+        return os.path.join(self.manifest_dir, manifest_id, f"{name}.json")
+
+    @staticmethod
+    def _write(path: str, body: bytes):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, manifest_id: str, manifest: Dict, expected_version: Optional[str] = None) -> str:
+        """Write the manifest and return its new version; with ``expected_version`` only if it is still current."""
+        body = json.dumps(manifest).encode("utf-8")
+        with self._thread_lock, open(os.path.join(self.manifest_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if expected_version is not None:
+                current = self._read(self._path(manifest_id))
+                if current is None or hashlib.md5(current).hexdigest() != expected_version:
+                    raise ManifestConflictError(manifest_id)
+            self._write(self._path(manifest_id), body)
+        return hashlib.md5(body).hexdigest()
+
+    def load_versioned(self, manifest_id: str) -> Tuple[Optional[Dict], Optional[str]]:
+        body = self._read(self._path(manifest_id))
+        if body is None:
+            return None, None
+        return json.loads(body), hashlib.md5(body).hexdigest()
+
+    def load(self, manifest_id: str) -> Optional[Dict]:
+        return self.load_versioned(manifest_id)[0]
+
+    def list_ids(self) -> List[str]:
+        return [name[:-len(".json")] for name in os.listdir(self.manifest_dir) if name.endswith(".json")]
+
+    def save_part(self, manifest_id: str, name: str, data: Dict):
+        os.makedirs(os.path.join(self.manifest_dir, manifest_id), exist_ok=True)
+        self._write(self._part_path(manifest_id, name), json.dumps(data).encode("utf-8"))
+
+    def load_part(self, manifest_id: str, name: str) -> Optional[Dict]:
+        body = self._read(self._part_path(manifest_id, name))
+        return None if body is None else json.loads(body)
+
+    def delete_part(self, manifest_id: str, name: str):
+        try:
+            os.remove(self._part_path(manifest_id, name))
+        except FileNotFoundError:
+            pass
+
+class S3ManifestStore:
+    """
+    Manifests as JSON objects under ``prefix``; a PUT replaces the object
+    atomically. The version of a manifest is its ETag, and a conditional
+    save is a PUT with ``IfMatch``, so two writers can never both apply a
+    change made from the same version. Parts of a manifest live under
+    ``prefix{manifest_id}/``.
+    """
+    local = False
+    CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+    def __init__(self, s3_client, bucket: str, prefix: str):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def save(self, manifest_id: str, manifest: Dict, expected_version: Optional[str] = None) -> str:
+        """Write the manifest and return its new version; with ``expected_version`` only if it is still current."""
+        kwargs = {}
+        if expected_version is not None:
+            kwargs["IfMatch"] = expected_version
+        try:
+            response = self.s3.put_object(
+                Bucket=self.bucket,
+                Key=f"{self.prefix}{manifest_id}.json",
+                Body=json.dumps(manifest).encode('utf-8'),
+                ContentType='application/json',
+                **kwargs
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in self.CONFLICT_CODES:
+                raise ManifestConflictError(manifest_id)
+            raise
+        return response["ETag"]
+
+    def load_versioned(self, manifest_id: str) -> Tuple[Optional[Dict], Optional[str]]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{manifest_id}.json")
+        except self.s3.exceptions.NoSuchKey:
+            return None, None
+        return json.loads(response["Body"].read().decode("utf-8")), response["ETag"]
+
+    def load(self, manifest_id: str) -> Optional[Dict]:
+        return self.load_versioned(manifest_id)[0]
+
+    def list_ids(self) -> List[str]:
+        ids = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        # The delimiter keeps parts under prefix{manifest_id}/ out of the listing
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix, Delimiter='/'):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith(".json"):
+                    ids.append(obj['Key'][len(self.prefix):-len(".json")])
+        return ids
+
+    def save_part(self, manifest_id: str, name: str, data: Dict):
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{manifest_id}/{name}.json",
+            Body=json.dumps(data).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def load_part(self, manifest_id: str, name: str) -> Optional[Dict]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{manifest_id}/{name}.json")
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(response["Body"].read().decode("utf-8"))
+
+    def delete_part(self, manifest_id: str, name: str):
+        self.s3.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{manifest_id}/{name}.json")
+
+def create_manifest_store(s3_client, s3_prefix: str, local_dir: str):
+    """The store selected by ``Config.MANIFEST_STORE``: 'local' keeps manifests on disk, anything else in S3."""
+    if Config.MANIFEST_STORE == 'local':
+        return LocalManifestStore(local_dir)
+    return S3ManifestStore(s3_client, Config.BUCKET_NAME, s3_prefix)
@@ -2,7 +2,7 @@ from fastapi import HTTPException
 from opensearchpy import OpenSearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 from utils.config import Config
-import json
+from services.bulk_indexer import BulkIndexer
 
 class OpenSearchClient:
     def __init__(self):
@@ -26,6 +26,14 @@ class OpenSearchClient:
             connection_class=RequestsHttpConnection,
             timeout=300
         )
+        self.bulk_indexer = BulkIndexer(
+            self.client,
+            Config.COLLECTION_INDEX_NAME,
+            max_docs=Config.BULK_MAX_DOCS,
+            max_bytes=Config.BULK_MAX_BYTES,
+            max_workers=Config.BULK_WORKERS,
+            max_retries=Config.BULK_MAX_RETRIES
+        )
 
     def ensure_index_exists(self):
         index_name = Config.COLLECTION_INDEX_NAME
@@ -43,6 +51,11 @@ class OpenSearchClient:
                         "description": {"type": "text"},
                         "createtime": {"type": "text"},
                         "image_path":{"type": "text"},
+                        # S3 keys of the thumbnail/embedding/display renditions, not searchable
+                        "renditions": {"type": "object", "enabled": False},
+                        # SHA-256 of the original; S3 objects are keyed by it and shared between duplicates
+                        "content_hash": {"type": "keyword"},
+                        "quality_flags": {"type": "keyword"},
                         "embedding": {
                             "type": "knn_vector",
                             "dimension": Config.VECTOR_DIMENSION,
@@ -68,19 +81,45 @@ class OpenSearchClient:
             raise HTTPException(status_code=500, detail=f"Error indexing document: {str(e)}")
         
     def bulk_upload(self, documents):
+        """
+        Bulk index documents through ``BulkIndexer``; documents with an 'id'
+        use it as _id so delete/update by image_id work. Returns a bulk-style
+        response with one item per document, in order.
+        """
         try:
-            action = json.dumps({ 'index': { '_index': Config.COLLECTION_INDEX_NAME} })
-            body_ = ''
-            for document in documents:
-                body_ = body_ + action + "\n" + json.dumps(document) + "\n"
-            response = self.client.bulk(
-                index = Config.COLLECTION_INDEX_NAME,
-                body = body_
-            )
-            return response
+            return self.bulk_indexer.index(documents)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error indexing document: {str(e)}")
+
+    def bulk_load(self, force_merge=False):
+        """Context manager: refresh off and no replicas during a large load, then back to the configured settings."""
+        return self.bulk_indexer.bulk_load_settings(force_merge, {
+            'refresh_interval': Config.INDEX_REFRESH_INTERVAL,
+            'number_of_replicas': Config.INDEX_NUMBER_OF_REPLICAS
+        })
     
+    def get_document(self, image_id):
+        index_name = Config.COLLECTION_INDEX_NAME
+        try:
+            response = self.client.get(
+                index=index_name,
+                id=image_id
+            )
+            return response['_source']
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=f"Error getting document: {str(e)}")
+
+    def count_by_content_hash(self, content_hash):
+        index_name = Config.COLLECTION_INDEX_NAME
+        try:
+            response = self.client.count(
+                index=index_name,
+                body={"query": {"term": {"content_hash": content_hash}}}
+            )
+            return response['count']
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error counting documents: {str(e)}")
+
     def update_document(self, image_id, description, tags):
         index_name = Config.COLLECTION_INDEX_NAME
         try:
@@ -133,7 +172,8 @@ class OpenSearchClient:
                     'id': hit['_id'],
                     'score': hit['_score'],
                     'description': hit['_source']['description'],
-                    'image_path': hit['_source']['image_path']
+                    'image_path': hit['_source']['image_path'],
+                    'renditions': hit['_source'].get('renditions', {})
                 }
                 for hit in hits
             ]
@@ -0,0 +1,429 @@
+import time
+import uuid
+import random
+import logging
+import datetime
+import threading
+from typing import Dict, List, Optional
+from utils.config import Config
+from services.batch_pipeline import BatchPipeline
+from services.key_source import create_key_source
+from services.shard_planner import create_shard_planner
+from services.manifest_store import ManifestConflictError
+
+logger = logging.getLogger()
+
+class PipelineState:
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+
+class BatchStage:
+    PENDING = "PENDING"
+    DESCRIBING = "DESCRIBING"
+    EMBEDDING = "EMBEDDING"
+    INDEXED = "INDEXED"
+    SKIPPED = "SKIPPED"
+    FAILED = "FAILED"
+
+# Bedrock batch job statuses
+JOB_SUCCEEDED = {"Completed", "PartiallyCompleted"}
+JOB_FAILED = {"Failed", "Stopped", "Expired"}
+# Bedrock batch job statuses that hold one of the account's concurrent job slots
+JOB_ACTIVE = ["Submitted", "Validating", "Scheduled", "InProgress", "Stopping"]
+ACTIVE_STAGES = {BatchStage.DESCRIBING, BatchStage.EMBEDDING}
+TERMINAL_STAGES = {BatchStage.INDEXED, BatchStage.SKIPPED, BatchStage.FAILED}
+
+class PipelineOrchestrator:
+    """
+    Drives batches through describe -> embed -> index without a client in
+    the loop.
+
+    The input is listed a chunk at a time as the pipeline runs, not up
+    front: each step lists ``list_chunk_records`` more keys while fewer
+    than ``2 * max_concurrent_jobs`` batches are waiting, plans them with
+    ``ShardPlanner`` and writes every batch's keys to its own part of the
+    manifest; the manifest holds only references. Records a chunk could only
+    send online are carried into the next chunk instead.
+
+    Each batch advances on its own: as soon as its description job finishes
+    the embedding job is started, and as soon as that finishes the batch is
+    indexed, so the stages of different batches overlap. Pending batches are
+    submitted while fewer than ``max_concurrent_jobs`` Bedrock batch jobs
+    are active in the account (every pipeline and batch enrichment counts).
+    Every transition is written to the manifest store. A step first takes a
+    lease on the manifest with a conditional write and saves every change
+    conditionally on the version it wrote last, so instances that step the
+    same pipeline at once cannot overwrite each other's progress. Every save
+    renews the lease for ``lease_seconds``, which is kept shorter than the
+    scheduled tick so a step that stalls (a frozen Lambda) never blocks the
+    next one for long. Indexing a finished embedding job stops at the
+    deadline and records its position in the batch, so the next step
+    continues it instead of starting over.
+    """
+    def __init__(self, s3_client, bedrock_client, batch_pipeline: BatchPipeline, store,
+                 max_concurrent_jobs: int = 10, poll_min_seconds: float = 30, poll_max_seconds: float = 300,
+                 list_chunk_records: int = 100000, lease_seconds: float = 120):
+        self.s3 = s3_client
+        self.bedrock = bedrock_client
+        self.batch_pipeline = batch_pipeline
+        self.store = store
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.poll_min_seconds = poll_min_seconds
+        self.poll_max_seconds = poll_max_seconds
+        self.list_chunk_records = list_chunk_records
+        self.lease_seconds = lease_seconds
+        self._threads: Dict[str, threading.Thread] = {}
+
+    def create(self, options: Dict) -> Dict:
+        """Persist a new pipeline; its input is listed and planned by the steps that follow."""
+        now = datetime.datetime.now()
+        planner = create_shard_planner(options["batch_size"])
+        manifest = {
+            "pipeline_id": str(uuid.uuid4()),
+            "state": PipelineState.RUNNING,
+            "createtime": now.isoformat(),
+            "updatetime": now.isoformat(),
+            # list_model_invocation_jobs only needs to look at jobs submitted after this
+            "submit_time_after": now.astimezone(datetime.timezone.utc).isoformat(),
+            "options": options,
+            "lease_until": 0,
+            # Where listing resumes: the key source's cursor
+            "listing": {"cursor": None, "keys_consumed": 0, "carry": [], "done": False},
+            "plan": {
+                "total_records": 0, "estimated_bytes": 0, "batch_jobs": 0, "online_records": 0,
+                "limits": {"min_records": planner.min_records, "max_records": planner.max_records, "max_bytes": planner.max_bytes}
+            },
+            "batches": []
+        }
+        self.store.save(manifest["pipeline_id"], manifest)
+        logger.info(f"Created pipeline {manifest['pipeline_id']}")
+        return manifest
+
+    def get(self, pipeline_id: str) -> Optional[Dict]:
+        return self.store.load(pipeline_id)
+
+    def job_statuses(self, manifest: Dict, job_arns: List[str]) -> Dict[str, str]:
+        """
+        Look the statuses of ``job_arns`` up in bulk with
+        list_model_invocation_jobs; jobs the listing did not return are
+        fetched one by one.
+        """
+        wanted = set(job_arns)
+        statuses = {}
+        if not wanted:
+            return statuses
+        try:
+            kwargs = {"submitTimeAfter": datetime.datetime.fromisoformat(manifest["submit_time_after"]), "maxResults": 1000}
+            while True:
+                response = self.bedrock.list_model_invocation_jobs(**kwargs)
+                for summary in response.get("invocationJobSummaries", []):
+                    if summary["jobArn"] in wanted:
+                        statuses[summary["jobArn"]] = summary["status"]
+                if len(statuses) == len(wanted) or not response.get("nextToken"):
+                    break
+                kwargs["nextToken"] = response["nextToken"]
+        except Exception as e:
+            logger.error(f"Failed to list batch jobs, falling back to per-job lookups: {str(e)}")
+        for job_arn in wanted - set(statuses):
+            statuses[job_arn] = self.bedrock.get_model_invocation_job(jobIdentifier=job_arn)['status']
+        return statuses
+
+    def active_job_count(self) -> Optional[int]:
+        """Bedrock batch jobs holding a slot in the account, from every pipeline and enrichment; None if unknown."""
+        count = 0
+        try:
+            for status in JOB_ACTIVE:
+                kwargs = {"statusEquals": status, "maxResults": 1000}
+                while True:
+                    response = self.bedrock.list_model_invocation_jobs(**kwargs)
+                    count += len(response.get("invocationJobSummaries", []))
+                    if not response.get("nextToken"):
+                        break
+                    kwargs["nextToken"] = response["nextToken"]
+        except Exception as e:
+            logger.error(f"Failed to count active batch jobs: {str(e)}")
+            return None
+        return count
+
+    def _save(self, manifest: Dict, lease: Dict, release: bool = False):
+        """
+        Save conditionally on the version this step wrote last, renewing the
+        lease (or giving it up with ``release``); raises ManifestConflictError
+        if the lease was lost.
+        """
+        manifest["lease_until"] = 0 if release else time.time() + self.lease_seconds
+        manifest["updatetime"] = datetime.datetime.now().isoformat()
+        lease["version"] = self.store.save(manifest["pipeline_id"], manifest, lease["version"])
+
+    def _acquire(self, pipeline_id: str):
+        """The manifest and a lease on it, or the manifest and None if it is finished or another step holds it."""
+        manifest, version = self.store.load_versioned(pipeline_id)
+        if manifest is None or manifest["state"] == PipelineState.COMPLETED or manifest.get("lease_until", 0) > time.time():
+            return manifest, None
+        lease = {"version": version}
+        try:
+            self._save(manifest, lease)
+        except ManifestConflictError:
+            logger.info(f"Pipeline {pipeline_id} is being stepped elsewhere")
+            return self.store.load(pipeline_id), None
+        return manifest, lease
+
+    def _add_batch(self, manifest: Dict, keys: List[str], online: bool):
+        batch_num = len(manifest["batches"])
+        keys_part = f"batch-{batch_num:06d}"
+        self.store.save_part(manifest["pipeline_id"], keys_part, {"keys": keys})
+        manifest["batches"].append({"batch_num": batch_num, "stage": BatchStage.PENDING, "keys_part": keys_part,
+                                    "key_count": len(keys), "error": None, "online": online})
+
+    def _list_more(self, manifest: Dict, lease: Dict, deadline: Optional[float]) -> int:
+        """
+        List and plan chunks of the input until enough batches are waiting,
+        the input is exhausted or ``deadline`` passes; returns the number of
+        batches added.
+        """
+        listing = manifest["listing"]
+        options = manifest["options"]
+        planner = create_shard_planner(options["batch_size"])
+        chunk_records = max(self.list_chunk_records, planner.max_records)
+        key_source = None
+        added = 0
+        while not listing["done"]:
+            pending = sum(1 for batch in manifest["batches"] if batch["stage"] == BatchStage.PENDING)
+            if pending >= 2 * self.max_concurrent_jobs or (deadline is not None and time.time() > deadline):
+                break
+            if key_source is None:
+                key_source = create_key_source(self.s3, options["s3_folder_prefix"], options.get("inventory_manifest"))
+            listed, listing["cursor"] = key_source.list_chunk(listing["cursor"], chunk_records)
+            last = len(listed) < chunk_records
+            listing["keys_consumed"] += len(listed)
+            objects = [tuple(obj) for obj in listing["carry"]] + listed
+            plan = planner.plan(objects)
+            carry = []
+            index = 0
+            for shard in plan["shards"]:
+                shard_objects = objects[index:index + shard["records"]]
+                index += shard["records"]
+                if shard["online"] and not last:
+                    # Too few for a job on their own; planned again with the next chunk
+                    carry.extend(shard_objects)
+                    continue
+                self._add_batch(manifest, [key for key, _ in shard_objects], shard["online"])
+                manifest["plan"]["total_records"] += shard["records"]
+                manifest["plan"]["estimated_bytes"] += shard["estimated_bytes"]
+                if shard["online"]:
+                    manifest["plan"]["online_records"] += shard["records"]
+                else:
+                    manifest["plan"]["batch_jobs"] += 1
+                added += 1
+            listing["carry"] = carry
+            listing["done"] = last
+            self._save(manifest, lease)
+        if added:
+            logger.info(f"Pipeline {manifest['pipeline_id']}: listed {listing['keys_consumed']} keys, {len(manifest['batches'])} batches")
+        return added
+
+    def _advance(self, manifest: Dict, batch: Dict, status: str, lease: Dict, deadline: Optional[float]) -> bool:
+        if status in JOB_FAILED:
+            batch["stage"] = BatchStage.FAILED
+            batch["error"] = f"{batch['stage_job_arn']} ended with status {status}"
+            return True
+        if status not in JOB_SUCCEEDED:
+            return False
+        if batch["stage"] == BatchStage.DESCRIBING:
+            started = self.batch_pipeline.start_embedding_job(batch["descn_job_arn"], batch["descn_job"])
+            batch["embedding_job_arn"] = started["jobArn"]
+            batch["embedding_job"] = started["job"]
+            batch["stage_job_arn"] = started["jobArn"]
+            batch["stage"] = BatchStage.EMBEDDING
+        else:
+            def save_progress(progress: Dict):
+                batch["index_progress"] = dict(progress)
+                self._save(manifest, lease)
+
+            result = self.batch_pipeline.index_embedding_output(
+                batch["embedding_job_arn"], batch["embedding_job"], manifest["options"].get("generate_renditions", True),
+                progress=batch.get("index_progress"), deadline=deadline, on_chunk=save_progress
+            )
+            if not result["done"]:
+                # Out of time; the next step continues from the saved position
+                return True
+            batch.pop("index_progress", None)
+            batch["indexed"] = result["indexed"]
+            batch["error_images"] = result["error_list"]
+            batch["stage"] = BatchStage.INDEXED
+        return True
+
+    def _index_online(self, batch: Dict, s3_uris: List[str]):
+        result = self.batch_pipeline.index_online(s3_uris)
+        batch["indexed"] = result["indexed"]
+        batch["error_images"] = result["error_list"]
+        batch["stage"] = BatchStage.INDEXED
+
+    def _submit(self, manifest: Dict, batch: Dict):
+        options = manifest["options"]
+        keys = self.store.load_part(manifest["pipeline_id"], batch["keys_part"])["keys"]
+        if batch.get("online"):
+            batch["records"] = len(keys)
+            self._index_online(batch, [f"s3://{Config.BUCKET_NAME}/{key}" for key in keys])
+            return
+        started = self.batch_pipeline.start_description_job(
+            keys, batch["batch_num"], options.get("max_edge"), options.get("quality", Config.BATCH_IMAGE_QUALITY)
+        )
+        build_result = started["build_result"]
+        batch["skipped_images"] = build_result["skipped"]
+        batch["records"] = build_result["records"]
+        if started["jobArn"] is None:
+            if build_result["records"]:
+                # Too few images passed the quality gate for a batch job
+                self._index_online(batch, list(build_result["s3_uri_map"].values()))
+            else:
+                batch["stage"] = BatchStage.SKIPPED
+            return
+        batch["descn_job_arn"] = started["jobArn"]
+        batch["descn_job"] = started["job"]
+        batch["stage_job_arn"] = started["jobArn"]
+        batch["stage"] = BatchStage.DESCRIBING
+
+    def step(self, pipeline_id: str, deadline: Optional[float] = None) -> Optional[Dict]:
+        """
+        Poll the in-flight jobs once, advance every batch whose job finished,
+        list more of the input if few batches are waiting, and submit pending
+        batches into free job slots. Returns the manifest with
+        ``last_step_changes`` set to the number of batches that moved; a
+        pipeline leased by another step is returned unchanged.
+        """
+        manifest, lease = self._acquire(pipeline_id)
+        if lease is None:
+            return manifest
+        try:
+            changes = 0
+            active = [batch for batch in manifest["batches"] if batch["stage"] in ACTIVE_STAGES]
+            statuses = self.job_statuses(manifest, [batch["stage_job_arn"] for batch in active])
+            for batch in active:
+                if deadline is not None and time.time() > deadline:
+                    break
+                try:
+                    moved = self._advance(manifest, batch, statuses[batch["stage_job_arn"]], lease, deadline)
+                except Exception as e:
+                    logger.error(f"Pipeline {pipeline_id} batch {batch['batch_num']} failed: {str(e)}")
+                    batch["stage"] = BatchStage.FAILED
+                    batch["error"] = str(e)
+                    moved = True
+                if moved:
+                    changes += 1
+                    self._save(manifest, lease)
+
+            changes += self._list_more(manifest, lease, deadline)
+
+            # The limit is shared by every pipeline and enrichment in the account
+            in_flight = self.active_job_count()
+            if in_flight is None:
+                in_flight = sum(1 for batch in manifest["batches"] if batch["stage"] in ACTIVE_STAGES)
+            for batch in manifest["batches"]:
+                if in_flight >= self.max_concurrent_jobs or (deadline is not None and time.time() > deadline):
+                    break
+                if batch["stage"] != BatchStage.PENDING:
+                    continue
+                try:
+                    self._submit(manifest, batch)
+                except Exception as e:
+                    logger.error(f"Pipeline {pipeline_id} batch {batch['batch_num']} failed to submit: {str(e)}")
+                    batch["stage"] = BatchStage.FAILED
+                    batch["error"] = str(e)
+                if batch["stage"] in ACTIVE_STAGES:
+                    in_flight += 1
+                changes += 1
+                self._save(manifest, lease)
+                if batch["stage"] != BatchStage.FAILED:
+                    # The keys now live in the job input and the S3 URI map
+                    self.store.delete_part(pipeline_id, batch["keys_part"])
+
+            if manifest["listing"]["done"] and all(batch["stage"] in TERMINAL_STAGES for batch in manifest["batches"]):
+                manifest["state"] = PipelineState.COMPLETED
+                changes += 1
+            manifest["last_step_changes"] = changes
+            return manifest
+        finally:
+            try:
+                self._save(manifest, lease, release=True)
+            except ManifestConflictError:
+                logger.error(f"Pipeline {pipeline_id} lease was taken over before the step finished")
+
+    def run(self, pipeline_id: str, deadline: Optional[float] = None) -> Optional[Dict]:
+        """
+        Step until the pipeline completes or ``deadline`` (a ``time.time()``
+        value) passes. The poll interval doubles while nothing changes, up to
+        ``poll_max_seconds``, and drops back to ``poll_min_seconds`` on progress.
+        """
+        interval = self.poll_min_seconds
+        while True:
+            manifest = self.step(pipeline_id, deadline)
+            if manifest is None or manifest["state"] == PipelineState.COMPLETED:
+                return manifest
+            if manifest.get("last_step_changes"):
+                interval = self.poll_min_seconds
+            else:
+                interval = min(interval * 2, self.poll_max_seconds)
+            sleep_seconds = interval * random.uniform(0.8, 1.2)
+            if deadline is not None and time.time() + sleep_seconds > deadline:
+                return manifest
+            time.sleep(sleep_seconds)
+
+    def start(self, pipeline_id: str):
+        """
+        Run the pipeline on a background thread for as long as the process
+        lives. Only for local runs: a Lambda process is frozen between
+        invocations, so deployed pipelines are stepped by the scheduled tick
+        and /advance instead.
+        """
+        thread = self._threads.get(pipeline_id)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=self._run_logged, args=(pipeline_id,), name=f"pipeline-{pipeline_id}", daemon=True)
+        self._threads[pipeline_id] = thread
+        thread.start()
+
+    def _run_logged(self, pipeline_id: str):
+        try:
+            self.run(pipeline_id)
+        except Exception as e:
+            logger.error(f"Pipeline {pipeline_id} runner stopped: {str(e)}", exc_info=True)
+
+    def step_all(self, deadline: Optional[float] = None) -> Dict[str, str]:
+        """
+        Step every pipeline that has not completed, until ``deadline`` (a
+        ``time.time()`` value) passes; returns pipeline_id -> state for the
+        pipelines that were stepped.
+        """
+        states = {}
+        for pipeline_id in self.store.list_ids():
+            if deadline is not None and time.time() > deadline:
+                break
+            manifest = self.store.load(pipeline_id)
+            if manifest is None or manifest["state"] == PipelineState.COMPLETED:
+                continue
+            try:
+                states[pipeline_id] = self.step(pipeline_id, deadline)["state"]
+            except Exception as e:
+                logger.error(f"Failed to step pipeline {pipeline_id}: {str(e)}")
+                states[pipeline_id] = "ERROR"
+        return states
+
+    def resume_all(self) -> int:
+        """Restart runners for the pipelines that have not completed yet; local runs only, like ``start``."""
+        resumed = 0
+        for pipeline_id in self.store.list_ids():
+            manifest = self.store.load(pipeline_id)
+            if manifest is not None and manifest["state"] != PipelineState.COMPLETED:
+                self.start(pipeline_id)
+                resumed += 1
+        return resumed
+
+    @staticmethod
+    def summarize(manifest: Dict) -> Dict:
+        """The manifest with batch counts per stage, without the keys carried between listing chunks."""
+        stages = {}
+        for batch in manifest["batches"]:
+            stages[batch["stage"]] = stages.get(batch["stage"], 0) + 1
+        listing = {name: value for name, value in manifest["listing"].items() if name != "carry"}
+        return {**manifest, "listing": listing, "stages": stages}
@@ -0,0 +1,130 @@
+import json
+import zlib
+import struct
+import logging
+from typing import Dict, List, Optional
+from utils.config import Config
+
+logger = logging.getLogger()
+
+class RecordManifest:
+    """
+    recordId -> S3 URI map of a batch job, shared by every batch stage.
+
+    Record IDs written by ``BatchPayloadBuilder`` are dense zero-padded
+    integers, so the manifest stores only the object keys in recordId order
+    (the ``s3://bucket/`` prefix is dropped) in zlib-compressed blocks::
+
+        b"RIDM" | uint32 header length | header JSON | block 0 | block 1 | ...
+
+    The header holds the record count, block size and the byte offset of
+    every block. Inside a block every key is a uint32 byte length followed by
+    its UTF-8 bytes, since S3 keys may contain any character including
+    newlines (version 1 blocks, joined with newlines, are still readable).
+    ``load`` reads the manifest once for sequential consumers. Legacy
+    ``.json`` maps are still readable.
+    """
+    MAGIC = b"RIDM"
+    VERSION = 2
+    BLOCK_SIZE = 1024
+
+    def __init__(self, keys: List[str], base: str):
+        self.keys = keys
+        self.base = base
+
+    @staticmethod
+    def _index(record_id: str) -> Optional[int]:
+        try:
+            return int(record_id)
+        except (TypeError, ValueError):
+            return None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, record_id: str) -> bool:
+        index = self._index(record_id)
+        return index is not None and 0 <= index < len(self.keys)
+
+    def __getitem__(self, record_id: str) -> str:
+        if record_id not in self:
+            raise KeyError(record_id)
+        return self.base + self.keys[self._index(record_id)]
+
+    def values(self) -> List[str]:
+        return [self.base + key for key in self.keys]
+
+    @staticmethod
+    def _pack_keys(keys: List[str]) -> bytes:
+        packed = bytearray()
+        for key in keys:
+            encoded = key.encode('utf-8')
+            packed += struct.pack(">I", len(encoded)) + encoded
+        return bytes(packed)
+
+    @staticmethod
+    def _unpack_keys(data: bytes, version: int) -> List[str]:
+        if version == 1:
+            return data.decode('utf-8').split("\n")
+        keys = []
+        position = 0
+        while position < len(data):
+            length = struct.unpack_from(">I", data, position)[0]
+            position += 4
+            keys.append(data[position:position + length].decode('utf-8'))
+            position += length
+        return keys
+
+    @classmethod
+    def encode(cls, s3_uri_map: Dict[str, str]) -> bytes:
+        base = f"s3://{Config.BUCKET_NAME}/"
+        ordered = sorted(s3_uri_map.items(), key=lambda item: int(item[0]))
+        if any(int(record_id) != index for index, (record_id, _) in enumerate(ordered)):
+            raise ValueError("Record IDs must be the dense sequence 0..n-1")
+        keys = [uri[len(base):] if uri.startswith(base) else uri for _, uri in ordered]
+        blocks = [
+            zlib.compress(cls._pack_keys(keys[start:start + cls.BLOCK_SIZE]), 9)
+            for start in range(0, len(keys), cls.BLOCK_SIZE)
+        ]
+        offsets = []
+        position = 0
+        for block in blocks:
+            offsets.append(position)
+            position += len(block)
+        header = json.dumps({
+            "version": cls.VERSION, "base": base, "count": len(keys), "block_size": cls.BLOCK_SIZE,
+            "offsets": offsets, "end": position
+        }, separators=(",", ":")).encode('utf-8')
+        return cls.MAGIC + struct.pack(">I", len(header)) + header + b"".join(blocks)
+
+    @classmethod
+    def write(cls, s3_client, s3_key: str, s3_uri_map: Dict[str, str]):
+        body = cls.encode(s3_uri_map)
+        s3_client.put_object(Bucket=Config.BUCKET_NAME, Key=s3_key, Body=body, ContentType='application/octet-stream')
+        logger.info(f"Wrote record manifest {s3_key}: {len(s3_uri_map)} records, {len(body)} bytes")
+
+    @classmethod
+    def _parse_header(cls, data: bytes):
+        if data[:4] != cls.MAGIC:
+            raise ValueError("Not a record manifest")
+        header_length = struct.unpack(">I", data[4:8])[0]
+        return header_length, data[8:8 + header_length]
+
+    @classmethod
+    def decode(cls, data: bytes) -> "RecordManifest":
+        header_length, header_bytes = cls._parse_header(data)
+        header = json.loads(header_bytes)
+        blocks_start = 8 + header_length
+        bounds = header["offsets"] + [header["end"]]
+        keys = []
+        for start, end in zip(bounds, bounds[1:]):
+            keys.extend(cls._unpack_keys(zlib.decompress(data[blocks_start + start:blocks_start + end]), header["version"]))
+        return cls(keys[:header["count"]], header["base"])
+
+    @classmethod
+    def load(cls, s3_client, s3_key: str):
+        """The whole manifest; a legacy ``.json`` map is returned as a plain dict."""
+        data = s3_client.get_object(Bucket=Config.BUCKET_NAME, Key=s3_key)['Body'].read()
+        if s3_key.endswith(".json"):
+            return json.loads(data.decode('utf-8'))
+        return cls.decode(data)
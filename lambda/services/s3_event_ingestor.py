@@ -0,0 +1,123 @@
+import json
+import logging
+from urllib.parse import unquote_plus
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+from utils.config import Config
+from utils.exceptions import ImageQualityError
+from services.image_ingestor import ImageIngestor
+
+logger = logging.getLogger()
+
+class S3EventIngestor:
+    """
+    Ingests images that clients PUT straight into S3 with a presigned URL.
+
+    Accepts either raw S3 notification events or SQS events whose message
+    bodies are S3 notifications. All objects of one invocation are described
+    and embedded concurrently and indexed with bulk requests.
+    """
+    def __init__(self, s3_client, ingestor: ImageIngestor, opensearch_client, max_workers: int = 8,
+                 bulk_max_docs: int = 50):
+        self.s3 = s3_client
+        self.ingestor = ingestor
+        self.opensearch_client = opensearch_client
+        self.max_workers = max_workers
+        self.bulk_max_docs = bulk_max_docs
+
+    @staticmethod
+    def image_id_from_key(s3_key: str) -> str:
+        return s3_key.rsplit('/', 1)[-1]
+
+    def extract_records(self, event: Dict) -> List[Dict]:
+        """
+        Flatten the event into ``{"message_id", "bucket", "key"}`` records.
+        ``message_id`` is the SQS message id, or None for direct S3 events.
+        """
+        records = []
+        for record in event.get('Records', []):
+            if record.get('eventSource') == 'aws:sqs':
+                body = json.loads(record['body'])
+                # S3 sends an s3:TestEvent without Records when the notification is created
+                for s3_record in body.get('Records', []):
+                    records.append(self._to_record(s3_record, record['messageId']))
+            elif record.get('eventSource') == 'aws:s3':
+                records.append(self._to_record(record, None))
+        return [r for r in records if r is not None]
+
+    def _to_record(self, s3_record: Dict, message_id):
+        if not s3_record.get('eventName', '').startswith('ObjectCreated'):
+            return None
+        bucket = s3_record['s3']['bucket']['name']
+        key = unquote_plus(s3_record['s3']['object']['key'])
+        if not key.startswith(Config.DIRECT_UPLOAD_PREFIX):
+            logger.info(f"Skipping object outside {Config.DIRECT_UPLOAD_PREFIX}: {key}")
+            return None
+        return {"message_id": message_id, "bucket": bucket, "key": key}
+
+    def _prepare(self, record: Dict) -> Dict:
+        stored = None
+        try:
+            response = self.s3.get_object(Bucket=record['bucket'], Key=record['key'])
+            image_data = response['Body'].read()
+            quality_flags = self.ingestor.check_quality(image_data)
+            # Promote the upload to its content-addressed, cacheable key
+            stored = self.ingestor.store_image(image_data)
+            s3_key, content_hash, _ = stored
+            rendition_keys, embed_base64 = self.ingestor.store_renditions(content_hash, image_data)
+            image_id = self.image_id_from_key(record['key'])
+            document = self.ingestor.build_document(image_id, embed_base64, '', s3_key, rendition_keys, content_hash,
+                                                    quality_flags)
+            return {**record, "document": document, "stored": stored, "error": None}
+        except ImageQualityError as e:
+            # Not retryable: the same bytes would be rejected again
+            logger.info(f"Skipping s3://{record['bucket']}/{record['key']}: {e.detail['message']}")
+            return {**record, "document": None, "stored": None, "error": None, "skipped": e.detail['details']['issues']}
+        except Exception as e:
+            logger.error(f"Failed to process s3://{record['bucket']}/{record['key']}: {str(e)}")
+            return {**record, "document": None, "stored": stored, "error": str(getattr(e, "detail", e))}
+
+    def _index(self, results: List[Dict]):
+        ready = [r for r in results if r["document"] is not None]
+        for start in range(0, len(ready), self.bulk_max_docs):
+            chunk = ready[start:start + self.bulk_max_docs]
+            try:
+                response = self.opensearch_client.bulk_upload([r["document"] for r in chunk])
+            except Exception as e:
+                logger.error(f"Bulk indexing failed: {str(e)}")
+                for r in chunk:
+                    r["error"] = str(getattr(e, "detail", e))
+                continue
+            items = response.get("items", [])
+            for r, item in zip(chunk, items):
+                result = next(iter(item.values()))
+                if "error" in result:
+                    r["error"] = str(result["error"])
+
+    def handle(self, event: Dict) -> Dict:
+        records = self.extract_records(event)
+        logger.info(f"Ingesting {len(records)} uploaded objects")
+        if records:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(records))) as executor:
+                results = list(executor.map(self._prepare, records))
+        else:
+            results = []
+        self._index(results)
+        for r in results:
+            if r["error"] is None:
+                # The upload has been copied to images/ (or rejected), drop the staging object
+                self.s3.delete_object(Bucket=r['bucket'], Key=r['key'])
+            elif r["stored"]:
+                self.ingestor.discard_image(*r["stored"])
+
+        failed = [r for r in results if r["error"] is not None]
+        # Only SQS messages can be retried individually; direct S3 events are retried as a whole
+        failed_messages = sorted({r["message_id"] for r in failed if r["message_id"]})
+        skipped = [r for r in results if r.get("skipped")]
+        return {
+            "processed": len(results),
+            "indexed": len(results) - len(failed) - len(skipped),
+            "skipped": [{"key": r["key"], "issues": r["skipped"]} for r in skipped],
+            "failed": [{"key": r["key"], "error": r["error"]} for r in failed],
+            "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed_messages]
+        }
@@ -0,0 +1,123 @@
+import math
+import logging
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
+from utils.config import Config
+
+logger = logging.getLogger()
+
+class ShardPlanner:
+    """
+    Packs an ordered stream of ``(key, size)`` objects into Bedrock batch
+    jobs that respect the service limits.
+
+    Every job gets at least ``min_records`` and at most ``max_records``
+    records, and an estimated input file of at most ``max_bytes`` (image
+    bytes grow by 4/3 when base64-encoded, plus ``record_overhead`` for the
+    prompt and JSON framing). The number of jobs is the smallest that fits
+    the limits and records are spread evenly over them, so there is no small
+    trailing job. The job count is capped so that every job can still reach
+    ``min_records``: jobs are filled first and only the records they cannot
+    hold are left over. Shards below ``min_records`` (that leftover, a small
+    input, or a byte cut forced by very large images) are marked ``online``
+    and go through on-demand inference instead of being dropped.
+
+    Only one size per object is held while planning; the plan stores record
+    counts, so the keys are re-read from the same ordered source when the
+    jobs are built.
+    """
+    def __init__(self, min_records: int, max_records: int, max_bytes: int, record_overhead: int = 2048):
+        self.min_records = min_records
+        self.max_records = max(max_records, min_records)
+        self.max_bytes = max_bytes
+        self.record_overhead = record_overhead
+
+    def record_bytes(self, size: int) -> int:
+        return math.ceil(size * 4 / 3) + self.record_overhead
+
+    def measure(self, objects: Iterable[Tuple[str, int]]) -> array:
+        """Estimated batch input bytes of every object, in order."""
+        return array('q', (self.record_bytes(size) for _, size in objects))
+
+    def plan(self, objects: Iterable[Tuple[str, int]]) -> Dict:
+        return self.plan_sizes(self.measure(objects))
+
+    def plan_sizes(self, sizes: array, online_head: int = 0, online_shard_records: int = 100) -> Dict:
+        """
+        Plan from measured sizes. The first ``online_head`` records are put in
+        online shards of ``online_shard_records`` (small enough to checkpoint
+        between them); the rest are packed into batch jobs as usual.
+        """
+        total_records = len(sizes)
+        total_bytes = sum(sizes)
+        online_head = min(online_head, total_records)
+
+        shards = []
+        index = 0
+        while index < online_head:
+            records = min(online_shard_records, online_head - index)
+            shards.append({
+                "shard": len(shards),
+                "records": records,
+                "estimated_bytes": sum(sizes[index:index + records]),
+                "online": True
+            })
+            index += records
+
+        remaining_bytes = total_bytes - sum(sizes[:online_head])
+        while index < total_records:
+            remaining_records = total_records - index
+            # Fewest jobs that fit the limits, but never so many that a job falls
+            # below min_records; what those jobs cannot hold is left for online
+            remaining_jobs = max(math.ceil(remaining_records / self.max_records), math.ceil(remaining_bytes / self.max_bytes))
+            remaining_jobs = max(1, min(remaining_jobs, remaining_records // self.min_records))
+            target = min(self.max_records, math.ceil(remaining_records / remaining_jobs))
+            records = 0
+            shard_bytes = 0
+            while index < total_records and records < target:
+                if records and shard_bytes + sizes[index] > self.max_bytes:
+                    # Byte limit reached before the record target; the rest is re-spread
+                    break
+                shard_bytes += sizes[index]
+                records += 1
+                index += 1
+            remaining_bytes -= shard_bytes
+            shards.append({
+                "shard": len(shards),
+                "records": records,
+                "estimated_bytes": shard_bytes,
+                "online": records < self.min_records
+            })
+
+        online_records = sum(shard["records"] for shard in shards if shard["online"])
+        plan = {
+            "total_records": total_records,
+            "estimated_bytes": total_bytes,
+            "batch_jobs": sum(1 for shard in shards if not shard["online"]),
+            "online_records": online_records,
+            "limits": {"min_records": self.min_records, "max_records": self.max_records, "max_bytes": self.max_bytes},
+            "shards": shards
+        }
+        logger.info(f"Planned {plan['batch_jobs']} batch jobs for {total_records} records, {online_records} online")
+        return plan
+
+def create_shard_planner(batch_size: int) -> ShardPlanner:
+    """Planner for the configured Bedrock limits, with ``batch_size`` as the largest job."""
+    return ShardPlanner(Config.BATCH_MIN_RECORDS, min(batch_size, Config.BATCH_MAX_RECORDS), Config.BATCH_MAX_INPUT_BYTES)
+
+def split_by_plan(keys: Iterable[str], shards: List[Dict], max_records: int) -> Iterator[List[str]]:
+    """
+    Cut an ordered key stream into the planned shards. Keys that appeared
+    after planning are grouped into extra shards of at most ``max_records``.
+    """
+    keys = iter(keys)
+    for shard in shards:
+        batch = [key for _, key in zip(range(shard["records"]), keys)]
+        if not batch:
+            return
+        yield batch
+    while True:
+        batch = [key for _, key in zip(range(max_records), keys)]
+        if not batch:
+            return
+        yield batch
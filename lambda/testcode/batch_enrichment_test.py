@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import tempfile
+from pathlib import Path
+
+# Add lambda directory to Python path
+lambda_path = str(Path(__file__).parent.parent)
+if lambda_path not in sys.path:
+    sys.path.insert(0, lambda_path)
+
+# Config reads these at import time; nothing here talks to AWS
+os.environ.setdefault('BUCKET_NAME', 'local-test-bucket')
+os.environ.setdefault('DDSTRIBUTION_DOMAIN', 'https://cdn.example.com/')
+os.environ.setdefault('BEDROCK_ROLE_ARN', 'arn:aws:iam::000000000000:role/local')
+os.environ.setdefault('OPENSEARCH_ENDPOINT', 'https://localhost')
+
+from services.manifest_store import LocalManifestStore
+from services.batch_enrichment import CheckpointedEnrichment
+from services.img_descn_generator import description_job_name
+
+KEYS = [f"images/{i:04d}.jpg" for i in range(450)]
+
+class ListingS3:
+    """list_objects_v2 and its paginator over a sorted set of keys."""
+    def __init__(self, keys, page_size=40):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None):
+        return {"CommonPrefixes": [], "IsTruncated": False}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=None):
+        keys = [key for key in self.keys if key.startswith(Prefix) and (StartAfter is None or key > StartAfter)]
+        for start in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": key, "Size": 1000} for key in keys[start:start + self.page_size]]}
+
+class FakeBedrock:
+    """Description jobs by name, shared by every enrichment instance like the account's job list."""
+    def __init__(self):
+        self.jobs = []
+
+    def list_model_invocation_jobs(self, nameContains=None, **kwargs):
+        return {"invocationJobSummaries": [job for job in self.jobs if nameContains is None or nameContains in job["jobName"]]}
+
+class FakeBatchPipeline:
+    """Creates a job per call; ``die_after_create`` raises once the job of that batch exists, before the checkpoint is written."""
+    def __init__(self, bedrock, die_after_create=None):
+        self.bedrock = bedrock
+        self.die_after_create = die_after_create
+        self.online = []
+
+    def start_description_job(self, s3_keys, batch_num, max_edge=None, quality=85, job_id=None):
+        arn = f"arn:job/{len(self.bedrock.jobs)}"
+        self.bedrock.jobs.append({"jobName": description_job_name(job_id), "jobArn": arn})
+        if batch_num == self.die_after_create:
+            raise RuntimeError("Lambda timed out before the response was sent")
+        build_result = {"skipped": [], "records": len(s3_keys), "bytes": 0, "original_image_bytes": 0, "image_bytes": 0,
+                        "compression_ratio": 1.0, "s3_uri_map": {}}
+        return {"jobArn": arn, "job": {"output": f"out/{batch_num}"}, "build_result": build_result}
+
+    def index_online(self, s3_uris):
+        self.online.extend(s3_uris)
+        return {"indexed": len(s3_uris), "error_list": []}
+
+class StaleStore:
+    """Returns one earlier snapshot from load_versioned, as an instance that read the checkpoint before another run leased it."""
+    def __init__(self, store, snapshot):
+        self.store = store
+        self.snapshot = snapshot
+
+    def load_versioned(self, manifest_id):
+        if self.snapshot is not None:
+            snapshot, self.snapshot = self.snapshot, None
+            return snapshot
+        return self.store.load_versioned(manifest_id)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+def options():
+    return {"s3_folder_prefix": "images/", "batch_size": 100, "max_edge": None, "quality": 85,
+            "inventory_manifest": None, "mode": "batch", "deadline_minutes": None}
+
+def created_names(bedrock):
+    return [job["jobName"] for job in bedrock.jobs]
+
+class BatchEnrichmentTest:
+    def new_enrichment(self, bedrock, store, die_after_create=None, plan_chunk_records=100000):
+        return CheckpointedEnrichment(ListingS3(KEYS), bedrock, FakeBatchPipeline(bedrock, die_after_create), store,
+                                      plan_chunk_records=plan_chunk_records)
+
+    def new_store(self):
+        return LocalManifestStore(tempfile.mkdtemp(prefix="enrichment_test_"))
+
+    def test_resume_after_lost_response(self):
+        """The run dies after Bedrock accepted batch 1; the client resumes and every job exists exactly once"""
+        bedrock = FakeBedrock()
+        store = self.new_store()
+        first = self.new_enrichment(bedrock, store, die_after_create=1)
+        checkpoint_id = first.create(options())["checkpoint_id"]
+        try:
+            first.run(checkpoint_id, time.time() + 60)
+            return False
+        except RuntimeError:
+            pass
+        if store.load(checkpoint_id)["in_flight"]["batch_num"] != 1:
+            return False
+        resumed = self.new_enrichment(bedrock, store).run(checkpoint_id, time.time() + 60)
+        names = created_names(bedrock)
+        print(json.dumps({"jobs": len(names), "jobArn_list": resumed["jobArn_list"], "online": resumed["online"]["indexed"]}))
+        return (resumed["done"] and len(names) == len(set(names)) == 4
+                and resumed["jobArn_list"] == [job["jobArn"] for job in bedrock.jobs]
+                and resumed["online"]["indexed"] == 50)
+
+    def test_concurrent_runs_take_one_lease(self):
+        """Two instances read the checkpoint unleased; only the first conditional lease write wins"""
+        bedrock = FakeBedrock()
+        store = self.new_store()
+        tick = self.new_enrichment(bedrock, store)
+        checkpoint_id = tick.create(options())["checkpoint_id"]
+        snapshot = store.load_versioned(checkpoint_id)
+        finished = tick.run(checkpoint_id, time.time() + 60)
+        client = CheckpointedEnrichment(ListingS3(KEYS), bedrock, FakeBatchPipeline(bedrock), StaleStore(store, snapshot))
+        returned = client.run(checkpoint_id, time.time() + 60)
+        names = created_names(bedrock)
+        print(f"{len(names)} jobs created")
+        return finished["done"] and returned["done"] and len(names) == len(set(names)) == 4
+
+    def test_leased_checkpoint_is_left_alone(self):
+        bedrock = FakeBedrock()
+        store = self.new_store()
+        holder = self.new_enrichment(bedrock, store)
+        checkpoint_id = holder.create(options())["checkpoint_id"]
+        _, lease = holder._acquire(checkpoint_id)
+        returned = self.new_enrichment(bedrock, store).run(checkpoint_id, time.time() + 60)
+        return lease is not None and not returned["done"] and returned["plan"] is None and bedrock.jobs == []
+
+    def test_planning_in_chunks(self):
+        """With the deadline already past every run lists one chunk and saves its position; the plan matches a one-shot plan"""
+        bedrock = FakeBedrock()
+        store = self.new_store()
+        enrichment = self.new_enrichment(bedrock, store, plan_chunk_records=100)
+        checkpoint_id = enrichment.create(options())["checkpoint_id"]
+        progress = []
+        for _ in range(10):
+            checkpoint = enrichment.run(checkpoint_id, time.time() - 1)
+            progress.append(checkpoint["planning"]["records"])
+            if checkpoint["plan"] is not None:
+                break
+        print(f"listed after each run: {progress}")
+        if progress != [100, 200, 300, 400, 450] or bedrock.jobs or os.listdir(os.path.join(store.manifest_dir, checkpoint_id)):
+            return False
+        one_shot = self.new_enrichment(FakeBedrock(), self.new_store())
+        expected = one_shot.plan(one_shot.create(options())["checkpoint_id"])["plan"]
+        finished = enrichment.run(checkpoint_id, time.time() + 60)
+        return checkpoint["plan"] == expected and finished["done"] and len(bedrock.jobs) == 4
+
+def main():
+    test = BatchEnrichmentTest()
+    for name in ["test_resume_after_lost_response", "test_concurrent_runs_take_one_lease",
+                 "test_leased_checkpoint_is_left_alone", "test_planning_in_chunks"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
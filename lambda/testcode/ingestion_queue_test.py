@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import tempfile
+from io import BytesIO
+from types import SimpleNamespace
+from pathlib import Path
+
+# Add lambda directory to Python path
+lambda_path = str(Path(__file__).parent.parent)
+if lambda_path not in sys.path:
+    sys.path.insert(0, lambda_path)
+
+# Config reads these at import time; nothing here talks to AWS
+os.environ.setdefault('BUCKET_NAME', 'local-test-bucket')
+os.environ.setdefault('DDSTRIBUTION_DOMAIN', 'https://cdn.example.com/')
+os.environ.setdefault('BEDROCK_ROLE_ARN', 'arn:aws:iam::000000000000:role/local')
+os.environ.setdefault('OPENSEARCH_ENDPOINT', 'https://localhost')
+
+from services.ingestion_queue import FileIngestionQueue, SqsIngestionQueue, ItemState
+from services.ingestion_worker import IngestionWorker
+
+class NoSuchKey(Exception):
+    pass
+
+class ConditionalCheckFailedException(Exception):
+    def __init__(self, item=None):
+        super().__init__("The conditional request failed")
+        # The client returns ALL_OLD values in the low-level attribute format
+        self.response = {"Item": {name: {"S": str(value)} for name, value in (item or {}).items()}}
+
+class InMemoryS3:
+    """Stand-in for the boto3 S3 client methods used by the queue and ingestor."""
+    exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise NoSuchKey(Key)
+        return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+class InMemorySqs:
+    def __init__(self):
+        self.messages = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        for entry in Entries:
+            self.messages.append({"messageId": f"msg-{len(self.messages)}", "eventSource": "aws:sqs",
+                                  "body": entry["MessageBody"]})
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+class InMemoryTable:
+    """Stand-in for the DynamoDB Table calls SqsIngestionQueue makes (not a general expression evaluator)."""
+    meta = SimpleNamespace(client=SimpleNamespace(exceptions=SimpleNamespace(
+        ConditionalCheckFailedException=ConditionalCheckFailedException)))
+
+    def __init__(self):
+        self.rows = {}
+
+    def batch_writer(self):
+        table = self
+
+        class Writer:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def put_item(self, Item):
+                table.rows[(Item["job_id"], Item["item_id"])] = dict(Item)
+        return Writer()
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression=None,
+                    ReturnValues=None, **kwargs):
+        key = (Key["job_id"], Key["item_id"])
+        row = self.rows.get(key)
+        values = ExpressionAttributeValues
+        if ConditionExpression:
+            claimable = row is not None and (row["state"] == values[":pending"] or (
+                row["state"] == values[":processing"] and row.get("claimed_until", 0) < values[":now"]))
+            if not claimable:
+                raise ConditionalCheckFailedException(row)
+        if "ADD attempts" in UpdateExpression:
+            row.update(state=values[":processing"], updatetime=values[":updatetime"], attempts=row["attempts"] + 1,
+                       claimed_until=values[":claimed_until"])
+        else:
+            row.update(state=values[":state"], error=values[":error"], updatetime=values[":now"],
+                       expires_at=values[":expires"])
+            if ":image_id" in values:
+                row["image_id"] = values[":image_id"]
+        return {"Attributes": dict(row)}
+
+    def query(self, ExpressionAttributeValues, **kwargs):
+        job_id = ExpressionAttributeValues[":job_id"]
+        return {"Items": [dict(row) for (row_job, _), row in self.rows.items() if row_job == job_id]}
+
+class StubIngestor:
+    """Skips Bedrock: returns a fixed description and a zero embedding; b"bad" fails to decode."""
+    def __init__(self):
+        self.discarded = []
+
+    def decode_image(self, image):
+        data = base64.b64decode(image)
+        if data == b"bad":
+            raise ValueError("Invalid image data")
+        return data
+
+    def check_quality(self, image_data):
+        return []
+
+    def store_image(self, image_data):
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        return f"images/{content_hash}", content_hash, True
+
+    def store_renditions(self, content_hash, image_data):
+        return {}, base64.b64encode(image_data).decode('utf-8')
+
+    def discard_image(self, s3_key, content_hash, created):
+        self.discarded.append(s3_key)
+
+    def build_document(self, image_id, image_base64, description, s3_key, rendition_keys=None, content_hash=None,
+                       quality_flags=None):
+        return {'id': image_id, 'description': description or 'stub', 'embedding': [0.0] * 4, 'image_path': s3_key}
+
+class RecordingOpenSearch:
+    def __init__(self):
+        self.documents = {}
+
+    def bulk_upload(self, documents):
+        for document in documents:
+            self.documents[document['id']] = document
+        return {"errors": False, "items": [{"index": {"_id": d['id'], "status": 201}} for d in documents]}
+
+def payload(image_id, data=b"fake-image-bytes", tags=None):
+    return {"image_id": image_id, "image": base64.b64encode(data).decode('utf-8'), "description": "", "tags": tags or []}
+
+def wait_until_done(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.get_job_status(job_id)
+        if status["done"]:
+            return status
+        time.sleep(0.05)
+    return queue.get_job_status(job_id)
+
+class IngestionQueueTest:
+    def new_file_queue(self, retention_seconds=86400):
+        return FileIngestionQueue(tempfile.mkdtemp(prefix="ingest_queue_test_"), retention_seconds)
+
+    def test_claim_oldest_first_and_recover(self):
+        """claim only reads pending markers; items left PROCESSING come back after recover"""
+        queue = self.new_file_queue()
+        job = queue.enqueue([payload(f"image-{i}") for i in range(5)])
+        claimed = queue.claim(2)
+        if [item["item_id"] for item in claimed] != job["item_ids"][:2]:
+            return False
+        queue.mark(claimed[0], ItemState.INDEXED, result={"image_id": "image-0"})
+        # A fresh queue on the same directory, as after a restart
+        restarted = FileIngestionQueue(queue.queue_dir)
+        recovered = restarted.recover()
+        remaining = restarted.claim(10)
+        status = restarted.get_job_status(job["job_id"])
+        print(json.dumps(status["counts"]))
+        return (recovered == 1 and len(remaining) == 4 and not restarted.has_pending()
+                and status["counts"] == {"PENDING": 0, "PROCESSING": 4, "INDEXED": 1, "FAILED": 0}
+                and status["items"][0]["image_id"] == "image-0")
+
+    def test_expire_finished_jobs(self):
+        queue = self.new_file_queue(retention_seconds=0)
+        finished = queue.enqueue([payload("image-0")])
+        running = queue.enqueue([payload("image-1")])
+        for item in queue.claim(10):
+            if item["job_id"] == finished["job_id"]:
+                queue.mark(item, ItemState.FAILED, error="test")
+        time.sleep(0.01)
+        expired = queue.expire()
+        return (expired == 1 and queue.get_job_status(finished["job_id"]) is None
+                and queue.get_job_status(running["job_id"]) is not None)
+
+    def test_worker_indexes_with_tags(self):
+        """Background worker on the local queue: tags reach the document, an undecodable image fails alone"""
+        queue = self.new_file_queue()
+        opensearch = RecordingOpenSearch()
+        worker = IngestionWorker(queue, StubIngestor(), opensearch, max_workers=2, bulk_max_docs=2,
+                                 bulk_max_wait_seconds=0.1, poll_interval=0.05)
+        job = queue.enqueue([payload("image-0", tags=["red", "shoe"]), payload("image-1"),
+                             payload("image-2", data=b"bad")])
+        worker.start()
+        worker.notify()
+        status = wait_until_done(queue, job["job_id"])
+        print(json.dumps(status["counts"]))
+        return (status["counts"]["INDEXED"] == 2 and status["counts"]["FAILED"] == 1
+                and opensearch.documents["image-0"]["tags"] == ["red", "shoe"]
+                and "tags" not in opensearch.documents["image-1"])
+
+    def test_sqs_queue_and_handler(self):
+        """Enqueue through SQS/S3/DynamoDB stand-ins, then process the delivered event like the function would"""
+        s3 = InMemoryS3()
+        sqs = InMemorySqs()
+        table = InMemoryTable()
+        queue = SqsIngestionQueue(sqs, "https://sqs.local/ingest", s3, "local-test-bucket", "INGEST-PAYLOADS/", table)
+        opensearch = RecordingOpenSearch()
+        worker = IngestionWorker(queue, StubIngestor(), opensearch, max_workers=4, bulk_max_docs=10)
+        job = queue.enqueue([payload(f"image-{i}", tags=["t"]) for i in range(12)] + [payload("bad", data=b"bad")])
+        # Another instance answers status requests from the shared table
+        if queue.get_job_status(job["job_id"])["counts"]["PENDING"] != 13:
+            return False
+        event = {"Records": sqs.messages}
+        if not SqsIngestionQueue.is_ingest_event(event):
+            return False
+        result = worker.handle(event)
+        print(json.dumps(result))
+        # A redelivered message of a finished item is dropped
+        again = worker.handle({"Records": sqs.messages[:1]})
+        status = queue.get_job_status(job["job_id"])
+        return (result["indexed"] == 12 and result["failed"] == 1 and result["batchItemFailures"] == []
+                and again["processed"] == 0 and status["done"]
+                and [item["item_id"] for item in status["items"]] == job["item_ids"]
+                and all(document["tags"] == ["t"] for document in opensearch.documents.values())
+                and not any(key.startswith("INGEST-PAYLOADS/") for _, key in s3.objects))
+
+    def test_duplicate_delivery_is_not_claimed_twice(self):
+        """A second copy of a message is retried while the item is claimed, and claimed again once the claim runs out"""
+        s3 = InMemoryS3()
+        sqs = InMemorySqs()
+        table = InMemoryTable()
+        queue = SqsIngestionQueue(sqs, "https://sqs.local/ingest", s3, "local-test-bucket", "INGEST-PAYLOADS/", table,
+                                  claim_seconds=900)
+        job = queue.enqueue([payload("image-0")])
+        event = {"Records": sqs.messages}
+        claimed, failed = queue.claim_event(event)
+        duplicate, duplicate_failed = queue.claim_event(event)
+        if len(claimed) != 1 or failed or duplicate or duplicate_failed != [sqs.messages[0]["messageId"]]:
+            return False
+        # The invocation that claimed it died; after the claim runs out a redelivery takes the item over
+        table.rows[(job["job_id"], job["item_ids"][0])]["claimed_until"] = int(time.time()) - 1
+        reclaimed, _ = queue.claim_event(event)
+        print(json.dumps(queue.get_job_status(job["job_id"])["counts"]))
+        return len(reclaimed) == 1 and reclaimed[0]["attempts"] == 2
+
+    def test_s3_events_are_not_ingest_events(self):
+        event = {"Records": [{"eventSource": "aws:sqs", "messageId": "m", "body": json.dumps({"Records": []})}]}
+        return not SqsIngestionQueue.is_ingest_event(event) and not SqsIngestionQueue.is_ingest_event({"source": "aws.events"})
+
+def main():
+    test = IngestionQueueTest()
+    for name in ["test_claim_oldest_first_and_recover", "test_expire_finished_jobs", "test_worker_indexes_with_tags",
+                 "test_sqs_queue_and_handler", "test_duplicate_delivery_is_not_claimed_twice",
+                 "test_s3_events_are_not_ingest_events"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
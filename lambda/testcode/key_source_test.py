@@ -0,0 +1,134 @@
+import os
+import sys
+import csv
+import gzip
+import json
+from io import BytesIO, StringIO
+from pathlib import Path
+
+# Add lambda directory to Python path
+lambda_path = str(Path(__file__).parent.parent)
+if lambda_path not in sys.path:
+    sys.path.insert(0, lambda_path)
+
+# Config reads these at import time; nothing here talks to AWS
+os.environ.setdefault('BUCKET_NAME', 'local-test-bucket')
+os.environ.setdefault('DDSTRIBUTION_DOMAIN', 'https://cdn.example.com/')
+os.environ.setdefault('BEDROCK_ROLE_ARN', 'arn:aws:iam::000000000000:role/local')
+os.environ.setdefault('OPENSEARCH_ENDPOINT', 'https://localhost')
+
+from services.key_source import S3PrefixKeySource, S3InventoryKeySource
+
+BUCKET = 'local-test-bucket'
+
+class InventoryS3:
+    """Serves an inventory manifest and gzip CSV data files; counts the reads of each object."""
+    def __init__(self, files):
+        self.objects = {}
+        self.reads = {}
+        entries = []
+        for index, rows in enumerate(files):
+            text = StringIO()
+            csv.writer(text).writerows(rows)
+            key = f"inventory/data/{index}.csv.gz"
+            self.objects[key] = gzip.compress(text.getvalue().encode('utf-8'))
+            entries.append({"key": key})
+        self.objects["inventory/manifest.json"] = json.dumps({
+            "sourceBucket": BUCKET, "destinationBucket": "arn:aws:s3:::inventory-bucket", "fileFormat": "CSV",
+            "fileSchema": "Bucket, Key, Size, IsDeleteMarker", "files": entries
+        }).encode('utf-8')
+
+    def get_object(self, Bucket, Key):
+        self.reads[Key] = self.reads.get(Key, 0) + 1
+        return {"Body": BytesIO(self.objects[Key])}
+
+class ListingS3:
+    """list_objects_v2 and its paginator over a sorted set of keys."""
+    def __init__(self, keys, page_size=7):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter=None):
+        return {"CommonPrefixes": [], "IsTruncated": False}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=None):
+        keys = [key for key in self.keys if key.startswith(Prefix) and (StartAfter is None or key > StartAfter)]
+        for start in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": key, "Size": 10} for key in keys[start:start + self.page_size]]}
+
+def inventory_files():
+    """Three data files of 100 rows; some rows are other buckets, renditions, other prefixes or delete markers."""
+    files = []
+    for file_index in range(3):
+        rows = []
+        for row in range(100):
+            number = file_index * 100 + row
+            if number % 10 == 3:
+                rows.append(["other-bucket", f"images/{number:04d}.jpg", "10", "false"])
+            elif number % 10 == 5:
+                rows.append([BUCKET, f"renditions/{number:04d}/thumb.webp", "10", "false"])
+            elif number % 10 == 7:
+                rows.append([BUCKET, f"images/{number:04d}.jpg", "", "true"])
+            else:
+                rows.append([BUCKET, f"images/{number:04d}.jpg", "10", "false"])
+        files.append(rows)
+    return files
+
+def drain(source, chunk_size, cursor=None):
+    keys = []
+    while True:
+        objects, cursor = source.list_chunk(cursor, chunk_size)
+        keys.extend(key for key, _ in objects)
+        if len(objects) < chunk_size:
+            return keys
+
+class KeySourceTest:
+    def test_inventory_chunks_read_each_file_once(self):
+        """Listing the report in small chunks reads every data file once instead of restarting at the first"""
+        s3 = InventoryS3(inventory_files())
+        source = S3InventoryKeySource(s3, "s3://inventory-bucket/inventory/manifest.json", "images/", max_workers=2)
+        keys = drain(source, 30)
+        expected = [key for key, _ in S3InventoryKeySource(InventoryS3(inventory_files()),
+                                                           "s3://inventory-bucket/inventory/manifest.json",
+                                                           "images/").iter_objects()]
+        print(f"{len(keys)} keys, reads {json.dumps(s3.reads)}")
+        return keys == expected and len(keys) == 210 and all(count == 1 for count in s3.reads.values())
+
+    def test_inventory_resumes_from_cursor(self):
+        """A new source given a saved cursor continues in the middle of a file and never opens the files before it"""
+        files = inventory_files()
+        first = S3InventoryKeySource(InventoryS3(files), "s3://inventory-bucket/inventory/manifest.json", "images/")
+        head, cursor = first.list_chunk(None, 100)
+        s3 = InventoryS3(files)
+        resumed = S3InventoryKeySource(s3, "s3://inventory-bucket/inventory/manifest.json", "images/")
+        rest = drain(resumed, 50, cursor)
+        positioned = [(key, position) for key, _, position in resumed.iter_positioned(cursor)]
+        print(f"cursor {json.dumps(cursor)}, {len(head)} + {len(rest)} keys")
+        return (cursor == {"file": 1, "row": 38} and "inventory/data/0.csv.gz" not in s3.reads
+                and [key for key, _ in head] + rest == drain(first, 1000)
+                and [key for key, _ in positioned] == rest and positioned[-1][1] == {"file": 3, "row": 0})
+
+    def test_prefix_cursor(self):
+        """Prefix listings resume after the key in the cursor, chunked or parallel"""
+        keys = [f"images/{i:03d}.jpg" for i in range(60)] + ["images/sub/", "renditions/000/thumb.webp"]
+        source = S3PrefixKeySource(ListingS3(keys), "images/", max_workers=4)
+        head, cursor = source.list_chunk(None, 25)
+        rest = [key for key, _ in source.iter_objects(cursor)]
+        positioned = list(source.iter_positioned())
+        print(f"cursor {json.dumps(cursor)}")
+        return (cursor == {"start_after": "images/024.jpg"}
+                and [key for key, _ in head] + rest == [f"images/{i:03d}.jpg" for i in range(60)]
+                and positioned[10][2] == {"start_after": positioned[10][0]}
+                and drain(source, 25, cursor) == rest)
+
+def main():
+    test = KeySourceTest()
+    for name in ["test_inventory_chunks_read_each_file_once", "test_inventory_resumes_from_cursor", "test_prefix_cursor"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
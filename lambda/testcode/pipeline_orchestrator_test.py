@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import tempfile
+from pathlib import Path
+
+# Add lambda directory to Python path
+lambda_path = str(Path(__file__).parent.parent)
+if lambda_path not in sys.path:
+    sys.path.insert(0, lambda_path)
+
+# Config reads these at import time; nothing here talks to AWS
+os.environ.setdefault('BUCKET_NAME', 'local-test-bucket')
+os.environ.setdefault('DDSTRIBUTION_DOMAIN', 'https://cdn.example.com/')
+os.environ.setdefault('BEDROCK_ROLE_ARN', 'arn:aws:iam::000000000000:role/local')
+os.environ.setdefault('OPENSEARCH_ENDPOINT', 'https://localhost')
+
+from services.manifest_store import LocalManifestStore, ManifestConflictError
+from services.pipeline_orchestrator import PipelineOrchestrator, PipelineState, BatchStage
+
+class ListingS3:
+    """Stand-in for the list_objects_v2 paginator over a sorted set of keys; ``page_delay`` slows each page down."""
+    def __init__(self, keys, page_size=50, page_delay=0):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.listed = 0
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=None):
+        keys = [key for key in self.keys if key.startswith(Prefix) and (StartAfter is None or key > StartAfter)]
+        for start in range(0, len(keys), self.page_size):
+            time.sleep(self.page_delay)
+            self.listed += len(keys[start:start + self.page_size])
+            yield {"Contents": [{"Key": key, "Size": 1000} for key in keys[start:start + self.page_size]]}
+
+class FakeBedrock:
+    """Batch jobs by ARN; ``other_jobs`` hold slots for jobs this orchestrator did not submit."""
+    def __init__(self, other_jobs=0):
+        self.jobs = {f"other-{i}": "InProgress" for i in range(other_jobs)}
+
+    def list_model_invocation_jobs(self, statusEquals=None, **kwargs):
+        return {"invocationJobSummaries": [{"jobArn": arn, "status": status} for arn, status in self.jobs.items()
+                                           if statusEquals is None or status == statusEquals]}
+
+    def get_model_invocation_job(self, jobIdentifier):
+        return {"status": self.jobs[jobIdentifier]}
+
+    def finish_all(self):
+        for arn in self.jobs:
+            if not arn.startswith("other-"):
+                self.jobs[arn] = "Completed"
+
+class FakeBatchPipeline:
+    """Indexes embedding output ``chunk_docs`` records at a time, taking ``chunk_delay`` seconds per chunk."""
+    def __init__(self, bedrock, chunk_docs=40, chunk_delay=0):
+        self.bedrock = bedrock
+        self.chunk_docs = chunk_docs
+        self.chunk_delay = chunk_delay
+        self.described = []
+        self.online = []
+        self.indexed_chunks = []
+
+    def start_description_job(self, s3_keys, batch_num, max_edge=None, quality=85):
+        self.described.extend(s3_keys)
+        arn = f"descn-{batch_num}"
+        self.bedrock.jobs[arn] = "InProgress"
+        return {"jobArn": arn, "job": {"records": len(s3_keys)},
+                "build_result": {"skipped": [], "records": len(s3_keys), "s3_uri_map": {}}}
+
+    def start_embedding_job(self, descn_jobArn, descn_job):
+        arn = descn_jobArn.replace("descn", "embed")
+        self.bedrock.jobs[arn] = "InProgress"
+        return {"jobArn": arn, "job": descn_job}
+
+    def index_embedding_output(self, jobArn, job, generate_renditions=True, progress=None, deadline=None, on_chunk=None):
+        progress = dict(progress or {"indexed": 0, "error_list": [], "position": None})
+        position = progress["position"] or 0
+        while position < job["records"]:
+            time.sleep(self.chunk_delay)
+            end = min(position + self.chunk_docs, job["records"])
+            self.indexed_chunks.append((jobArn, position, end))
+            progress["indexed"] += end - position
+            progress["position"] = position = end
+            if on_chunk is not None:
+                on_chunk(progress)
+            if position < job["records"] and deadline is not None and time.time() > deadline:
+                return {**progress, "done": False}
+        return {**progress, "done": True}
+
+    def index_online(self, s3_uris):
+        self.online.extend(s3_uris)
+        return {"indexed": len(s3_uris), "error_list": []}
+
+def options(prefix="images/"):
+    return {"s3_folder_prefix": prefix, "inventory_manifest": None, "batch_size": 100, "max_edge": None,
+            "quality": 85, "generate_renditions": False}
+
+class PipelineOrchestratorTest:
+    def new_orchestrator(self, s3, bedrock, store=None, max_concurrent_jobs=2, lease_seconds=900):
+        store = store or LocalManifestStore(tempfile.mkdtemp(prefix="pipeline_test_"))
+        return PipelineOrchestrator(s3, bedrock, FakeBatchPipeline(bedrock), store, max_concurrent_jobs=max_concurrent_jobs,
+                                    list_chunk_records=250, lease_seconds=lease_seconds)
+
+    def test_lists_incrementally_with_carry(self):
+        """
+        620 keys in chunks of 250: the 50 keys left over by the first chunk are
+        planned with the second, only the last chunk goes online, and listing
+        pauses while enough batches are waiting
+        """
+        keys = [f"images/{i:05d}.jpg" for i in range(620)]
+        s3 = ListingS3(keys)
+        bedrock = FakeBedrock()
+        orchestrator = self.new_orchestrator(s3, bedrock)
+        pipeline_id = orchestrator.create(options())["pipeline_id"]
+        manifest = orchestrator.step(pipeline_id)
+        if manifest["listing"]["keys_consumed"] != 500 or manifest["listing"]["done"] or s3.listed != 500:
+            return False
+        for _ in range(20):
+            bedrock.finish_all()
+            manifest = orchestrator.step(pipeline_id)
+            if manifest["state"] == PipelineState.COMPLETED:
+                break
+        counts = [(batch["key_count"], batch["online"]) for batch in manifest["batches"]]
+        print(counts)
+        parts = os.listdir(os.path.join(orchestrator.store.manifest_dir, pipeline_id))
+        online = [uri.split("/", 3)[3] for uri in orchestrator.batch_pipeline.online]
+        return (manifest["state"] == PipelineState.COMPLETED
+                and counts == [(100, False)] * 6 + [(20, True)]
+                and orchestrator.batch_pipeline.described + online == keys
+                and manifest["plan"]["batch_jobs"] == 6 and manifest["plan"]["online_records"] == 20
+                and parts == [] and not any("keys" in batch for batch in manifest["batches"]))
+
+    def test_global_cap(self):
+        """A job submitted outside this pipeline holds one of the two slots"""
+        bedrock = FakeBedrock(other_jobs=1)
+        orchestrator = self.new_orchestrator(ListingS3([f"images/{i:05d}.jpg" for i in range(1000)]), bedrock)
+        pipeline_id = orchestrator.create(options())["pipeline_id"]
+        manifest = orchestrator.step(pipeline_id)
+        stages = PipelineOrchestrator.summarize(manifest)["stages"]
+        print(json.dumps(stages))
+        if stages != {BatchStage.DESCRIBING: 1, BatchStage.PENDING: 4}:
+            return False
+        del bedrock.jobs["other-0"]
+        manifest = orchestrator.step(pipeline_id)
+        return PipelineOrchestrator.summarize(manifest)["stages"][BatchStage.DESCRIBING] == 2
+
+    def test_leased_pipeline_is_not_stepped(self):
+        """A second instance leaves a leased pipeline alone; a step whose lease expired and was taken cannot save"""
+        keys = [f"images/{i:05d}.jpg" for i in range(300)]
+        store = LocalManifestStore(tempfile.mkdtemp(prefix="pipeline_test_"))
+        first = self.new_orchestrator(ListingS3(keys), FakeBedrock(), store, lease_seconds=900)
+        second = self.new_orchestrator(ListingS3(keys), FakeBedrock(), store)
+        pipeline_id = first.create(options())["pipeline_id"]
+        manifest, lease = first._acquire(pipeline_id)
+        if lease is None or second.step(pipeline_id)["batches"] or second.batch_pipeline.described:
+            return False
+        # The lease runs out while the first step is still working, and the second instance takes over
+        first._save(manifest, lease, release=True)
+        stepped = second.step(pipeline_id)
+        try:
+            first._save(manifest, lease)
+            return False
+        except ManifestConflictError:
+            pass
+        saved = store.load(pipeline_id)
+        print(json.dumps(PipelineOrchestrator.summarize(saved)["stages"]))
+        return len(stepped["batches"]) == len(saved["batches"]) == 3 and saved["lease_until"] == 0
+
+    def test_step_all_deadline(self):
+        """step_all stops taking pipelines once the deadline passes"""
+        keys = [f"images/{i:05d}.jpg" for i in range(300)]
+        store = LocalManifestStore(tempfile.mkdtemp(prefix="pipeline_test_"))
+        orchestrator = self.new_orchestrator(ListingS3(keys, page_delay=0.1), FakeBedrock(), store)
+        for _ in range(3):
+            orchestrator.create(options())
+        if orchestrator.step_all(time.time() - 1) != {}:
+            return False
+        started = time.time()
+        states = orchestrator.step_all(time.time() + 0.05)
+        print(f"stepped {len(states)} pipelines in {time.time() - started:.2f}s")
+        return len(states) == 1 and len(orchestrator.step_all()) == 3
+
+    def test_indexing_resumes_after_deadline(self):
+        """
+        The deadline passes while the first finished batch is indexed: its
+        position is saved, the second batch is left for later, and the next
+        step indexes every record exactly once
+        """
+        keys = [f"images/{i:05d}.jpg" for i in range(300)]
+        bedrock = FakeBedrock()
+        orchestrator = self.new_orchestrator(ListingS3(keys), bedrock)
+        pipeline = orchestrator.batch_pipeline
+        pipeline_id = orchestrator.create(options())["pipeline_id"]
+        orchestrator.step(pipeline_id)
+        bedrock.finish_all()
+        orchestrator.step(pipeline_id)
+        bedrock.finish_all()
+        pipeline.chunk_delay = 0.1
+        stepped = orchestrator.step(pipeline_id, time.time() + 0.05)
+        saved = orchestrator.store.load(pipeline_id)
+        first, second = saved["batches"][:2]
+        if (stepped["last_step_changes"] != 1 or first["stage"] != BatchStage.EMBEDDING
+                or first["index_progress"]["position"] != 40 or "index_progress" in second or saved["lease_until"] != 0):
+            return False
+        pipeline.chunk_delay = 0
+        manifest = orchestrator.step(pipeline_id)
+        print(json.dumps(pipeline.indexed_chunks))
+        ranges = {}
+        for arn, start, end in pipeline.indexed_chunks:
+            ranges.setdefault(arn, []).append((start, end))
+        return (all(batch["stage"] == BatchStage.INDEXED and batch["indexed"] == 100 for batch in manifest["batches"][:2])
+                and ranges == {"embed-0": [(0, 40), (40, 80), (80, 100)], "embed-1": [(0, 40), (40, 80), (80, 100)]})
+
+def main():
+    test = PipelineOrchestratorTest()
+    for name in ["test_lists_incrementally_with_carry", "test_global_cap", "test_leased_pipeline_is_not_stepped",
+                 "test_step_all_deadline", "test_indexing_resumes_after_deadline"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import base64
+import hashlib
+from io import BytesIO
+from pathlib import Path
+
+# Add lambda directory to Python path
+lambda_path = str(Path(__file__).parent.parent)
+if lambda_path not in sys.path:
+    sys.path.insert(0, lambda_path)
+
+# Config reads these at import time; nothing here talks to AWS
+os.environ.setdefault('BUCKET_NAME', 'local-test-bucket')
+os.environ.setdefault('DDSTRIBUTION_DOMAIN', 'https://cdn.example.com/')
+os.environ.setdefault('BEDROCK_ROLE_ARN', 'arn:aws:iam::000000000000:role/local')
+os.environ.setdefault('OPENSEARCH_ENDPOINT', 'https://localhost')
+
+from services.s3_event_ingestor import S3EventIngestor
+
+class InMemoryS3:
+    """Stand-in for the boto3 S3 client methods used by the ingestor."""
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+class StubIngestor:
+    """Skips Bedrock: returns a fixed description and a zero embedding."""
+    def __init__(self, s3):
+        self.s3 = s3
+        self.discarded = []
+
+    def check_quality(self, image_data):
+        return []
+
+    def store_image(self, image_data):
+        content_hash = hashlib.sha256(image_data).hexdigest()
+        s3_key = f"images/{content_hash}"
+        self.s3.put_object(Bucket=os.environ['BUCKET_NAME'], Key=s3_key, Body=image_data)
+        return s3_key, content_hash, True
+
+    def store_renditions(self, content_hash, image_data):
+        return {}, base64.b64encode(image_data).decode('utf-8')
+
+    def discard_image(self, s3_key, content_hash, created):
+        self.discarded.append(s3_key)
+
+    def build_document(self, image_id, image_base64, description, s3_key, rendition_keys=None, content_hash=None,
+                       quality_flags=None):
+        if not image_base64:
+            raise Exception("empty image")
+        return {'id': image_id, 'description': description or 'stub', 'embedding': [0.0] * 4, 'image_path': s3_key}
+
+class RecordingOpenSearch:
+    def __init__(self):
+        self.bulk_calls = []
+
+    def bulk_upload(self, documents):
+        self.bulk_calls.append(documents)
+        return {"errors": False, "items": [{"index": {"_id": d['id'], "status": 201}} for d in documents]}
+
+def s3_record(bucket, key):
+    return {
+        "eventSource": "aws:s3",
+        "eventName": "ObjectCreated:Put",
+        "s3": {"bucket": {"name": bucket}, "object": {"key": key}}
+    }
+
+class S3EventHandlerTest:
+    def __init__(self):
+        self.bucket = os.environ['BUCKET_NAME']
+        self.s3 = InMemoryS3()
+        self.opensearch = RecordingOpenSearch()
+        self.ingestor = S3EventIngestor(self.s3, StubIngestor(self.s3), self.opensearch, max_workers=4, bulk_max_docs=2)
+
+    def test_direct_s3_event(self):
+        """Three uploads in one S3 event end up in two bulk requests"""
+        keys = [f"uploads/image-{i}" for i in range(3)]
+        for key in keys:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=b"fake-image-bytes")
+        event = {"Records": [s3_record(self.bucket, key) for key in keys]}
+        result = self.ingestor.handle(event)
+        print(json.dumps(result, indent=2))
+        staged = [key for key in keys if (self.bucket, key) in self.s3.objects]
+        return result["indexed"] == 3 and len(self.opensearch.bulk_calls) == 2 and not staged
+
+    def test_sqs_wrapped_event_reports_failures(self):
+        """An empty object fails only its own SQS message"""
+        self.s3.put_object(Bucket=self.bucket, Key="uploads/good", Body=b"fake-image-bytes")
+        self.s3.put_object(Bucket=self.bucket, Key="uploads/empty", Body=b"")
+        event = {"Records": [
+            {"eventSource": "aws:sqs", "messageId": "msg-good",
+             "body": json.dumps({"Records": [s3_record(self.bucket, "uploads/good")]})},
+            {"eventSource": "aws:sqs", "messageId": "msg-empty",
+             "body": json.dumps({"Records": [s3_record(self.bucket, "uploads/empty")]})},
+            {"eventSource": "aws:sqs", "messageId": "msg-test-event",
+             "body": json.dumps({"Event": "s3:TestEvent"})}
+        ]}
+        result = self.ingestor.handle(event)
+        print(json.dumps(result, indent=2))
+        return result["batchItemFailures"] == [{"itemIdentifier": "msg-empty"}] and result["indexed"] == 1
+
+    def test_ignores_other_prefixes(self):
+        result = self.ingestor.handle({"Records": [s3_record(self.bucket, "images/not-a-direct-upload")]})
+        return result["processed"] == 0
+
+def main():
+    test = S3EventHandlerTest()
+    for name in ["test_direct_s3_event", "test_sqs_wrapped_event_reports_failures", "test_ignores_other_prefixes"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
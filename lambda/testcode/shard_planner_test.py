@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+from array import array
+from pathlib import Path
+
+# Add lambda directory to Python path
+lambda_path = str(Path(__file__).parent.parent)
+if lambda_path not in sys.path:
+    sys.path.insert(0, lambda_path)
+
+# Config reads these at import time; nothing here talks to AWS
+os.environ.setdefault('BUCKET_NAME', 'local-test-bucket')
+os.environ.setdefault('DDSTRIBUTION_DOMAIN', 'https://cdn.example.com/')
+os.environ.setdefault('BEDROCK_ROLE_ARN', 'arn:aws:iam::000000000000:role/local')
+os.environ.setdefault('OPENSEARCH_ENDPOINT', 'https://localhost')
+
+from services.shard_planner import ShardPlanner, split_by_plan
+
+def layout(plan):
+    return [(shard["records"], shard["online"]) for shard in plan["shards"]]
+
+class ShardPlannerTest:
+    def test_fills_jobs_before_going_online(self):
+        """250 records with a 100-record minimum make two batch jobs and 50 online records"""
+        plan = ShardPlanner(100, 100, 10**12).plan_sizes(array('q', [1000] * 250))
+        print(layout(plan))
+        return layout(plan) == [(100, False), (100, False), (50, True)] and plan["online_records"] == 50
+
+    def test_fills_jobs_with_larger_max(self):
+        plan = ShardPlanner(100, 120, 10**12).plan_sizes(array('q', [1000] * 250))
+        print(layout(plan))
+        return layout(plan) == [(120, False), (120, False), (10, True)] and plan["batch_jobs"] == 2
+
+    def test_spreads_evenly_above_minimum(self):
+        """No small trailing job when every job can reach the minimum"""
+        plan = ShardPlanner(10, 100, 10**12).plan_sizes(array('q', [1000] * 250))
+        print(layout(plan))
+        return layout(plan) == [(84, False), (83, False), (83, False)]
+
+    def test_small_input_goes_online(self):
+        plan = ShardPlanner(100, 1000, 10**12).plan_sizes(array('q', [1000] * 40))
+        print(layout(plan))
+        return layout(plan) == [(40, True)] and plan["batch_jobs"] == 0
+
+    def test_byte_limit(self):
+        """Every job stays under max_bytes"""
+        plan = ShardPlanner(2, 100, 10000).plan_sizes(array('q', [3000] * 10))
+        print(json.dumps(plan["shards"]))
+        return (all(shard["estimated_bytes"] <= 10000 for shard in plan["shards"])
+                and sum(shard["records"] for shard in plan["shards"]) == 10)
+
+    def test_online_head(self):
+        plan = ShardPlanner(100, 100, 10**12).plan_sizes(array('q', [1000] * 450), online_head=150)
+        print(layout(plan))
+        return layout(plan) == [(100, True), (50, True), (100, False), (100, False), (100, False)]
+
+    def test_split_by_plan(self):
+        plan = ShardPlanner(100, 100, 10**12).plan_sizes(array('q', [1000] * 250))
+        keys = [f"images/{i}" for i in range(260)]
+        batches = list(split_by_plan(keys, plan["shards"], plan["limits"]["max_records"]))
+        return [len(batch) for batch in batches] == [100, 100, 50, 10] and sum(batches, []) == keys
+
+def main():
+    test = ShardPlannerTest()
+    for name in ["test_fills_jobs_before_going_online", "test_fills_jobs_with_larger_max",
+                 "test_spreads_evenly_above_minimum", "test_small_input_goes_online", "test_byte_limit",
+                 "test_online_head", "test_split_by_plan"]:
+        result = getattr(test, name)()
+        print(f"{name} {'succeeded' if result else 'failed'}\n")
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,14 @@ class AWSClientFactory:
     def create_bedrock_runtime_client():
         return boto3.client('bedrock-runtime')
 
+    @staticmethod
+    def create_sqs_client():
+        return boto3.client('sqs')
+
+    @staticmethod
+    def create_dynamodb_table(table_name):
+        return boto3.resource('dynamodb').Table(table_name)
+
     @staticmethod
     def create_opensearch_client():
         return boto3.client('opensearch')
@@ -12,6 +12,86 @@ class Config:
     MULTIMODEL_LLM_ID = 'amazon.nova-pro-v1:0' # 'anthropic.claude-3-haiku-20240307-v1:0'
     RERANK_LLM_ID = 'amazon.nova-pro-v1:0'
     EMVEDDINGMODEL_ID = 'amazon.titan-embed-image-v1'
+    # Async ingestion (/images/async): 'sqs' (deployed) keeps payloads in S3, item state in DynamoDB and work in SQS;
+    # 'local' keeps everything under INGEST_QUEUE_DIR and processes it in a background thread (local runs and tests)
+    INGEST_QUEUE = os.environ.get('INGEST_QUEUE', 'sqs')
+    INGEST_QUEUE_URL = os.environ.get('INGEST_QUEUE_URL', '')
+    INGEST_JOB_TABLE = os.environ.get('INGEST_JOB_TABLE', '')
+    INGEST_PAYLOAD_PREFIX = 'INGEST-PAYLOADS/'
+    INGEST_QUEUE_DIR = os.environ.get('INGEST_QUEUE_DIR', '/tmp/ingest-queue')
+    # Finished jobs are kept this long for GET /images/jobs/{job_id}
+    INGEST_RETENTION_SECONDS = int(os.environ.get('INGEST_RETENTION_SECONDS', str(7 * 24 * 3600)))
+    # How long a claimed item stays with the invocation processing it (the Lambda timeout); must stay below the queue visibility timeout
+    INGEST_CLAIM_SECONDS = int(os.environ.get('INGEST_CLAIM_SECONDS', '900'))
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '4'))
+    INGEST_BULK_MAX_DOCS = int(os.environ.get('INGEST_BULK_MAX_DOCS', '50'))
+    INGEST_BULK_MAX_WAIT_SECONDS = float(os.environ.get('INGEST_BULK_MAX_WAIT_SECONDS', '2'))
+    # Direct uploads with presigned URLs (/images/upload-urls) and S3 event ingestion
+    DIRECT_UPLOAD_PREFIX = 'uploads/'
+    PRESIGNED_URL_EXPIRES_SECONDS = int(os.environ.get('PRESIGNED_URL_EXPIRES_SECONDS', '900'))
+    PRESIGNED_URL_MAX_COUNT = 100
+    S3_EVENT_WORKERS = int(os.environ.get('S3_EVENT_WORKERS', '8'))
+    # Objects are stored under content-hash keys, so they never change once written
+    IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+    # Bedrock batch inference input files and job limits (/images/batch-descn-enrich); smaller leftovers go through on-demand inference
+    BATCH_MIN_RECORDS = 100
+    BATCH_MAX_RECORDS = int(os.environ.get('BATCH_MAX_RECORDS', '50000'))
+    BATCH_MAX_INPUT_BYTES = int(os.environ.get('BATCH_MAX_INPUT_BYTES', str(1024 * 1024 * 1024)))
+    ONLINE_ENRICH_WORKERS = int(os.environ.get('ONLINE_ENRICH_WORKERS', '8'))
+    BATCH_FETCH_WORKERS = int(os.environ.get('BATCH_FETCH_WORKERS', '16'))
+    BATCH_MULTIPART_PART_SIZE = int(os.environ.get('BATCH_MULTIPART_PART_SIZE', str(8 * 1024 * 1024)))
+    BATCH_IMAGE_MAX_EDGE = int(os.environ.get('BATCH_IMAGE_MAX_EDGE', '1024'))
+    BATCH_IMAGE_QUALITY = int(os.environ.get('BATCH_IMAGE_QUALITY', '85'))
+    # Pipeline manifests and enrichment checkpoints are kept in S3 ('s3') or on local disk ('local')
+    MANIFEST_STORE = os.environ.get('MANIFEST_STORE', 's3')
+    # Key enumeration for batch enrichment: concurrent prefix range listings / inventory data file reads
+    LIST_WORKERS = int(os.environ.get('LIST_WORKERS', '16'))
+    INVENTORY_READ_WORKERS = int(os.environ.get('INVENTORY_READ_WORKERS', '8'))
+    # Checkpointed /images/batch-descn-enrich: stop creating batches after this many seconds (Lambda timeout is 900)
+    ENRICH_TIME_BUDGET_SECONDS = float(os.environ.get('ENRICH_TIME_BUDGET_SECONDS', '720'))
+    ENRICH_CHECKPOINT_PREFIX = 'ENRICH-CHECKPOINTS/'
+    # Keys listed and measured per chunk while an enrichment is planned; the listing position is saved after each
+    ENRICH_PLAN_CHUNK_RECORDS = int(os.environ.get('ENRICH_PLAN_CHUNK_RECORDS', '100000'))
+    # Online/batch routing of enrichment: online throughput estimate (capped by the on-demand quota) vs. batch job latency
+    ENRICH_DEFAULT_MODE = os.environ.get('ENRICH_DEFAULT_MODE', 'auto')
+    ONLINE_IMAGES_PER_WORKER_MINUTE = float(os.environ.get('ONLINE_IMAGES_PER_WORKER_MINUTE', '6'))
+    ONLINE_MAX_IMAGES_PER_MINUTE = float(os.environ.get('ONLINE_MAX_IMAGES_PER_MINUTE', '100'))
+    BATCH_JOB_EXPECTED_MINUTES = float(os.environ.get('BATCH_JOB_EXPECTED_MINUTES', '360'))
+    ONLINE_AUTO_MAX_RECORDS = int(os.environ.get('ONLINE_AUTO_MAX_RECORDS', '200'))
+    ONLINE_SHARD_RECORDS = int(os.environ.get('ONLINE_SHARD_RECORDS', '100'))
+    ENRICH_CHECKPOINT_DIR = os.environ.get('ENRICH_CHECKPOINT_DIR', '/tmp/enrich-checkpoints')
+    # Pipeline orchestrator (/pipelines)
+    PIPELINE_MANIFEST_PREFIX = 'PIPELINE-MANIFESTS/'
+    PIPELINE_MANIFEST_DIR = os.environ.get('PIPELINE_MANIFEST_DIR', '/tmp/pipelines')
+    PIPELINE_MAX_CONCURRENT_JOBS = int(os.environ.get('PIPELINE_MAX_CONCURRENT_JOBS', '10'))
+    PIPELINE_POLL_MIN_SECONDS = float(os.environ.get('PIPELINE_POLL_MIN_SECONDS', '30'))
+    PIPELINE_POLL_MAX_SECONDS = float(os.environ.get('PIPELINE_POLL_MAX_SECONDS', '300'))
+    # Keys listed per chunk while a pipeline runs, and the time POST /pipelines and /advance may spend stepping
+    PIPELINE_LIST_CHUNK_RECORDS = int(os.environ.get('PIPELINE_LIST_CHUNK_RECORDS', '100000'))
+    PIPELINE_REQUEST_BUDGET_SECONDS = float(os.environ.get('PIPELINE_REQUEST_BUDGET_SECONDS', '20'))
+    # Lease a step holds on a pipeline, renewed on every save; kept below the 5 minute scheduled tick
+    PIPELINE_LEASE_SECONDS = float(os.environ.get('PIPELINE_LEASE_SECONDS', '120'))
+    # Reading Bedrock batch outputs: ranged GETs for large .jsonl.out files, jobs processed concurrently
+    BATCH_OUTPUT_RANGE_SIZE = int(os.environ.get('BATCH_OUTPUT_RANGE_SIZE', str(16 * 1024 * 1024)))
+    BATCH_OUTPUT_RANGE_WINDOW = int(os.environ.get('BATCH_OUTPUT_RANGE_WINDOW', '4'))
+    BATCH_OUTPUT_JOB_WORKERS = int(os.environ.get('BATCH_OUTPUT_JOB_WORKERS', '4'))
+    BATCH_INDEX_CHUNK_DOCS = int(os.environ.get('BATCH_INDEX_CHUNK_DOCS', '500'))
+    # OpenSearch _bulk engine: chunks bounded by docs and bytes, sent concurrently, throttled (429) items retried
+    BULK_MAX_DOCS = int(os.environ.get('BULK_MAX_DOCS', '500'))
+    BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(10 * 1024 * 1024)))
+    BULK_WORKERS = int(os.environ.get('BULK_WORKERS', '4'))
+    BULK_MAX_RETRIES = int(os.environ.get('BULK_MAX_RETRIES', '5'))
+    # Index settings restored after a batch upload with bulk_load_settings
+    INDEX_REFRESH_INTERVAL = os.environ.get('INDEX_REFRESH_INTERVAL', '1s')
+    INDEX_NUMBER_OF_REPLICAS = int(os.environ.get('INDEX_NUMBER_OF_REPLICAS', '1'))
+    # Pre-model image quality gate: 'reject' skips bad images, 'flag' indexes them with quality_flags, 'off' disables it
+    QUALITY_GATE_MODE = os.environ.get('QUALITY_GATE_MODE', 'reject')
+    QUALITY_ALLOWED_MIME_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'image/gif']
+    QUALITY_MIN_EDGE = int(os.environ.get('QUALITY_MIN_EDGE', '64'))
+    QUALITY_MIN_STDDEV = float(os.environ.get('QUALITY_MIN_STDDEV', '4'))
+    QUALITY_MIN_ENTROPY = float(os.environ.get('QUALITY_MIN_ENTROPY', '1.5'))
+    # Thumbnail/embedding/display renditions written at ingest time
+    RENDITION_WORKERS = int(os.environ.get('RENDITION_WORKERS', '8'))
     IMG_DESCN_PROMPT = """
         You will be analyzing an image and extracting its key features, including tags, and providing a brief summary of the image content.
 
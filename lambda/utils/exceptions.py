@@ -43,3 +43,12 @@ class OpenSearchError(ImageProcessingError):
             message=message,
             details=details
         )
+
+class ImageQualityError(ImageProcessingError):
+    def __init__(self, issues: list, details: dict = None):
+        super().__init__(
+            status_code=400,
+            error_code="IMAGE_QUALITY_REJECTED",
+            message=f"Image rejected by quality gate: {', '.join(issues)}",
+            details={"issues": issues, **(details or {})}
+        )
@@ -5,3 +5,9 @@ def get_image_mime_type(image_path):
     mime = magic.Magic(mime=True)
     mime_type = mime.from_file(image_path) # 'application/pdf'
     return mime_type
+
+
+def get_image_mime_type_from_bytes(image_data):
+    # libmagic only needs the leading bytes to identify image formats
+    mime = magic.Magic(mime=True)
+    return mime.from_buffer(image_data[:2048])
@@ -0,0 +1,81 @@
+import threading
+from io import BytesIO
+from typing import Dict, List
+from PIL import Image, ImageStat
+from utils.config import Config
+
+class ImageQualityGate:
+    """
+    Cheap local checks run before any Bedrock call. Pixels are inspected on a
+    small grayscale copy (JPEGs are decoded at reduced scale with ``draft``),
+    so a check costs a few milliseconds even for large photos.
+
+    ``check`` returns the list of failed checks; an empty list means the image
+    passed. Counters are kept per process and exposed through ``stats``.
+    """
+    SAMPLE_SIZE = (64, 64)
+    # Formats Pillow reports under their own MIME type although the file is a
+    # plain one: multi-picture JPEGs (most phone cameras) open as MPO
+    MIME_ALIASES = {"MPO": "image/jpeg"}
+
+    def __init__(self, allowed_mime_types: List[str], min_edge: int, min_stddev: float, min_entropy: float):
+        self.allowed_mime_types = set(allowed_mime_types)
+        self.min_edge = min_edge
+        self.min_stddev = min_stddev
+        self.min_entropy = min_entropy
+        self._counters = {"checked": 0, "passed": 0, "failed": 0}
+        self._reasons: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _inspect(self, image_data: bytes) -> List[str]:
+        if not image_data:
+            return ["empty"]
+        try:
+            image = Image.open(BytesIO(image_data))
+        except Exception:
+            return ["undecodable"]
+
+        mime_type = self.MIME_ALIASES.get(image.format) or Image.MIME.get(image.format)
+        if mime_type not in self.allowed_mime_types:
+            return [f"mime_type:{mime_type or image.format}"]
+
+        issues = []
+        width, height = image.size
+        if min(width, height) < self.min_edge:
+            issues.append("too_small")
+
+        try:
+            # Decode at reduced scale; a truncated or corrupt file fails here
+            image.draft("L", (self.SAMPLE_SIZE[0] * 2, self.SAMPLE_SIZE[1] * 2))
+            sample = image.convert("L").resize(self.SAMPLE_SIZE)
+        except Exception:
+            return issues + ["undecodable"]
+
+        if ImageStat.Stat(sample).stddev[0] < self.min_stddev:
+            issues.append("low_variance")
+        if sample.entropy() < self.min_entropy:
+            issues.append("low_entropy")
+        return issues
+
+    def check(self, image_data: bytes) -> List[str]:
+        issues = self._inspect(image_data)
+        with self._lock:
+            self._counters["checked"] += 1
+            self._counters["failed" if issues else "passed"] += 1
+            for issue in issues:
+                reason = issue.split(":")[0]
+                self._reasons[reason] = self._reasons.get(reason, 0) + 1
+        return issues
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._counters, "reasons": dict(self._reasons)}
+
+def create_quality_gate() -> ImageQualityGate:
+    """Quality gate with the configured limits; shared by every ingestion entry point."""
+    return ImageQualityGate(
+        Config.QUALITY_ALLOWED_MIME_TYPES,
+        min_edge=Config.QUALITY_MIN_EDGE,
+        min_stddev=Config.QUALITY_MIN_STDDEV,
+        min_entropy=Config.QUALITY_MIN_ENTROPY
+    )
@@ -0,0 +1,72 @@
+from io import BytesIO
+from typing import Dict, Tuple
+from PIL import Image, ImageOps
+
+# name -> max edge in pixels, PIL format, save options
+RENDITIONS = {
+    "thumb": {"max_edge": 300, "format": "JPEG", "options": {"quality": 80, "optimize": True}},
+    "embed": {"max_edge": 320, "format": "JPEG", "options": {"quality": 90}},
+    "display": {"max_edge": 1024, "format": "WEBP", "options": {"quality": 80, "method": 4}},
+}
+
+RENDITION_PREFIX = "renditions/"
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+ORIGINAL_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+
+def content_addressed_key(content_hash: str, content_type: str) -> str:
+    """Immutable key of an original image, derived from its SHA-256."""
+    extension = ORIGINAL_EXTENSIONS.get(content_type)
+    return f"images/{content_hash}.{extension}" if extension else f"images/{content_hash}"
+
+def rendition_key(content_hash: str, name: str) -> str:
+    """Predictable, immutable key of a rendition of the image with this SHA-256."""
+    spec = RENDITIONS[name]
+    return f"{RENDITION_PREFIX}{content_hash}/{name}.{EXTENSIONS[spec['format']]}"
+
+def _to_rgb(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+def generate_renditions(image_data: bytes) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Decode the image once and return ``{name: (bytes, content_type)}`` for
+    every entry in ``RENDITIONS``. Images are only ever shrunk, never upscaled.
+    """
+    with Image.open(BytesIO(image_data)) as source:
+        # Honour EXIF orientation so phone photos are not rotated
+        image = _to_rgb(ImageOps.exif_transpose(source))
+
+    renditions = {}
+    # Largest first, so each smaller rendition is resampled from fewer pixels
+    for name, spec in sorted(RENDITIONS.items(), key=lambda item: -item[1]["max_edge"]):
+        image.thumbnail((spec["max_edge"], spec["max_edge"]), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format=spec["format"], **spec["options"])
+        renditions[name] = (buffer.getvalue(), CONTENT_TYPES[spec["format"]])
+    return renditions
+
+def downscale_image(image_data: bytes, max_edge: int, quality: int) -> Tuple[bytes, str]:
+    """
+    Shrink an image so its longest edge is at most ``max_edge`` and re-encode
+    it as JPEG. Returns ``(bytes, content_type)``, or ``(image_data, None)``
+    when the image is already small enough and is passed through untouched.
+    """
+    with Image.open(BytesIO(image_data)) as source:
+        if max(source.size) <= max_edge:
+            return image_data, None
+        # JPEG can be decoded directly at a reduced scale
+        source.draft("RGB", (max_edge, max_edge))
+        image = _to_rgb(ImageOps.exif_transpose(source))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue(), "image/jpeg"
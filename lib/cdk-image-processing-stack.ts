@@ -9,6 +9,12 @@ import * as opensearch from 'aws-cdk-lib/aws-opensearchservice';
 import * as ec2 from 'aws-cdk-lib/aws-ec2';
 import * as cloudfront from 'aws-cdk-lib/aws-cloudfront';
 import * as origins from 'aws-cdk-lib/aws-cloudfront-origins';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
+import * as s3n from 'aws-cdk-lib/aws-s3-notifications';
+import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
+import * as events from 'aws-cdk-lib/aws-events';
+import * as targets from 'aws-cdk-lib/aws-events-targets';
 
 export class CdkImageProcessingStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props?: cdk.StackProps) {
@@ -20,6 +26,14 @@ export class CdkImageProcessingStack extends cdk.Stack {
       versioned: true,
       encryption: s3.BucketEncryption.S3_MANAGED,
       blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      cors: [
+        {
+          // Browsers PUT directly to presigned URLs from /images/upload-urls
+          allowedMethods: [s3.HttpMethods.PUT],
+          allowedOrigins: ['*'],
+          allowedHeaders: ['*'],
+        },
+      ],
     });
 
     // Create new IAM role for Bedrock
@@ -216,6 +230,24 @@ export class CdkImageProcessingStack extends cdk.Stack {
     // 获取 OpenSearch 的 endpoint
     const openSearchEndpoint = openSearchDomain.domainEndpoint;
 
+    // Async uploads (/images/async): item state per job, removed by TTL once finished
+    const ingestJobTable = new dynamodb.Table(this, 'IngestJobTable', {
+      partitionKey: { name: 'job_id', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'item_id', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expires_at',
+    });
+    const ingestDlq = new sqs.Queue(this, 'IngestDlq', {
+      retentionPeriod: cdk.Duration.days(14),
+    });
+    const ingestQueue = new sqs.Queue(this, 'IngestQueue', {
+      visibilityTimeout: cdk.Duration.seconds(900 * 6),
+      deadLetterQueue: {
+        queue: ingestDlq,
+        maxReceiveCount: 3,
+      },
+    });
+
     // Create Lambda function using Docker with ARM64 architecture
     const imageProcessingFunction = new lambda.DockerImageFunction(this, 'ImageProcessingFunctionContainer', {
       code: lambda.DockerImageCode.fromImageAsset('lambda'),
@@ -226,11 +258,51 @@ export class CdkImageProcessingStack extends cdk.Stack {
         BUCKET_NAME: imageBucket.bucketName,
         OPENSEARCH_ENDPOINT: openSearchEndpoint,
         DDSTRIBUTION_DOMAIN: cloudFrontDistribution.domainName,
-        BEDROCK_ROLE_ARN: bedrockRole.roleArn  // Add the Bedrock role ARN to the environment variables
+        BEDROCK_ROLE_ARN: bedrockRole.roleArn,  // Add the Bedrock role ARN to the environment variables
+        INGEST_QUEUE_URL: ingestQueue.queueUrl,
+        INGEST_JOB_TABLE: ingestJobTable.tableName
       },
       timeout: cdk.Duration.seconds(900),
     });
 
+    // Direct uploads: S3 ObjectCreated under uploads/ -> SQS -> Lambda (batched)
+    const uploadEventsDlq = new sqs.Queue(this, 'UploadEventsDlq', {
+      retentionPeriod: cdk.Duration.days(14),
+    });
+    const uploadEventsQueue = new sqs.Queue(this, 'UploadEventsQueue', {
+      visibilityTimeout: cdk.Duration.seconds(900 * 6),
+      deadLetterQueue: {
+        queue: uploadEventsDlq,
+        maxReceiveCount: 3,
+      },
+    });
+    imageBucket.addEventNotification(
+      s3.EventType.OBJECT_CREATED,
+      new s3n.SqsDestination(uploadEventsQueue),
+      { prefix: 'uploads/' }
+    );
+    // Delivered by the Lambda Web Adapter to POST /events
+    imageProcessingFunction.addEventSource(new lambdaEventSources.SqsEventSource(uploadEventsQueue, {
+      batchSize: 50,
+      maxBatchingWindow: cdk.Duration.seconds(10),
+      reportBatchItemFailures: true,
+    }));
+
+    // Async uploads: queued items are processed in the invocation SQS makes (delivered to POST /events)
+    imageProcessingFunction.addEventSource(new lambdaEventSources.SqsEventSource(ingestQueue, {
+      batchSize: 10,
+      maxBatchingWindow: cdk.Duration.seconds(2),
+      reportBatchItemFailures: true,
+    }));
+    ingestQueue.grantSendMessages(imageProcessingFunction);
+    ingestJobTable.grantReadWriteData(imageProcessingFunction);
+
+    // Batch pipelines: a scheduled tick advances running pipelines (delivered to POST /events)
+    new events.Rule(this, 'BatchPipelineTick', {
+      schedule: events.Schedule.rate(cdk.Duration.minutes(5)),
+      targets: [new targets.LambdaFunction(imageProcessingFunction)],
+    });
+
     // Get caller identity ARN from context
     const callerArn = this.node.tryGetContext('callerArn') || cdk.Fn.importValue('CallerArn');
     
@@ -263,6 +335,30 @@ export class CdkImageProcessingStack extends cdk.Stack {
       authorizationType: apigateway.AuthorizationType.NONE
     });  // Update
 
+    const asyncUploadResource = imagesResource.addResource('async');
+
+    asyncUploadResource.addMethod('POST', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Async upload
+
+    const ingestionJobResource = imagesResource.addResource('jobs').addResource('{job_id}');
+
+    ingestionJobResource.addMethod('GET', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Async upload job status
+
+    const uploadUrlsResource = imagesResource.addResource('upload-urls');
+
+    uploadUrlsResource.addMethod('POST', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Presigned direct upload URLs
+
+    const qualityStatsResource = imagesResource.addResource('quality-stats');
+
+    qualityStatsResource.addMethod('GET', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Quality gate counters
+
     const deleteResource = imagesResource.addResource('{image_id}');
 
     deleteResource.addMethod('DELETE', new apigateway.LambdaIntegration(imageProcessingFunction), {
@@ -293,6 +389,19 @@ export class CdkImageProcessingStack extends cdk.Stack {
       authorizationType: apigateway.AuthorizationType.NONE
     }); // Batch Embedding Generation
 
+    // Batch pipelines: describe -> embed -> index driven by the orchestrator
+    const pipelinesResource = api.root.addResource('pipelines');
+    pipelinesResource.addMethod('POST', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Create pipeline
+    const pipelineResource = pipelinesResource.addResource('{pipeline_id}');
+    pipelineResource.addMethod('GET', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Pipeline status
+    pipelineResource.addResource('advance').addMethod('POST', new apigateway.LambdaIntegration(imageProcessingFunction), {
+      authorizationType: apigateway.AuthorizationType.NONE
+    }); // Advance pipeline
+
     // Create API resources and methods for checking batch job state with AuthorizationType.NONE
     const checkJobStateResource = api.root.addResource('check-batch-job-state');
 